@@ -1,22 +1,35 @@
 # backend/app/api/v1/endpoints/files.py
-from fastapi import APIRouter, UploadFile, HTTPException, Depends, BackgroundTasks, File
+from fastapi import APIRouter, UploadFile, HTTPException, Depends, BackgroundTasks, File, Header, Response, Request
+from starlette.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Optional
 import os
+import io
+import numpy as np
 
 # Use aliased FileNotFoundError
-from app.utils.exceptions import FileProcessingError, InvalidFileTypeError, FileTooLargeError, ModelError
+from app.utils.exceptions import FileProcessingError, InvalidFileTypeError, FileTooLargeError, ModelError, ImageTooLargeError
 from app.utils.exceptions import FileNotFoundError as CustomFileNotFoundError
 from app.utils.file_utils import save_upload_file_to_dir # Renamed for clarity
 from app.schemas.file import (
     FileDetailResponse,
     FileUploadResponse,
-    FileProcessingResultResponse
+    FileProcessingResultResponse,
+    TriageRequest,
+    TriageFrameResponse,
+    TriageResponse
 )
 from app.services.file_service import FileService
+from app.services.model_registry import get_model_registry
+from app.services.admission_control import get_admission_controller, estimate_job_bytes
+from app.services.sequence_service import is_valid_sequence_id
+from app.services.storage_lifecycle import get_storage_lifecycle
+from app.services.inference_workers import get_inference_workers
 from app.database.session import get_db
 from app.config.settings import get_settings
 from app.utils.logger import setup_logger
+from app.utils.http_cache import build_etag, etag_matches, RESULT_CACHE_CONTROL
+from app.models.ml.triage import TILE_STATS
 
 router = APIRouter()
 settings = get_settings()
@@ -24,14 +37,48 @@ logger = setup_logger("files_api")
 
 # --- Dependency Injection for FileService ---
 # This makes testing easier and manages service lifecycle if needed
+_file_service: Optional[FileService] = None
+
 def get_file_service():
-    # In a real app, you might manage service instances differently
-    return FileService()
+    # One FileService per process; models live in the shared registry and are loaded at startup,
+    # so requests (even GET /list) never pay for building services or loading checkpoints
+    global _file_service
+    if _file_service is None:
+        _file_service = FileService()
+    return _file_service
+
+def _client_id(request: Request, x_client_id: Optional[str]) -> str:
+    """Identity used for per-client concurrency caps: explicit X-Client-Id, else the peer address."""
+    if x_client_id:
+        return x_client_id
+    return request.client.host if request.client else "unknown"
+
+def _check_sequence_id(sequence_id: Optional[str]):
+    if sequence_id is not None and not is_valid_sequence_id(sequence_id):
+        raise HTTPException(status_code=400, detail="sequence_id must be 1-64 letters, digits, '-' or '_'.")
+
+def _admit_job(request: Request, x_client_id: Optional[str], est_bytes: int,
+               priority: Optional[str], deadline_s: Optional[float]):
+    """Reserves a slot in the requested priority lane (400 for unknown lanes, 429 if overloaded)."""
+    if deadline_s is not None and deadline_s <= 0:
+        raise HTTPException(status_code=400, detail="deadline_s must be positive.")
+    try:
+        return get_admission_controller().admit(
+            _client_id(request, x_client_id), est_bytes, priority=priority, deadline_s=deadline_s
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
 @router.post("/upload", response_model=FileUploadResponse, status_code=202) # 202 Accepted
 async def upload_file_for_processing(
+    request: Request,
     background_tasks: BackgroundTasks,
     file: UploadFile = File(...),
+    model_version: Optional[str] = None,
+    sequence_id: Optional[str] = None,
+    priority: Optional[str] = None,
+    deadline_s: Optional[float] = None,
+    x_client_id: Optional[str] = Header(None),
     db: Session = Depends(get_db),
     file_service: FileService = Depends(get_file_service)
 ):
@@ -41,13 +88,19 @@ async def upload_file_for_processing(
     """
     logger.info(f"Received file upload request: {file.filename}, Content-Type: {file.content_type}")
 
-    # Basic validation before saving (can add more checks)
+    # Validate content (magic bytes + header dimensions) and the requested model before saving
     try:
-        file_service._validate_file(file) # Validate type before saving
-    except InvalidFileTypeError as e:
-         logger.warning(f"Upload rejected for {file.filename}: Invalid file type {file.content_type}")
+        _check_sequence_id(sequence_id)
+        spec = get_model_registry().resolve(model_version) # Raises ModelNotFoundError (404) for unknown versions
+        detected_type = file_service._validate_file(file)
+    except (InvalidFileTypeError, ImageTooLargeError) as e:
+         logger.warning(f"Upload rejected for {file.filename}: {e.detail}")
          raise e # Re-raise the specific HTTP exception
 
+    # Admission control: reserve processing capacity before spending disk/DB work (429 if overloaded)
+    admission = get_admission_controller()
+    ticket = _admit_job(request, x_client_id, estimate_job_bytes(spec.input_size), priority, deadline_s)
+
     try:
         # Save the uploaded file
         saved_filename, saved_filepath = save_upload_file_to_dir(
@@ -61,12 +114,13 @@ async def upload_file_for_processing(
             db=db,
             filename=saved_filename,
             file_path=saved_filepath,
-            file_type=file.content_type or "application/octet-stream" # Use provided type or default
+            file_type=detected_type # Sniffed type, not the client's claim
         )
 
         # --- Schedule ML processing in the background ---
-        logger.info(f"Scheduling background processing for file ID: {db_file.id}")
-        background_tasks.add_task(file_service.process_file, db, db_file.id)
+        logger.info(f"Scheduling background processing for file ID: {db_file.id} (lane: {ticket.lane})")
+        background_tasks.add_task(admission.run, ticket, file_service.process_file, db, db_file.id, model_version, sequence_id)
+        ticket = None # Ownership passed to the background job
 
         return FileUploadResponse(
             message="File uploaded successfully and scheduled for processing.",
@@ -92,6 +146,10 @@ async def upload_file_for_processing(
             except OSError as rm_err:
                 logger.error(f"Failed to cleanup file {saved_filepath} after upload error: {rm_err}")
         raise HTTPException(status_code=500, detail=f"An unexpected error occurred: {str(e)}")
+    finally:
+        if ticket is not None:
+            # Job was never scheduled; give the reservation back
+            admission.release(ticket)
 
 
 @router.get("/list", response_model=List[FileDetailResponse])
@@ -117,6 +175,7 @@ async def list_uploaded_files(
                  created_at=f.created_at,
                  updated_at=f.updated_at,
                  # original_file_url=original_url
+                 thumbnail_url=file_service.tile_service.thumbnail_url(f.id, f.filename) if f.status == "completed" else None,
              ))
         return response_files
     except FileProcessingError as e:
@@ -126,32 +185,196 @@ async def list_uploaded_files(
         raise HTTPException(status_code=500, detail="Failed to list files.")
 
 
+@router.get("/queue")
+async def get_processing_queue_stats():
+    """Current admission-control state: queued/in-flight jobs, reserved memory, limits and per-lane latency."""
+    workers = get_inference_workers()
+    return {**get_admission_controller().snapshot(), "inference_workers": workers.snapshot() if workers else None}
+
+
+@router.get("/storage")
+async def get_storage_stats():
+    """Storage lifecycle state: artifact usage vs quota, compaction/eviction/orphan totals and the last cycle."""
+    return get_storage_lifecycle().snapshot()
+
+
+@router.get("/sequences/{sequence_id}")
+async def get_sequence(sequence_id: str, file_service: FileService = Depends(get_file_service)):
+    """Frame log of an image sequence (keyframe/delta type, coded bytes, MC cells resampled) with totals."""
+    _check_sequence_id(sequence_id)
+    summary = file_service.ml_service.sequences.summarize(sequence_id)
+    if summary is None:
+        raise HTTPException(status_code=404, detail=f"Sequence '{sequence_id}' not found.")
+    return summary
+
+
+@router.delete("/sequences/{sequence_id}", status_code=200)
+async def delete_sequence(sequence_id: str, file_service: FileService = Depends(get_file_service)):
+    """Drops a sequence's coding state; the next frame uploaded with this ID starts with a keyframe."""
+    _check_sequence_id(sequence_id)
+    sequences = file_service.ml_service.sequences
+
+    def _delete():
+        with sequences.lock(sequence_id): # Waits for a frame being coded right now
+            sequences.delete(sequence_id)
+
+    await run_in_threadpool(_delete)
+    return {"message": f"Sequence '{sequence_id}' deleted."}
+
+
+def _compact(values) -> List[float]:
+    # Three significant digits are plenty for ranking and keep the JSON small
+    return [float(f"{v:.3g}") for v in values]
+
+
+@router.post("/triage", response_model=TriageResponse)
+async def triage_files(
+    body: TriageRequest,
+    request: Request,
+    priority: Optional[str] = None,
+    deadline_s: Optional[float] = None,
+    x_client_id: Optional[str] = Header(None),
+    db: Session = Depends(get_db),
+    file_service: FileService = Depends(get_file_service)
+):
+    """
+    Ranks many files by reconstruction uncertainty using a low-sample MC pass at reduced resolution.
+    Returns per-tile mean/max/percentile grids and a frame score (JSON, or arrays with format=npz);
+    no result images are rendered or stored, and file records are not modified.
+    """
+    if body.format not in ("json", "npz"):
+        raise HTTPException(status_code=400, detail="format must be 'json' or 'npz'.")
+    if not body.file_ids:
+        raise HTTPException(status_code=400, detail="file_ids must not be empty.")
+    if len(body.file_ids) > settings.TRIAGE_MAX_FILES:
+        raise HTTPException(status_code=400, detail=f"At most {settings.TRIAGE_MAX_FILES} file IDs per triage request.")
+    if body.samples is not None and not 1 <= body.samples <= settings.NUM_MC_SAMPLES:
+        raise HTTPException(status_code=400, detail=f"samples must be between 1 and {settings.NUM_MC_SAMPLES}.")
+
+    spec = get_model_registry().resolve(body.model_version) # 404 for unknown versions
+    file_ids = list(dict.fromkeys(body.file_ids)) # De-duplicate, keep order
+    paths = file_service.get_file_paths(db, file_ids)
+    missing = [file_id for file_id in file_ids if file_id not in paths]
+
+    # One admission ticket for the whole call, sized for one batch in flight
+    admission = get_admission_controller()
+    ticket = _admit_job(request, x_client_id, estimate_job_bytes(settings.TRIAGE_INPUT_SIZE) * settings.TRIAGE_BATCH_SIZE,
+                        priority, deadline_s)
+    try:
+        results, errors = await admission.run(
+            ticket, file_service.ml_service.triage,
+            [(file_id, paths[file_id]) for file_id in file_ids if file_id in paths],
+            spec.version, body.samples,
+        )
+    except (ModelError, FileProcessingError) as e:
+        raise e
+    except Exception as e:
+        logger.error(f"Error during triage of {len(file_ids)} files: {str(e)}", exc_info=True)
+        raise HTTPException(status_code=500, detail=f"Triage failed: {str(e)}")
+    finally:
+        admission.release(ticket) # No-op unless run() never got to start
+
+    results.sort(key=lambda r: r["score"], reverse=True)
+    samples = body.samples or settings.TRIAGE_MC_SAMPLES
+    logger.info(f"Triage of {len(file_ids)} files: {len(results)} scored, {len(missing)} missing, {len(errors)} failed")
+
+    if body.format == "npz":
+        # Arrays in ranked order: file_ids (N,), scores (N,), means (N,), tiles (N, 3, rows, cols) in tile_stats order
+        buffer = io.BytesIO()
+        np.savez(
+            buffer,
+            file_ids=np.array([r["file_id"] for r in results], dtype=np.int64),
+            scores=np.array([r["score"] for r in results], dtype=np.float32),
+            means=np.array([r["mean"] for r in results], dtype=np.float32),
+            tiles=np.stack([r["tile_stats"] for r in results]).astype(np.float16) if results else np.zeros((0, len(TILE_STATS), 0, 0), dtype=np.float16),
+            tile_stats=np.array(TILE_STATS),
+            missing_ids=np.array(missing, dtype=np.int64),
+            failed_ids=np.array(list(errors), dtype=np.int64),
+        )
+        return Response(content=buffer.getvalue(), media_type="application/octet-stream",
+                        headers={"Content-Disposition": 'attachment; filename="triage.npz"'})
+
+    frames = []
+    for r in results:
+        stats = r["tile_stats"]
+        frames.append(TriageFrameResponse(
+            file_id=r["file_id"],
+            score=float(f"{r['score']:.4g}"),
+            mean=float(f"{r['mean']:.4g}"),
+            rows=stats.shape[1],
+            cols=stats.shape[2],
+            tile_mean=_compact(stats[0].ravel()),
+            tile_max=_compact(stats[1].ravel()),
+            tile_percentile=_compact(stats[2].ravel()),
+        ))
+    return TriageResponse(
+        model_version=spec.version,
+        samples=samples,
+        input_size=settings.TRIAGE_INPUT_SIZE,
+        tile_size=settings.TRIAGE_TILE_SIZE,
+        percentile=settings.TRIAGE_PERCENTILE,
+        frames=frames,
+        missing=missing,
+        errors=errors,
+    )
+
+
+def _build_status_response(file) -> FileProcessingResultResponse:
+    """Maps a FileUpload record to the status/result response schema."""
+    response_data = {
+        "id": file.id,
+        "filename": file.filename,
+        "status": file.status,
+        "mean_reconstruction_b64": None,
+        "uncertainty_map_b64": None,
+        "error": None,
+        "tiles": None,
+    }
+
+    if file.status == "completed" and file.processing_result:
+        response_data["mean_reconstruction_b64"] = file.processing_result.get("mean_reconstruction_b64")
+        response_data["uncertainty_map_b64"] = file.processing_result.get("uncertainty_map_b64")
+        response_data["tiles"] = file.processing_result.get("tiles")
+    elif file.status == "failed" and file.processing_result:
+        response_data["error"] = file.processing_result.get("error")
+
+    return FileProcessingResultResponse(**response_data)
+
+
 @router.get("/status/{file_id}", response_model=FileProcessingResultResponse)
 async def get_file_processing_status(
     file_id: int,
+    response: Response,
+    if_none_match: Optional[str] = Header(None),
     db: Session = Depends(get_db),
     file_service: FileService = Depends(get_file_service)
 ):
-    """Get the processing status and results (if completed) for a file."""
+    """
+    Get the processing status and results (if completed) for a file.
+    Completed results carry a strong ETag; a matching If-None-Match returns 304
+    without loading the result payload from the database.
+    """
     try:
-        file = file_service.get_file(db, file_id)
+        # Cheap version lookup first (no processing_result payload)
+        status, updated_at, result_hash = file_service.get_file_version(db, file_id)
+
+        etag = None
+        if status == "completed":
+            etag = build_etag(file_id, status, updated_at, result_hash)
+            if etag_matches(if_none_match, etag):
+                logger.debug(f"Status for file ID {file_id} not modified (ETag {etag}).")
+                return Response(status_code=304, headers={"ETag": etag, "Cache-Control": RESULT_CACHE_CONTROL})
 
-        response_data = {
-            "id": file.id,
-            "filename": file.filename,
-            "status": file.status,
-            "mean_reconstruction_b64": None,
-            "uncertainty_map_b64": None,
-            "error": None,
-        }
+        file = file_service.get_file(db, file_id)
 
-        if file.status == "completed" and file.processing_result:
-            response_data["mean_reconstruction_b64"] = file.processing_result.get("mean_reconstruction_b64")
-            response_data["uncertainty_map_b64"] = file.processing_result.get("uncertainty_map_b64")
-        elif file.status == "failed" and file.processing_result:
-            response_data["error"] = file.processing_result.get("error")
+        if etag and file.status == "completed":
+            response.headers["ETag"] = etag
+            response.headers["Cache-Control"] = RESULT_CACHE_CONTROL
+        else:
+            # In-flight states change underneath the client, never cache them
+            response.headers["Cache-Control"] = "no-store"
 
-        return FileProcessingResultResponse(**response_data)
+        return _build_status_response(file)
 
     except CustomFileNotFoundError as e:
         logger.warning(f"Status request for non-existent file ID: {file_id}")
@@ -164,7 +387,13 @@ async def get_file_processing_status(
 @router.post("/process/{file_id}", response_model=FileProcessingResultResponse, status_code=202)
 async def trigger_file_processing(
     file_id: int,
+    request: Request,
     background_tasks: BackgroundTasks,
+    model_version: Optional[str] = None,
+    sequence_id: Optional[str] = None,
+    priority: Optional[str] = None,
+    deadline_s: Optional[float] = None,
+    x_client_id: Optional[str] = Header(None),
     db: Session = Depends(get_db),
     file_service: FileService = Depends(get_file_service)
 ):
@@ -183,11 +412,16 @@ async def trigger_file_processing(
              logger.info(f"File ID {file_id} is already completed. Re-scheduling processing.")
              # raise HTTPException(status_code=409, detail="File has already been processed successfully.")
 
-        logger.info(f"Explicitly scheduling background processing for file ID: {file_id}")
-        background_tasks.add_task(file_service.process_file, db, file_id)
+        _check_sequence_id(sequence_id)
+        spec = get_model_registry().resolve(model_version) # Raises ModelNotFoundError (404) for unknown versions
+        admission = get_admission_controller()
+        ticket = _admit_job(request, x_client_id, estimate_job_bytes(spec.input_size), priority, deadline_s) # 429 if overloaded
+
+        logger.info(f"Explicitly scheduling background processing for file ID: {file_id} (model: {model_version or 'default'}, lane: {ticket.lane})")
+        background_tasks.add_task(admission.run, ticket, file_service.process_file, db, file_id, model_version, sequence_id)
 
         # Return current status (likely 'pending' or 'failed' before background task runs)
-        return await get_file_processing_status(file_id, db, file_service)
+        return _build_status_response(file)
 
     except CustomFileNotFoundError as e:
         logger.warning(f"Processing trigger request for non-existent file ID: {file_id}")
@@ -199,6 +433,55 @@ async def trigger_file_processing(
         raise HTTPException(status_code=500, detail=f"Failed to trigger file processing: {str(e)}")
 
 
+@router.post("/{file_id}/top-up", response_model=FileProcessingResultResponse, status_code=202)
+async def top_up_file_processing(
+    file_id: int,
+    request: Request,
+    background_tasks: BackgroundTasks,
+    samples: Optional[int] = None,
+    target_samples: Optional[int] = None,
+    priority: Optional[str] = None,
+    deadline_s: Optional[float] = None,
+    x_client_id: Optional[str] = Header(None),
+    db: Session = Depends(get_db),
+    file_service: FileService = Depends(get_file_service)
+):
+    """
+    Refines a completed result with more MC samples, merged into its stored statistics: either
+    `samples` extra passes, or enough to reach `target_samples` (default: NUM_MC_SAMPLES) per pixel.
+    The current result stays available until the refined one replaces it.
+    """
+    try:
+        file = file_service.get_file(db, file_id)
+        mc_state = (file.processing_result or {}).get("mc_state")
+        if file.status != "completed" or not mc_state:
+            raise HTTPException(status_code=409, detail="File has no stored MC statistics to top up; process it first.")
+
+        if samples is None:
+            samples = (target_samples or settings.NUM_MC_SAMPLES) - mc_state["min_samples"]
+            if samples <= 0:
+                logger.info(f"File ID {file_id} already has {mc_state['min_samples']} MC samples; nothing to top up.")
+                return _build_status_response(file)
+        if not 1 <= samples <= settings.MC_TOPUP_MAX_SAMPLES:
+            raise HTTPException(status_code=400, detail=f"samples must be between 1 and {settings.MC_TOPUP_MAX_SAMPLES}.")
+
+        spec = get_model_registry().resolve(mc_state["model_version"]) # 404 if the version was removed
+        admission = get_admission_controller()
+        ticket = _admit_job(request, x_client_id, estimate_job_bytes(spec.input_size), priority, deadline_s) # 429 if overloaded
+
+        logger.info(f"Scheduling MC top-up for file ID: {file_id} (+{samples} samples, lane: {ticket.lane})")
+        background_tasks.add_task(admission.run, ticket, file_service.top_up_file, db, file_id, samples)
+        return _build_status_response(file)
+
+    except CustomFileNotFoundError as e:
+        raise HTTPException(status_code=404, detail=e.detail)
+    except HTTPException as e:
+        raise e
+    except Exception as e:
+        logger.error(f"Error scheduling MC top-up for file ID {file_id}: {str(e)}", exc_info=True)
+        raise HTTPException(status_code=500, detail=f"Failed to schedule MC top-up: {str(e)}")
+
+
 @router.delete("/{file_id}", status_code=200)
 async def delete_uploaded_file_endpoint(
     file_id: int,
@@ -0,0 +1,48 @@
+# backend/app/api/v1/endpoints/models.py
+from fastapi import APIRouter, HTTPException
+from starlette.concurrency import run_in_threadpool
+
+from app.schemas.model import ModelRegistryResponse
+from app.services.model_registry import get_model_registry
+from app.utils.exceptions import ModelError, ModelNotFoundError
+from app.utils.logger import setup_logger
+
+router = APIRouter()
+logger = setup_logger("models_api")
+
+
+@router.get("/", response_model=ModelRegistryResponse)
+async def list_models():
+    """List registered model versions, which ones are resident, and the default."""
+    return get_model_registry().describe()
+
+
+@router.post("/reload", response_model=ModelRegistryResponse)
+async def reload_models():
+    """
+    Re-read the registry manifest (hot swap). Jobs already running keep the model
+    instance they started with; new jobs pick up the updated specs.
+    """
+    registry = get_model_registry()
+    try:
+        registry.reload()
+    except ModelError as e:
+        raise e
+    except Exception as e:
+        logger.error(f"Error reloading model registry: {str(e)}", exc_info=True)
+        raise HTTPException(status_code=500, detail=f"Failed to reload model registry: {str(e)}")
+    return registry.describe()
+
+
+@router.post("/{version}/activate", response_model=ModelRegistryResponse)
+async def activate_model(version: str, preload: bool = False):
+    """Make a registered version the default for new jobs, optionally loading it right away."""
+    registry = get_model_registry()
+    try:
+        if preload:
+            # Loading reads and hashes the checkpoint; keep it off the event loop
+            await run_in_threadpool(registry.get, version)
+        registry.set_default(version)
+    except (ModelNotFoundError, ModelError) as e:
+        raise e
+    return registry.describe()
@@ -1,3 +1,5 @@
+from typing import Optional
+
 class Settings:
     PROJECT_NAME: str = "NeuroPixel"
     VERSION: str = "1.0.0"
@@ -9,6 +11,106 @@ class Settings:
     
     # ML Model settings
     MODEL_PATH: str = "models/ml_model"  # Path to your ML model
+    MODEL_TYPE: str = "mc_dropout"  # "mc_dropout" (teacher, T passes) or "student" (distilled, 1 pass)
+    STUDENT_MODEL_PATH: str = "models/student_model"  # Weights from app.training.distill
+    MODEL_REGISTRY_PATH: str = "models/registry.json"  # Optional manifest of model versions (overrides the two above)
+    MODEL_CACHE_SIZE: int = 2  # Max models kept resident (LRU)
+    MODEL_WARMUP_PASSES: int = 3  # Forward passes run at startup before /ready reports ready
+    TORCH_NUM_THREADS: int = 0  # Intra-op threads per worker process (0 = torch default); set when running several workers
+
+    # Out-of-process inference (app.services.inference_workers): plain MC / student jobs run in worker
+    # processes, exchanging tensors through shared-memory slabs (size /dev/shm accordingly in containers)
+    INFERENCE_WORKERS: int = 0  # Worker processes per API process (0 = run inference in-process)
+    INFERENCE_SLABS: int = 0  # Shared-memory slabs (0 = 2 per worker, so the next input can be staged)
+    INFERENCE_SLAB_MB: int = 32  # Per slab: input + counts/mean/M2 (~10MB at 512px); larger inputs run in-process
+
+    # MC dropout sampling
+    NUM_MC_SAMPLES: int = 32  # Stochastic passes per processed image; also the default top-up target and the /triage samples cap
+
+    # Uncertainty-guided MC refinement: a cheap pilot pass finds high-variance tiles,
+    # then only crops around those tiles get the remaining NUM_MC_SAMPLES passes
+    MC_REFINEMENT_ENABLED: bool = False
+    MC_PILOT_SAMPLES: int = 8
+    MC_REFINE_TILE_SIZE: int = 64  # Multiple of the model's downsampling factor (64)
+    MC_REFINE_CONTEXT: int = 0  # Border around refined tiles (0 = model's receptive field, 128px here); smaller values are rejected
+    MC_REFINE_THRESHOLD: float = 1.5  # Refine tiles whose mean variance exceeds this x the image mean
+    MC_REFINE_MAX_FRACTION: float = 0.25  # Crop pixels per refinement pass, as a share of a full pass (full frame once crops would cost more)
+
+    # Dropout mask schedule for MC passes (app.models.ml.mc_sampling): "native" (plain nn.Dropout),
+    # "iid" (seeded mask bank), "antithetic", "stratified" or "quasi"; see `python -m app.evaluation.mc_convergence`
+    MC_SAMPLING_STRATEGY: str = "native"
+    MC_SAMPLING_SEED: Optional[int] = None  # Fixed seed makes MC results reproducible per input (None = fresh masks per job)
+
+    # Persisted MC sufficient statistics (per-pixel count, mean, M2) for incremental top-up
+    MC_STATE_DIR: str = "mc_state"  # One {file_id}.npz per processed file (MC models, non-sequence frames)
+    MC_TOPUP_MAX_SAMPLES: int = 256  # Upper bound on extra samples per top-up request
+
+    # Admission control for background processing (429 + Retry-After beyond these limits)
+    MAX_CONCURRENT_JOBS: int = 2  # Inference jobs running at once per process
+    MAX_QUEUED_JOBS: int = 32  # Queued + running jobs per process
+    MAX_JOBS_MEMORY_MB: int = 4096  # Sum of estimated memory of queued + running jobs
+    MAX_JOBS_PER_CLIENT: int = 8  # Queued + running jobs per client (X-Client-Id header or IP)
+    JOB_MEMORY_PER_PIXEL_BYTES: int = 256  # Activation memory per model-input pixel (DropoutAutoencoder, fp32)
+    JOB_MEMORY_OVERHEAD_MB: int = 32  # Decoded image, statistics and encoding buffers
+    JOB_SERVICE_TIME_ESTIMATE_S: float = 5.0  # Initial per-job time for Retry-After, refined from observed runs
+
+    # Priority lanes (?priority= on /upload and /process). weight: share of inference slots when lanes
+    # compete; deadline_s: default completion target (jobs close to it jump the weighted order, which also
+    # ages bulk work so it never starves); queue_share: fraction of MAX_QUEUED_JOBS the lane may fill.
+    PRIORITY_LANES: dict = {
+        "interactive": {"weight": 8, "deadline_s": 10.0, "queue_share": 1.0},
+        "standard": {"weight": 3, "deadline_s": 120.0, "queue_share": 0.75},
+        "bulk": {"weight": 1, "deadline_s": 3600.0, "queue_share": 0.5},
+    }
+    DEFAULT_PRIORITY: str = "standard"
+    LANE_LATENCY_WINDOW: int = 500  # Recent jobs per lane kept for p50/p95 latency metrics
+
+    # Triage (POST /files/triage): low-sample MC at reduced resolution, per-tile statistics only
+    TRIAGE_INPUT_SIZE: int = 256  # Model input edge; multiple of TRIAGE_TILE_SIZE and of the autoencoder's 64px stride
+    TRIAGE_MC_SAMPLES: int = 4  # Stochastic passes per image (ranking needs far fewer than NUM_MC_SAMPLES)
+    TRIAGE_TILE_SIZE: int = 32  # Tile edge in model-input pixels (256 / 32 -> 8x8 grid)
+    TRIAGE_PERCENTILE: float = 95.0  # Per-tile percentile reported alongside mean and max
+    TRIAGE_BATCH_SIZE: int = 16  # Images per forward pass
+    TRIAGE_DECODE_WORKERS: int = 4  # Threads decoding the next batch while the current one runs
+    TRIAGE_MAX_FILES: int = 5000  # File IDs accepted per request
+
+    # Sequence mode (?sequence_id= on /upload and /process): keyframe latent + quantized latent deltas
+    SEQUENCE_DIR: str = "sequences"  # Per-sequence frame log, coded latents and carried-over state
+    SEQUENCE_KEYFRAME_INTERVAL: int = 30  # Force a keyframe every N frames
+    SEQUENCE_KEY_BITS: int = 8  # Keyframe latent quantization bits
+    SEQUENCE_DELTA_BITS: int = 6  # Signed delta code bits (step = keyframe quantization step)
+    SEQUENCE_STATIC_STEPS: float = 2.0  # Latent cells moving less than this many steps reuse last frame's MC statistics
+    SEQUENCE_SCENE_CHANGE_FRACTION: float = 0.5  # Code a keyframe when more than this share of cells changed
+
+    # File upload settings
+    UPLOAD_DIR: str = "uploads"  # Originals as saved by /upload (recompressed later by the storage lifecycle)
+    STATIC_URL: str = "/static"  # URL prefix the upload directory is mounted at
+
+    # Upload validation settings
+    MAX_IMAGE_PIXELS: int = 100_000_000  # Decompression-bomb cap, checked from the header before decoding
+
+    # Deep-zoom tile pyramid settings
+    TILE_DIR: str = "tiles"
+    TILES_URL: str = "/tiles"
+    TILE_SIZE: int = 256
+    TILE_FORMAT: str = "webp"  # webp, png or jpeg
+    TILE_QUALITY: int = 90  # Lossy formats only
+
+    # Storage lifecycle (app.services.storage_lifecycle): lossless compaction of originals,
+    # artifact disk quota and orphan reconciliation, in bounded batches on a background thread
+    LIFECYCLE_ENABLED: bool = True
+    LIFECYCLE_INTERVAL_S: float = 300.0  # Pause between cycles
+    LIFECYCLE_BATCH_SIZE: int = 500  # Rows / directory entries examined per step per cycle
+    LIFECYCLE_COMPACT_BATCH_SIZE: int = 20  # Originals considered for recompression per cycle (CPU-heavy)
+    LIFECYCLE_COMPACT_AFTER_S: float = 86400.0  # Recompress completed originals uploaded longer ago than this
+    LIFECYCLE_MIN_SAVINGS: float = 0.05  # Keep a recompressed original only if it is at least 5% smaller
+    LIFECYCLE_ARTIFACT_QUOTA_MB: int = 20480  # Tile pyramids + MC statistics; least recently written evicted beyond this (0 = no quota)
+    LIFECYCLE_QUOTA_LOW_WATER: float = 0.9  # Eviction stops at this fraction of the quota
+    LIFECYCLE_GRACE_S: float = 3600.0  # Never evict, or treat as orphaned, files written more recently than this
+    LIFECYCLE_STATE_PATH: str = "storage_lifecycle.json"  # Scan cursors (resumed after restarts); "<path>.lock" elects the owner
+
+    # HTTP caching settings
+    STATIC_CACHE_MAX_AGE: int = 31536000  # Uploaded originals never change once saved (1 year)
 
 def get_settings():
     return Settings() 
\ No newline at end of file
@@ -0,0 +1,18 @@
+# backend/app/decoder/__init__.py
+"""
+Standalone latent decoder: reconstructs mean and variance images from compressed latents
+(app.models.ml.latent_codec) using only the decoder half of a DropoutAutoencoder checkpoint.
+
+Depends on torch and numpy only. Nothing here (or in latent_codec) imports the server stack:
+no FastAPI, SQLAlchemy, matplotlib, torchvision, settings or the file logger.
+
+    from app.decoder import LatentDecoder
+    decoder = LatentDecoder("models/ml_model")
+    mean, variance = decoder.decode_bytes(open("frame.cslt", "rb").read(), samples=16)
+
+The package can be copied out together with app/models/ml/latent_codec.py.
+"""
+from app.decoder.model import build_decoder, load_decoder_state, export_decoder_weights
+from app.decoder.runtime import LatentDecoder
+
+__all__ = ["LatentDecoder", "build_decoder", "load_decoder_state", "export_decoder_weights"]
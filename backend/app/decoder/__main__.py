@@ -0,0 +1,54 @@
+# backend/app/decoder/__main__.py
+"""
+    python -m app.decoder --weights models/ml_model --out decoded frames/00000.cslt frames/00001.csld ...
+    python -m app.decoder --weights models/ml_model --export-decoder models/decoder_only.pth
+
+Writes <out>/<frame>_mean.npy and <frame>_variance.npy ((3, H, W) float32) per input frame.
+Delta frames are decoded against the preceding frame on the command line.
+"""
+import argparse
+import os
+import time
+
+import numpy as np
+
+from app.decoder import LatentDecoder, export_decoder_weights
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Decode compressed latents with the standalone decoder.")
+    parser.add_argument("frames", nargs="*", help="Latent files (.cslt keyframes / .csld deltas), in sequence order")
+    parser.add_argument("--weights", required=True, help="DropoutAutoencoder checkpoint or decoder-only export")
+    parser.add_argument("--out", default="decoded", help="Output directory for .npy results")
+    parser.add_argument("--samples", type=int, default=1, help="MC dropout passes (1 = deterministic decode)")
+    parser.add_argument("--dropout", type=float, default=0.25)
+    parser.add_argument("--batch-size", type=int, default=8, help="MC passes per forward batch")
+    parser.add_argument("--threads", type=int, default=None)
+    parser.add_argument("--device", default="cpu")
+    parser.add_argument("--export-decoder", default=None, help="Write a decoder-only state_dict here and exit")
+    args = parser.parse_args()
+
+    if args.export_decoder:
+        params = export_decoder_weights(args.weights, args.export_decoder)
+        print(f"Wrote {params:,} decoder parameters to {args.export_decoder}")
+        return
+
+    start = time.perf_counter()
+    decoder = LatentDecoder(args.weights, dropout_p=args.dropout, device=args.device,
+                            batch_size=args.batch_size, num_threads=args.threads)
+    print(f"Decoder loaded in {(time.perf_counter() - start) * 1000:.0f}ms")
+
+    os.makedirs(args.out, exist_ok=True)
+    for path in args.frames:
+        with open(path, "rb") as f:
+            data = f.read()
+        start = time.perf_counter()
+        mean, variance = decoder.decode_bytes(data, samples=args.samples)
+        name = os.path.splitext(os.path.basename(path))[0]
+        np.save(os.path.join(args.out, f"{name}_mean.npy"), mean)
+        np.save(os.path.join(args.out, f"{name}_variance.npy"), variance)
+        print(f"{path}: {len(data)} bytes -> {mean.shape} in {(time.perf_counter() - start) * 1000:.0f}ms")
+
+
+if __name__ == "__main__":
+    main()
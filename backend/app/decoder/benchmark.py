@@ -0,0 +1,133 @@
+# backend/app/decoder/benchmark.py
+"""
+Cold-start and memory footprint of the standalone decoder vs the full server stack.
+
+    python -m app.decoder.benchmark --weights models/ml_model [--samples 16] [--runs 3] [--out reports/decoder.json]
+
+Each measurement runs in a fresh interpreter (true cold start): import time, weight load time,
+first decode, peak RSS, and which heavy server modules ended up imported. "server" imports the
+ML service the API uses and loads the same checkpoint through ModelRegistry.get(), from a
+one-entry manifest written next to the test latent. The report records the Python/torch versions
+and CPU count with the medians, so numbers from different hosts can be told apart.
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+_PROBE = r"""
+import json, resource, sys, time
+t0 = time.perf_counter()
+mode, weights, latent_path, samples, manifest = sys.argv[1], sys.argv[2], sys.argv[3], int(sys.argv[4]), sys.argv[5]
+if mode == "decoder":
+    from app.decoder import LatentDecoder
+    t1 = time.perf_counter()
+    decoder = LatentDecoder(weights)
+    t2 = time.perf_counter()
+    with open(latent_path, "rb") as f:
+        decoder.decode_bytes(f.read(), samples=samples)
+else:
+    import torch
+    from app.services.ml_service import MLService
+    from app.services.model_registry import ModelRegistry
+    from app.models.ml.latent_codec import decode_latent
+    t1 = time.perf_counter()
+    loaded = ModelRegistry(manifest_path=manifest).get("bench")
+    t2 = time.perf_counter()
+    with open(latent_path, "rb") as f:
+        latent, _ = decode_latent(f.read())
+    with torch.no_grad():
+        z = torch.from_numpy(latent)[None]
+        for _ in range(samples):
+            loaded.model.decoder(z)
+t3 = time.perf_counter()
+heavy = ["fastapi", "sqlalchemy", "matplotlib", "torchvision", "PIL", "app.config.settings", "app.utils.logger"]
+print(json.dumps({
+    "import_ms": (t1 - t0) * 1000,
+    "load_ms": (t2 - t1) * 1000,
+    "first_decode_ms": (t3 - t2) * 1000,
+    "cold_start_ms": (t3 - t0) * 1000,
+    "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    "heavy_modules": [m for m in heavy if m in sys.modules],
+}))
+"""
+
+
+def _make_inputs(weights: str, latent_path: str, manifest_path: str):
+    """
+    Random latent with the checkpoint's bottleneck shape (decode cost does not depend on content),
+    and a registry manifest describing the checkpoint for the "server" probe.
+    """
+    import numpy as np
+    from app.decoder.model import load_decoder_state
+    from app.models.ml.latent_codec import encode_latent
+
+    channels = load_decoder_state(weights)["0.weight"].shape[0]
+    latent = np.random.default_rng(0).random((channels, 8, 8), dtype=np.float32)
+    with open(latent_path, "wb") as f:
+        f.write(encode_latent(latent, bits=8, image_size=(512, 512)))
+    with open(manifest_path, "w") as f:
+        json.dump({"default": "bench", "models": [
+            {"version": "bench", "path": os.path.abspath(weights), "bottleneck_channels": int(channels)}
+        ]}, f)
+
+
+def _environment() -> dict:
+    try:
+        import torch
+        torch_version, threads = torch.__version__, torch.get_num_threads()
+    except ImportError:
+        torch_version, threads = None, None
+    return {"python": platform.python_version(), "torch": torch_version, "torch_threads": threads,
+            "cpus": os.cpu_count(), "platform": platform.platform(),
+            "date": time.strftime("%Y-%m-%dT%H:%M:%S%z")}
+
+
+def _probe(mode: str, weights: str, latent_path: str, samples: int, manifest_path: str) -> dict:
+    result = subprocess.run(
+        [sys.executable, "-c", _PROBE, mode, weights, latent_path, str(samples), manifest_path],
+        capture_output=True, text=True, check=True, cwd=os.getcwd(),
+    )
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cold-start/memory benchmark: standalone decoder vs server stack.")
+    parser.add_argument("--weights", default="models/ml_model")
+    parser.add_argument("--samples", type=int, default=16, help="MC decode passes in the first decode")
+    parser.add_argument("--runs", type=int, default=3, help="Fresh interpreters per mode (median reported)")
+    parser.add_argument("--out", default="reports/decoder.json", help="JSON report path ('' to skip)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        latent_path, manifest_path = os.path.join(tmp, "bench.cslt"), os.path.join(tmp, "registry.json")
+        _make_inputs(args.weights, latent_path, manifest_path)
+        report = {}
+        for mode in ("decoder", "server"):
+            runs = [_probe(mode, args.weights, latent_path, args.samples, manifest_path) for _ in range(args.runs)]
+            report[mode] = {
+                key: round(statistics.median(run[key] for run in runs), 1)
+                for key in ("import_ms", "load_ms", "first_decode_ms", "cold_start_ms", "peak_rss_mb")
+            }
+            report[mode]["heavy_modules"] = runs[0]["heavy_modules"]
+
+    report["config"] = {"weights": args.weights, "samples": args.samples, "runs": args.runs, **_environment()}
+
+    for mode in ("decoder", "server"):
+        row = report[mode]
+        print(f"{mode:8s} cold start {row['cold_start_ms']:8.1f}ms  (import {row['import_ms']:.1f}, "
+              f"load {row['load_ms']:.1f}, decode {row['first_decode_ms']:.1f})  "
+              f"peak RSS {row['peak_rss_mb']:7.1f}MB  heavy modules: {', '.join(row['heavy_modules']) or '-'}")
+    if args.out:
+        os.makedirs(os.path.dirname(args.out) or ".", exist_ok=True)
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+# backend/app/decoder/model.py
+from typing import Dict
+
+import torch
+import torch.nn as nn
+
+DECODER_PREFIX = "decoder."
+
+
+def build_decoder(bottleneck_channels: int = 512, dropout_p: float = 0.25) -> nn.Sequential:
+    """
+    Mirror of DropoutAutoencoder.decoder (same layer order, so state_dict keys line up).
+    Kept separate so decoding never imports app.models.ml.autoencoder and its logger;
+    load_decoder_state() loads strictly, so any drift from the training model fails loudly.
+    """
+    def up(in_ch, out_ch):
+        return [
+            nn.ConvTranspose2d(in_ch, out_ch, kernel_size=3, stride=2, padding=1, output_padding=1),
+            nn.ReLU(inplace=True),
+            nn.Dropout(dropout_p),
+        ]
+
+    return nn.Sequential(
+        *up(bottleneck_channels, 512),
+        *up(512, 512),
+        *up(512, 256),
+        *up(256, 128),
+        *up(128, 64),
+        nn.ConvTranspose2d(64, 3, kernel_size=3, stride=2, padding=1, output_padding=1),
+        nn.Sigmoid(),
+    )
+
+
+def load_decoder_state(path: str) -> Dict[str, torch.Tensor]:
+    """
+    Decoder tensors from a full DropoutAutoencoder checkpoint or a decoder-only export.
+    The file is memory-mapped, so encoder weights in a full checkpoint are never read into memory.
+    """
+    state = torch.load(path, map_location="cpu", mmap=True, weights_only=True)
+    if any(key.startswith(DECODER_PREFIX) for key in state):
+        return {key[len(DECODER_PREFIX):]: value for key, value in state.items() if key.startswith(DECODER_PREFIX)}
+    return state
+
+
+def export_decoder_weights(checkpoint_path: str, out_path: str) -> int:
+    """Writes a decoder-only state_dict (what ground stations need); returns its parameter count."""
+    state = {key: value.clone() for key, value in load_decoder_state(checkpoint_path).items()}
+    torch.save(state, out_path)
+    return sum(value.numel() for value in state.values())
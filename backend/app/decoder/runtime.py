@@ -0,0 +1,92 @@
+# backend/app/decoder/runtime.py
+from typing import Iterable, Iterator, Optional, Tuple, Union
+
+import numpy as np
+import torch
+import torch.nn as nn
+
+from app.decoder.model import build_decoder, load_decoder_state
+from app.models.ml.latent_codec import decode_latent, decode_latent_delta, is_delta_frame
+
+
+class LatentDecoder:
+    """
+    Decoder-only inference: latent -> (mean, variance) images, shaped (3, H, W) float32 in [0, 1].
+
+    samples=1 is a deterministic decode (dropout off, zero variance); samples > 1 runs MC dropout,
+    with the passes batched (batch_size at a time) and combined with Welford/Chan updates.
+    """
+
+    def __init__(self, weights_path: str, dropout_p: float = 0.25, device: Union[str, torch.device] = "cpu",
+                 batch_size: int = 8, num_threads: Optional[int] = None):
+        if num_threads:
+            torch.set_num_threads(num_threads)
+        self.device = torch.device(device)
+        self.batch_size = max(1, batch_size)
+        state = load_decoder_state(weights_path)
+        # ConvTranspose2d weights are (in_channels, out_channels, k, k): the first layer's input is the bottleneck
+        self.bottleneck_channels = state["0.weight"].shape[0]
+        self.model = build_decoder(self.bottleneck_channels, dropout_p)
+        if self.device.type == "cpu":
+            self.model.load_state_dict(state, assign=True)  # Keep weights backed by the mmap'd file
+        else:
+            self.model.load_state_dict(state)
+            self.model.to(self.device)
+        self.model.eval()
+        self._dropout = [m for m in self.model.modules() if isinstance(m, nn.Dropout)]
+        self._reference: Optional[np.ndarray] = None  # Previous latent when decoding a sequence
+
+    def _set_dropout(self, active: bool):
+        for module in self._dropout:
+            module.train(active)
+
+    def decode(self, latent: np.ndarray, samples: int = 1) -> Tuple[np.ndarray, np.ndarray]:
+        """Decodes a (C, h, w) latent; returns (mean, variance) as (3, H, W) float32 arrays."""
+        z = torch.from_numpy(np.ascontiguousarray(latent, dtype=np.float32))[None].to(self.device)
+        with torch.inference_mode():
+            if samples <= 1:
+                self._set_dropout(False)
+                mean = self.model(z)[0].cpu().numpy()
+                return mean, np.zeros_like(mean)
+
+            self._set_dropout(True)
+            count, mean, m2 = 0, None, None
+            for start in range(0, samples, self.batch_size):
+                n = min(self.batch_size, samples - start)
+                preds = self.model(z.expand(n, -1, -1, -1))
+                batch_var, batch_mean = torch.var_mean(preds, dim=0, unbiased=False)
+                batch_m2 = batch_var * n
+                if mean is None:
+                    count, mean, m2 = n, batch_mean, batch_m2
+                    continue
+                # Chan et al. parallel update of (count, mean, M2)
+                total = count + n
+                delta = batch_mean - mean
+                mean = mean + delta * (n / total)
+                m2 = m2 + batch_m2 + delta ** 2 * (count * n / total)
+                count = total
+            self._set_dropout(False)
+            return mean.cpu().numpy(), (m2 / count).cpu().numpy()
+
+    def decode_bytes(self, data: bytes, samples: int = 1) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Decodes one CSLT keyframe, or a CSLD delta frame against the previous frame decoded by this
+        instance (frames of a sequence must be passed in order).
+        """
+        if is_delta_frame(data):
+            if self._reference is None:
+                raise ValueError("Delta frame without a preceding keyframe")
+            delta, _ = decode_latent_delta(data)
+            latent = self._reference + delta
+        else:
+            latent, _ = decode_latent(data)
+        if latent.shape[0] != self.bottleneck_channels:
+            raise ValueError(f"Latent has {latent.shape[0]} channels, decoder expects {self.bottleneck_channels}")
+        self._reference = latent
+        return self.decode(latent, samples)
+
+    def decode_sequence(self, frames: Iterable[bytes], samples: int = 1) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+        """Decodes a sequence's frames (keyframes and deltas) in order."""
+        self._reference = None
+        for data in frames:
+            yield self.decode_bytes(data, samples)
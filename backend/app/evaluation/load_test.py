@@ -0,0 +1,434 @@
+# backend/app/evaluation/load_test.py
+"""
+End-to-end load test of the upload -> background processing -> status loop.
+
+    # Start an isolated server (random model weights, fresh SQLite) and replay a scenario against it
+    python -m app.evaluation.load_test run --scenario loadtest.json --out reports/load
+
+    # Or drive an already running server (pass its PID to sample RSS)
+    python -m app.evaluation.load_test run --url http://127.0.0.1:8000 --server-pid 1234 --rate 2 --duration 60
+
+Scenario file (every key optional; CLI flags override):
+
+    {
+      "duration_s": 60, "rate_per_s": 2.0, "arrival": "poisson",      # or "constant"
+      "max_in_flight": 64, "poll_interval_s": 0.25, "timeout_s": 300,
+      "mix": [
+        {"weight": 3, "width": 512, "height": 512, "format": "jpeg", "priority": "interactive"},
+        {"weight": 1, "width": 3000, "height": 2000, "format": "png", "priority": "bulk"}
+      ],
+      "settings": {"NUM_MC_SAMPLES": 8, "MAX_CONCURRENT_JOBS": 2}   # Settings overrides for the spawned server (paths default into its workdir)
+    }
+
+Arrivals are open-loop (the schedule does not wait for completions), so overload shows up as
+queueing latency and 429s rather than a silently reduced rate. Completion is detected by polling
+/files/status/{id} every poll_interval_s. The report
+(<out>.json, plus a printed summary) has throughput, upload-to-completed p50/p95/p99, error rates
+by kind and a timeline of server RSS and queue depth. --max-p95 / --max-error-rate turn the run
+into a pass/fail check (exit code 1).
+"""
+import argparse
+import asyncio
+import io
+import json
+import math
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+DEFAULT_SCENARIO = {
+    "duration_s": 30,
+    "rate_per_s": 1.0,
+    "arrival": "poisson",
+    "max_in_flight": 64,
+    "poll_interval_s": 0.25,
+    "timeout_s": 300,
+    "mix": [{"weight": 1, "width": 512, "height": 512, "format": "jpeg"}],
+    "settings": {},
+}
+
+_MIME = {"jpeg": "image/jpeg", "png": "image/png", "tiff": "image/tiff", "bmp": "image/bmp"}
+
+
+# --- Isolated server ---
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def prepare_workdir(workdir: str, settings_overrides: dict, dropout_p: float = 0.25) -> dict:
+    """
+    Randomly initialised DropoutAutoencoder at the workdir's MODEL_PATH plus the settings file the
+    spawned server applies. Every path the app writes to is pinned inside workdir and the scenario's
+    overrides go on top; returns the effective settings (recorded in the report).
+    """
+    import torch
+    from app.config.settings import Settings
+    from app.models.ml.autoencoder import DropoutAutoencoder
+
+    def inside(*parts):
+        return os.path.join(os.path.abspath(workdir), *parts)
+
+    settings = {
+        "DATABASE_URL": f"sqlite:///{inside('loadtest.db')}",
+        "MODEL_PATH": inside("models", "ml_model"),
+        "MODEL_REGISTRY_PATH": inside("models", "registry.json"),
+        "UPLOAD_DIR": inside("uploads"),
+        "STATIC_URL": Settings.STATIC_URL,
+        "TILE_DIR": inside("tiles"),
+        "MC_STATE_DIR": inside("mc_state"),
+        "SEQUENCE_DIR": inside("sequences"),
+        "LIFECYCLE_STATE_PATH": inside("storage_lifecycle.json"),
+        "NUM_MC_SAMPLES": Settings.NUM_MC_SAMPLES,
+    }
+    settings.update(settings_overrides)
+
+    os.makedirs(os.path.dirname(settings["MODEL_PATH"]), exist_ok=True)
+    torch.manual_seed(0)
+    torch.save(DropoutAutoencoder(dropout_p=dropout_p).state_dict(), settings["MODEL_PATH"])
+    with open(inside("settings.json"), "w") as f:
+        json.dump(settings, f, indent=2)
+    return settings
+
+
+def serve(args):
+    """Runs the app in this process after applying Settings overrides (used as the spawned server)."""
+    from app.config.settings import Settings
+
+    if args.settings and os.path.exists(args.settings):
+        with open(args.settings) as f:
+            for key, value in json.load(f).items():
+                if not hasattr(Settings, key):
+                    sys.exit(f"Unknown setting in {args.settings}: {key}")  # A typo would otherwise be a silent no-op
+                setattr(Settings, key, value)  # Before app.main is imported, so every module sees them
+    import uvicorn
+    uvicorn.run("app.main:app", host="127.0.0.1", port=args.port, log_level="warning")
+
+
+def start_server(workdir: str, port: int) -> subprocess.Popen:
+    """Starts `serve` with cwd=workdir, so the SQLite DB, uploads, tiles and logs stay inside it."""
+    backend_dir = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [backend_dir, os.environ.get("PYTHONPATH")])))
+    log = open(os.path.join(workdir, "server.log"), "w")
+    return subprocess.Popen(
+        [sys.executable, "-m", "app.evaluation.load_test", "serve", "--port", str(port), "--settings", "settings.json"],
+        cwd=workdir, env=env, stdout=log, stderr=subprocess.STDOUT,
+    )
+
+
+def wait_ready(url: str, timeout_s: float = 300.0, server: Optional[subprocess.Popen] = None,
+               log_path: Optional[str] = None):
+    """Polls /ready; gives up early if the spawned server exits (see log_path for why)."""
+    see_log = f"; see {log_path}" if log_path else ""
+    deadline = time.monotonic() + timeout_s
+    while time.monotonic() < deadline:
+        if server is not None and server.poll() is not None:
+            raise RuntimeError(f"Server exited with code {server.returncode} before becoming ready{see_log}")
+        try:
+            with urllib.request.urlopen(f"{url}/ready", timeout=2) as response:
+                if response.status == 200:
+                    return
+        except (urllib.error.URLError, ConnectionError, OSError):
+            pass
+        time.sleep(0.5)
+    raise RuntimeError(f"Server at {url} not ready after {timeout_s}s{see_log}")
+
+
+# --- Payloads and HTTP (stdlib only, run on a thread pool) ---
+
+def make_image(width: int, height: int, fmt: str, seed: int) -> bytes:
+    """Smooth random texture plus noise: compresses roughly like real imagery, unlike pure noise."""
+    import numpy as np
+    from PIL import Image
+
+    rng = np.random.default_rng(seed)
+    coarse = Image.fromarray(rng.integers(0, 256, (max(2, height // 32), max(2, width // 32), 3), dtype=np.uint8))
+    base = np.asarray(coarse.resize((width, height), Image.BILINEAR), dtype=np.int16)
+    noisy = np.clip(base + rng.integers(-12, 13, base.shape), 0, 255).astype(np.uint8)
+    buffer = io.BytesIO()
+    Image.fromarray(noisy).save(buffer, format=fmt.upper(), **({"quality": 90} if fmt == "jpeg" else {}))
+    return buffer.getvalue()
+
+
+def _multipart(filename: str, content_type: str, payload: bytes):
+    boundary = uuid.uuid4().hex
+    head = (f"--{boundary}\r\nContent-Disposition: form-data; name=\"file\"; filename=\"{filename}\"\r\n"
+            f"Content-Type: {content_type}\r\n\r\n").encode()
+    return head + payload + f"\r\n--{boundary}--\r\n".encode(), f"multipart/form-data; boundary={boundary}"
+
+
+def _request(method: str, url: str, body: bytes = None, headers: dict = None, timeout: float = 60.0):
+    """Returns (status, headers, body bytes); HTTP errors are returned, not raised."""
+    request = urllib.request.Request(url, data=body, method=method, headers=headers or {})
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            return response.status, dict(response.headers), response.read()
+    except urllib.error.HTTPError as e:
+        return e.code, dict(e.headers or {}), e.read()
+
+
+def rss_mb(pid: int) -> Optional[float]:
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        return None
+    return None
+
+
+def _percentile(values: List[float], q: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return round(ordered[min(len(ordered) - 1, int(math.ceil(q * len(ordered))) - 1)], 3)
+
+
+# --- Load generator ---
+
+class LoadRun:
+    def __init__(self, url: str, scenario: dict, server_pid: Optional[int], seed: int = 0):
+        self.url = url.rstrip("/")
+        self.api = f"{self.url}/api/v1/files"
+        self.scenario = scenario
+        self.server_pid = server_pid
+        self.random = random.Random(seed)
+        self.records: List[dict] = []
+        self.timeline: List[dict] = []
+        self.executor = ThreadPoolExecutor(max_workers=scenario["max_in_flight"] * 2 + 4)
+        self.in_flight = asyncio.Semaphore(scenario["max_in_flight"])
+        self.active = 0
+        weights = [entry.get("weight", 1) for entry in scenario["mix"]]
+        self.mix_weights = weights
+        # One payload per mix entry, generated up front so encoding cost never skews arrivals
+        self.payloads = [make_image(e["width"], e["height"], e.get("format", "jpeg"), i) for i, e in enumerate(scenario["mix"])]
+
+    async def _http(self, *args, **kwargs):
+        return await asyncio.get_running_loop().run_in_executor(self.executor, lambda: _request(*args, **kwargs))
+
+    async def _job(self, index: int, entry_index: int):
+        entry = self.scenario["mix"][entry_index]
+        fmt = entry.get("format", "jpeg")
+        record = {"index": index, "mix": entry_index, "bytes": len(self.payloads[entry_index]), "outcome": None}
+        self.records.append(record)
+        async with self.in_flight:
+            self.active += 1
+            try:
+                await self._upload_and_wait(record, entry_index, entry, fmt)
+            finally:
+                self.active -= 1
+
+    async def _upload_and_wait(self, record: dict, entry_index: int, entry: dict, fmt: str):
+        index = record["index"]
+        start = time.monotonic()
+        record["sent_at"] = round(start - self.started, 3)
+        body, content_type = _multipart(f"load_{index}.{fmt}", _MIME.get(fmt, "application/octet-stream"),
+                                        self.payloads[entry_index])
+        query = "&".join(f"{key}={entry[key]}" for key in ("priority", "model_version", "sequence_id") if entry.get(key))
+        try:
+            status, _, data = await self._http(
+                "POST", f"{self.api}/upload" + (f"?{query}" if query else ""), body,
+                {"Content-Type": content_type, "X-Client-Id": f"load-{entry_index}"},
+            )
+        except Exception as e:
+            record["outcome"] = f"upload_error:{type(e).__name__}"
+            return
+        record["upload_s"] = round(time.monotonic() - start, 4)
+        if status != 202:
+            record["outcome"] = f"upload_http_{status}"
+            return
+        file_id = json.loads(data)["file_id"]
+
+        deadline = start + self.scenario["timeout_s"]
+        while time.monotonic() < deadline:
+            await asyncio.sleep(self.scenario["poll_interval_s"])
+            try:
+                status, _, data = await self._http("GET", f"{self.api}/status/{file_id}")
+            except Exception:
+                continue  # Transient poll failure; keep polling until the deadline
+            if status != 200:
+                record["outcome"] = f"status_http_{status}"
+                return
+            state = json.loads(data)["status"]
+            if state in ("completed", "failed"):
+                record["latency_s"] = round(time.monotonic() - start, 4)
+                record["outcome"] = state
+                return
+        record["outcome"] = "timeout"
+
+    async def _sample(self, stop: asyncio.Event):
+        while not stop.is_set():
+            point = {"t": round(time.monotonic() - self.started, 2), "client_active": self.active}
+            if self.server_pid:
+                point["rss_mb"] = rss_mb(self.server_pid)
+            try:
+                status, _, data = await self._http("GET", f"{self.api}/queue", timeout=5)
+                if status == 200:
+                    queue = json.loads(data)
+                    point.update(queued=queue.get("queued"), in_flight=queue.get("in_flight"))
+            except Exception:
+                pass
+            self.timeline.append(point)
+            try:
+                await asyncio.wait_for(stop.wait(), timeout=1.0)
+            except asyncio.TimeoutError:
+                pass
+
+    async def run(self):
+        self.started = time.monotonic()
+        stop = asyncio.Event()
+        sampler = asyncio.create_task(self._sample(stop))
+        tasks, index, next_at = [], 0, 0.0
+        rate, duration = self.scenario["rate_per_s"], self.scenario["duration_s"]
+        while next_at < duration:
+            delay = self.started + next_at - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            entry_index = self.random.choices(range(len(self.mix_weights)), weights=self.mix_weights)[0]
+            tasks.append(asyncio.create_task(self._job(index, entry_index)))
+            index += 1
+            next_at += self.random.expovariate(rate) if self.scenario["arrival"] == "poisson" else 1.0 / rate
+        await asyncio.gather(*tasks)
+        self.elapsed = time.monotonic() - self.started
+        stop.set()
+        await sampler
+        self.executor.shutdown(wait=False)
+
+    def report(self) -> dict:
+        outcomes: Dict[str, int] = {}
+        for record in self.records:
+            outcomes[record["outcome"]] = outcomes.get(record["outcome"], 0) + 1
+        completed = [r["latency_s"] for r in self.records if r["outcome"] == "completed"]
+        uploads = [r["upload_s"] for r in self.records if "upload_s" in r]
+        total = len(self.records)
+        errors = total - len(completed)
+        per_mix = {}
+        for i, entry in enumerate(self.scenario["mix"]):
+            latencies = [r["latency_s"] for r in self.records if r["mix"] == i and r["outcome"] == "completed"]
+            per_mix[str(i)] = {**entry, "sent": sum(1 for r in self.records if r["mix"] == i),
+                               "completed": len(latencies), "p50_s": _percentile(latencies, 0.5),
+                               "p95_s": _percentile(latencies, 0.95)}
+        rss = [p["rss_mb"] for p in self.timeline if p.get("rss_mb") is not None]
+        return {
+            "scenario": self.scenario,
+            "elapsed_s": round(self.elapsed, 2),
+            "sent": total,
+            "completed": len(completed),
+            "throughput_per_s": round(len(completed) / self.elapsed, 3) if self.elapsed else None,
+            "latency_s": {"p50": _percentile(completed, 0.5), "p95": _percentile(completed, 0.95),
+                          "p99": _percentile(completed, 0.99), "max": max(completed) if completed else None},
+            "upload_request_s": {"p50": _percentile(uploads, 0.5), "p95": _percentile(uploads, 0.95)},
+            "error_rate": round(errors / total, 4) if total else None,
+            "outcomes": outcomes,
+            "per_mix": per_mix,
+            "rss_mb": {"start": rss[0] if rss else None, "peak": max(rss) if rss else None, "end": rss[-1] if rss else None},
+            "timeline": self.timeline,
+            "records": self.records,
+        }
+
+
+def load_scenario(args) -> dict:
+    scenario = json.loads(json.dumps(DEFAULT_SCENARIO))
+    if args.scenario:
+        with open(args.scenario) as f:
+            scenario.update(json.load(f))
+    for key, value in (("rate_per_s", args.rate), ("duration_s", args.duration), ("max_in_flight", args.max_in_flight)):
+        if value is not None:
+            scenario[key] = value
+    return scenario
+
+
+def run(args) -> int:
+    scenario = load_scenario(args)
+    workdir, server, finished = None, None, False
+    url, server_pid = args.url, args.server_pid
+    try:
+        if not url:
+            workdir = tempfile.mkdtemp(prefix="loadtest_")
+            scenario["settings"] = prepare_workdir(workdir, scenario.get("settings", {}))
+            port = _free_port()
+            server = start_server(workdir, port)
+            url, server_pid = f"http://127.0.0.1:{port}", server.pid
+            print(f"Started server pid {server.pid} on {url} (workdir {workdir})")
+        wait_ready(url, server=server, log_path=os.path.join(workdir, "server.log") if workdir else None)
+
+        load = LoadRun(url, scenario, server_pid, seed=args.seed)
+        asyncio.run(load.run())
+        report = load.report()
+        finished = True
+    finally:
+        if server is not None:
+            server.terminate()
+            try:
+                server.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                server.kill()
+        if workdir and finished and not args.keep_workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+        elif workdir:
+            print(f"Kept workdir {workdir}")  # Always after a failure, so server.log can be read
+
+    if args.out:
+        os.makedirs(os.path.dirname(args.out) or ".", exist_ok=True)
+        with open(f"{args.out}.json", "w") as f:
+            json.dump(report, f, indent=2)
+
+    latency = report["latency_s"]
+    print(f"sent {report['sent']}  completed {report['completed']}  throughput {report['throughput_per_s']}/s  "
+          f"error rate {report['error_rate']}")
+    print(f"upload->completed p50 {latency['p50']}s  p95 {latency['p95']}s  p99 {latency['p99']}s  max {latency['max']}s")
+    print(f"outcomes {report['outcomes']}  server RSS {report['rss_mb']}")
+
+    failures = []
+    if args.max_p95 is not None and (latency["p95"] is None or latency["p95"] > args.max_p95):
+        failures.append(f"p95 {latency['p95']}s > {args.max_p95}s")
+    if args.max_error_rate is not None and (report["error_rate"] is None or report["error_rate"] > args.max_error_rate):
+        failures.append(f"error rate {report['error_rate']} > {args.max_error_rate}")
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    return 1 if failures else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="End-to-end upload-to-completion load test.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = sub.add_parser("run", help="Replay a scenario (starts an isolated server unless --url is given)")
+    run_parser.add_argument("--scenario", default=None, help="Scenario JSON (see module docstring)")
+    run_parser.add_argument("--url", default=None, help="Target an already running server instead")
+    run_parser.add_argument("--server-pid", type=int, default=None, help="PID of --url's server, for RSS sampling")
+    run_parser.add_argument("--rate", type=float, default=None, help="Arrivals per second")
+    run_parser.add_argument("--duration", type=float, default=None, help="Seconds of arrivals")
+    run_parser.add_argument("--max-in-flight", type=int, default=None, help="Client-side concurrency cap")
+    run_parser.add_argument("--seed", type=int, default=0, help="Arrival/mix RNG seed (repeatable runs)")
+    run_parser.add_argument("--out", default=None, help="Report prefix (<out>.json)")
+    run_parser.add_argument("--keep-workdir", action="store_true", help="Keep the isolated server's files and log")
+    run_parser.add_argument("--max-p95", type=float, default=None, help="Fail if p95 upload-to-completed exceeds this")
+    run_parser.add_argument("--max-error-rate", type=float, default=None, help="Fail if the error rate exceeds this")
+
+    serve_parser = sub.add_parser("serve", help="Run the app with Settings overrides (spawned by `run`)")
+    serve_parser.add_argument("--port", type=int, default=8000)
+    serve_parser.add_argument("--settings", default=None, help="JSON of Settings attribute overrides")
+
+    args = parser.parse_args()
+    if args.command == "serve":
+        serve(args)
+    else:
+        sys.exit(run(args))
+
+
+if __name__ == "__main__":
+    main()
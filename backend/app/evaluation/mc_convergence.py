@@ -0,0 +1,146 @@
+# backend/app/evaluation/mc_convergence.py
+"""
+Convergence of MC dropout estimators under each mask strategy (app.models.ml.mc_sampling).
+
+    python -m app.evaluation.mc_convergence --images /path/to/images --weights models/ml_model --out reports/mc_convergence
+
+For every image a long native run (--reference-samples passes) gives reference mean and variance
+maps. Each strategy is then run at every sample count of the ladder, --repeats times with different
+seeds, and scored against the reference:
+  * mean_rmse / var_rmse - RMSE of the mean and variance maps
+  * var_rel_error        - ||var - ref|| / ||ref||
+  * equiv_native_samples - passes plain dropout would need for the same var_rmse, assuming its error
+                           falls as 1/sqrt(T): T * (native var_rmse / strategy var_rmse)^2
+Results are written to <out>.csv (one row per strategy x sample count) and <out>.json.
+"""
+import argparse
+import csv
+import json
+import os
+
+import numpy as np
+import torch
+
+from app.models.ml.autoencoder import enable_dropout, load_dropout_autoencoder, mc_dropout_moments
+from app.models.ml.mc_sampling import STRATEGIES, mask_schedule
+from app.training.dataset import find_images
+from app.utils.image_utils import load_image_for_model
+from app.utils.logger import setup_logger
+
+logger = setup_logger("mc_convergence")
+
+
+def _load_batch(paths, size: int) -> torch.Tensor:
+    tensors = []
+    for path in paths:
+        try:
+            img = load_image_for_model(path, (size, size)).resize((size, size))
+            tensors.append(torch.from_numpy(np.asarray(img, dtype=np.uint8)).permute(2, 0, 1).float().div_(255.0))
+        except Exception as e:
+            logger.warning(f"Skipping {path}: {e}")
+    return torch.stack(tensors)
+
+
+def _estimate(model, batch, strategy: str, samples: int, seed: int):
+    if strategy == "native":
+        torch.manual_seed(seed)
+    with mask_schedule(model, strategy, samples, seed=seed):
+        mean, m2 = mc_dropout_moments(model, batch, samples)
+    return mean, m2 / samples
+
+
+def _per_image_rmse(estimate: torch.Tensor, reference: torch.Tensor) -> torch.Tensor:
+    return (estimate - reference).pow(2).flatten(1).mean(dim=1).sqrt()
+
+
+def evaluate(args) -> dict:
+    device = torch.device(args.device or ("cuda" if torch.cuda.is_available() else "cpu"))
+    paths = find_images(args.images)[: args.limit or None]
+    if not paths:
+        raise ValueError(f"No images found in {args.images}")
+    ladder = sorted({int(t) for t in args.samples.split(",") if t})
+    strategies = [s for s in args.strategies.split(",") if s] if args.strategies else list(STRATEGIES)
+    for strategy in strategies:
+        if strategy not in STRATEGIES:
+            raise ValueError(f"Unknown strategy '{strategy}' (expected one of {', '.join(STRATEGIES)})")
+
+    model = load_dropout_autoencoder(args.weights, args.dropout, map_location=device)
+    model.to(device).eval()
+    enable_dropout(model)
+    logger.info(f"{len(paths)} images at {args.size}px on {device}; ladder {ladder}; strategies {strategies}")
+
+    # errors[strategy][T] -> {metric: [per image x repeat values]}
+    errors = {s: {t: {"mean_rmse": [], "var_rmse": [], "var_rel_error": []} for t in ladder} for s in strategies}
+    for start in range(0, len(paths), args.batch_size):
+        batch = _load_batch(paths[start:start + args.batch_size], args.size).to(device)
+        ref_mean, ref_var = _estimate(model, batch, "native", args.reference_samples, args.seed + 10_000)
+        ref_norm = ref_var.flatten(1).norm(dim=1)
+        for strategy in strategies:
+            for samples in ladder:
+                for repeat in range(args.repeats):
+                    mean, var = _estimate(model, batch, strategy, samples, args.seed + repeat)
+                    entry = errors[strategy][samples]
+                    entry["mean_rmse"].extend(_per_image_rmse(mean, ref_mean).tolist())
+                    entry["var_rmse"].extend(_per_image_rmse(var, ref_var).tolist())
+                    entry["var_rel_error"].extend(((var - ref_var).flatten(1).norm(dim=1) / ref_norm).tolist())
+        logger.info(f"Processed {min(start + args.batch_size, len(paths))}/{len(paths)} images")
+
+    rows = []
+    for strategy in strategies:
+        for samples in ladder:
+            entry = errors[strategy][samples]
+            row = {"strategy": strategy, "samples": samples}
+            for metric, values in entry.items():
+                row[metric] = float(np.mean(values))
+                row[f"{metric}_std"] = float(np.std(values))
+            rows.append(row)
+    native = {row["samples"]: row["var_rmse"] for row in rows if row["strategy"] == "native"}
+    for row in rows:
+        if row["samples"] in native and row["var_rmse"] > 0:
+            row["equiv_native_samples"] = row["samples"] * (native[row["samples"]] / row["var_rmse"]) ** 2
+
+    report = {
+        "config": {"images": len(paths), "size": args.size, "ladder": ladder, "repeats": args.repeats,
+                   "reference_samples": args.reference_samples, "dropout": args.dropout, "device": str(device)},
+        "rows": rows,
+    }
+    _write_report(args.out, report)
+    for row in rows:
+        logger.info(f"{row['strategy']:>10s} T={row['samples']:<4d} mean_rmse {row['mean_rmse']:.5f}  "
+                    f"var_rmse {row['var_rmse']:.6f}  var_rel {row['var_rel_error']:.4f}  "
+                    f"equiv native T {row.get('equiv_native_samples', float('nan')):.1f}")
+    return report
+
+
+def _write_report(out_prefix: str, report: dict):
+    os.makedirs(os.path.dirname(out_prefix) or ".", exist_ok=True)
+    fields = ["strategy", "samples", "mean_rmse", "mean_rmse_std", "var_rmse", "var_rmse_std",
+              "var_rel_error", "var_rel_error_std", "equiv_native_samples"]
+    with open(f"{out_prefix}.csv", "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=fields, extrasaction="ignore")
+        writer.writeheader()
+        writer.writerows(report["rows"])
+    with open(f"{out_prefix}.json", "w") as f:
+        json.dump(report, f, indent=2)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Estimator error vs MC sample count for each dropout mask strategy.")
+    parser.add_argument("--images", required=True, help="Directory of evaluation images (recursive)")
+    parser.add_argument("--weights", default="models/ml_model", help="DropoutAutoencoder weights")
+    parser.add_argument("--out", default="reports/mc_convergence", help="Output prefix for .csv and .json")
+    parser.add_argument("--size", type=int, default=256, help="Square model input size")
+    parser.add_argument("--samples", default="2,4,8,16,32,64", help="Comma-separated MC sample counts")
+    parser.add_argument("--reference-samples", type=int, default=512, help="Native passes for the reference maps")
+    parser.add_argument("--repeats", type=int, default=3, help="Seeds per strategy and sample count")
+    parser.add_argument("--strategies", default=None, help=f"Comma-separated subset of {','.join(STRATEGIES)} (default: all)")
+    parser.add_argument("--dropout", type=float, default=0.25)
+    parser.add_argument("--batch-size", type=int, default=4)
+    parser.add_argument("--limit", type=int, default=8, help="Evaluate at most this many images (0 = all)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--device", default=None)
+    evaluate(parser.parse_args())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+# backend/app/evaluation/metrics.py
+"""Batched image-quality metrics on (B, C, H, W) tensors in [0, 1]; each returns a (B,) tensor."""
+import torch
+import torch.nn.functional as F
+
+from app.models.ml.losses import sobel_gradient_magnitude
+
+
+def psnr(output: torch.Tensor, target: torch.Tensor, max_val: float = 1.0) -> torch.Tensor:
+    mse = (output - target).pow(2).flatten(1).mean(dim=1)
+    return 10.0 * torch.log10(max_val ** 2 / mse.clamp_min(1e-12))
+
+
+def _gaussian_window(size: int, sigma: float, channels: int, device, dtype) -> torch.Tensor:
+    coords = torch.arange(size, device=device, dtype=dtype) - (size - 1) / 2
+    g = torch.exp(-coords ** 2 / (2 * sigma ** 2))
+    g = g / g.sum()
+    window = torch.outer(g, g).view(1, 1, size, size)
+    return window.repeat(channels, 1, 1, 1)  # Depthwise: one window per channel
+
+
+def ssim(output: torch.Tensor, target: torch.Tensor, window_size: int = 11, sigma: float = 1.5,
+         max_val: float = 1.0) -> torch.Tensor:
+    """Mean SSIM (Wang et al. 2004, Gaussian window), averaged over channels and pixels."""
+    channels = output.shape[1]
+    window = _gaussian_window(window_size, sigma, channels, output.device, output.dtype)
+    c1, c2 = (0.01 * max_val) ** 2, (0.03 * max_val) ** 2
+
+    def filt(x):
+        return F.conv2d(x, window, groups=channels)  # 'valid' windows only
+
+    mu_x, mu_y = filt(output), filt(target)
+    sigma_x = filt(output * output) - mu_x ** 2
+    sigma_y = filt(target * target) - mu_y ** 2
+    sigma_xy = filt(output * target) - mu_x * mu_y
+    ssim_map = ((2 * mu_x * mu_y + c1) * (2 * sigma_xy + c2)) / ((mu_x ** 2 + mu_y ** 2 + c1) * (sigma_x + sigma_y + c2))
+    return ssim_map.flatten(1).mean(dim=1)
+
+
+def gradient_error(output: torch.Tensor, target: torch.Tensor) -> torch.Tensor:
+    """Mean L1 distance between Sobel gradient magnitudes (the training GradientLoss, per image)."""
+    return (sobel_gradient_magnitude(output) - sobel_gradient_magnitude(target)).abs().flatten(1).mean(dim=1)
+
+
+def compute_all(output: torch.Tensor, target: torch.Tensor) -> dict:
+    """Returns {"psnr", "ssim", "grad_error"} as lists of floats, one entry per image."""
+    with torch.no_grad():
+        return {
+            "psnr": psnr(output, target).tolist(),
+            "ssim": ssim(output, target).tolist(),
+            "grad_error": gradient_error(output, target).tolist(),
+        }
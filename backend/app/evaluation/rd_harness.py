@@ -0,0 +1,271 @@
+# backend/app/evaluation/rd_harness.py
+"""
+Rate-distortion and speed evaluation of COSMIC against classic codecs.
+
+    python -m app.evaluation.rd_harness --images /path/to/images --weights models/ml_model --out reports/rd
+
+Each image is resized to the model input size, then compressed by:
+  * cosmic        - deterministic encode, quantized latent (app.models.ml.latent_codec), single decode
+  * cosmic_mc     - same latent, decoder run with MC dropout (mean of --mc-samples passes)
+  * jpeg / webp / jpeg2000 (Pillow) - quality searched to match the COSMIC bitrate per image,
+                    plus an optional fixed quality ladder for the full frontier
+PSNR, SSIM and Sobel gradient error are computed in batches with torch; codec work runs in a
+process pool. Results are written to <out>.csv (one row per image x method) and <out>.json (rows + means).
+"""
+import argparse
+import csv
+import io
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional
+
+import numpy as np
+import torch
+from PIL import Image, features
+
+from app.evaluation import metrics
+from app.models.ml.autoencoder import enable_dropout, load_dropout_autoencoder
+from app.models.ml.latent_codec import encode_latent, decode_latent
+from app.training.dataset import find_images
+from app.utils.image_utils import load_image_for_model
+from app.utils.logger import setup_logger
+
+logger = setup_logger("rd_harness")
+
+
+def available_codecs() -> List[str]:
+    codecs = ["jpeg"]
+    if features.check("webp"):
+        codecs.append("webp")
+    if features.check("jpg_2000"):
+        codecs.append("jpeg2000")
+    return codecs
+
+
+def _load(args) -> Optional[np.ndarray]:
+    path, size = args
+    try:
+        img = load_image_for_model(path, (size, size)).resize((size, size), Image.BILINEAR)
+        return np.asarray(img, dtype=np.uint8)
+    except Exception as e:
+        logger.warning(f"Skipping {path}: {e}")
+        return None
+
+
+def _encode_with(img: Image.Image, codec: str, quality: float) -> bytes:
+    buffer = io.BytesIO()
+    if codec == "jpeg":
+        img.save(buffer, format="JPEG", quality=int(quality))
+    elif codec == "webp":
+        img.save(buffer, format="WEBP", quality=int(quality), method=4)
+    elif codec == "jpeg2000":
+        # quality is a target compression ratio for JPEG 2000
+        img.save(buffer, format="JPEG2000", quality_mode="rates", quality_layers=[quality])
+    else:
+        raise ValueError(f"Unknown codec {codec}")
+    return buffer.getvalue()
+
+
+def _run_codec(img: Image.Image, codec: str, quality: float) -> dict:
+    start = time.perf_counter()
+    data = _encode_with(img, codec, quality)
+    encode_s = time.perf_counter() - start
+    start = time.perf_counter()
+    decoded = np.asarray(Image.open(io.BytesIO(data)).convert("RGB"), dtype=np.uint8)
+    decode_s = time.perf_counter() - start
+    return {
+        "method": codec, "quality": quality, "bytes": len(data),
+        "bpp": len(data) * 8 / (img.width * img.height),
+        "encode_ms": encode_s * 1000, "decode_ms": decode_s * 1000, "decoded": decoded,
+    }
+
+
+def _match_bitrate(img: Image.Image, codec: str, target_bpp: float) -> dict:
+    """Returns the codec run whose bpp is closest to target_bpp without exceeding it when possible."""
+    pixels = img.width * img.height
+    if codec == "jpeg2000":
+        # Rate control is native: ratio = uncompressed bits / target bits
+        return _run_codec(img, codec, max(1.0, 24.0 / target_bpp))
+    lo, hi = 1, 95
+    best = _run_codec(img, codec, lo)
+    while lo <= hi:  # Binary search on the integer quality knob
+        mid = (lo + hi) // 2
+        result = _run_codec(img, codec, mid)
+        if result["bytes"] * 8 / pixels <= target_bpp:
+            best = result
+            lo = mid + 1
+        else:
+            hi = mid - 1
+    return best
+
+
+def _codec_worker(args) -> List[dict]:
+    """Process-pool task: all codec runs for one image."""
+    index, pixels, codecs, target_bpp, ladder = args
+    img = Image.fromarray(pixels)
+    runs = []
+    for codec in codecs:
+        matched = _match_bitrate(img, codec, target_bpp)
+        matched["matched"] = True
+        runs.append(matched)
+        for quality in ladder.get(codec, []):
+            run = _run_codec(img, codec, quality)
+            run["matched"] = False
+            runs.append(run)
+    for run in runs:
+        run["index"] = index
+    return runs
+
+
+def _cosmic_runs(model, batch: torch.Tensor, bits: int, mc_samples: int) -> List[List[dict]]:
+    """Encodes/decodes a batch through the autoencoder; returns per-image [cosmic, cosmic_mc] runs."""
+    batch_size, _, height, width = batch.shape
+
+    model.eval()  # Deterministic encoder (as it would run onboard)
+    with torch.no_grad():
+        start = time.perf_counter()
+        latents = model.encoder(batch).cpu().numpy()
+        streams = [encode_latent(latent, bits=bits, image_size=(height, width)) for latent in latents]
+        encode_ms = (time.perf_counter() - start) * 1000 / batch_size
+
+        start = time.perf_counter()
+        decoded_latents = torch.from_numpy(np.stack([decode_latent(s)[0] for s in streams])).to(batch.device)
+        single = model.decoder(decoded_latents)
+        decode_ms = (time.perf_counter() - start) * 1000 / batch_size
+
+        enable_dropout(model.decoder)  # MC on the ground-side decoder only
+        start = time.perf_counter()
+        mc_mean = torch.zeros_like(single)
+        for _ in range(mc_samples):
+            mc_mean += model.decoder(decoded_latents)
+        mc_mean /= mc_samples
+        mc_decode_ms = (time.perf_counter() - start) * 1000 / batch_size
+        model.eval()
+
+    per_image = []
+    for i, stream in enumerate(streams):
+        bpp = len(stream) * 8 / (height * width)
+        per_image.append([
+            {"method": "cosmic", "quality": bits, "bytes": len(stream), "bpp": bpp,
+             "encode_ms": encode_ms, "decode_ms": decode_ms, "output": single[i]},
+            {"method": "cosmic_mc", "quality": bits, "bytes": len(stream), "bpp": bpp,
+             "encode_ms": encode_ms, "decode_ms": mc_decode_ms, "output": mc_mean[i]},
+        ])
+    return per_image
+
+
+def _to_tensor(pixels: np.ndarray) -> torch.Tensor:
+    return torch.from_numpy(pixels).permute(2, 0, 1).float().div_(255.0)
+
+
+def _finalize(runs: List[dict], targets: torch.Tensor, names: List[str]) -> List[dict]:
+    """Computes metrics for a list of runs (each with 'index' and 'output') in one batched call."""
+    outputs = torch.stack([r.pop("output") for r in runs]).float().cpu()
+    refs = targets[[r["index"] for r in runs]]
+    scores = metrics.compute_all(outputs, refs)
+    for i, run in enumerate(runs):
+        run["image"] = names[run.pop("index")]
+        run.update({name: values[i] for name, values in scores.items()})
+    return runs
+
+
+def evaluate(args) -> dict:
+    device = torch.device(args.device or ("cuda" if torch.cuda.is_available() else "cpu"))
+    paths = find_images(args.images)[: args.limit or None]
+    if not paths:
+        raise ValueError(f"No images found in {args.images}")
+
+    codecs = [c for c in args.codecs.split(",") if c] if args.codecs else available_codecs()
+    ladder = {"jpeg": [10, 30, 50, 75, 90], "webp": [10, 30, 50, 75, 90], "jpeg2000": [200, 100, 50, 20, 10]}
+    ladder = {c: ladder[c] for c in codecs} if args.ladder else {}
+
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        loaded = list(pool.map(_load, [(p, args.size) for p in paths], chunksize=8))
+        kept = [(p, arr) for p, arr in zip(paths, loaded) if arr is not None]
+        names = [os.path.basename(p) for p, _ in kept]
+        targets = torch.stack([_to_tensor(arr) for _, arr in kept])
+        logger.info(f"Evaluating {len(kept)} images at {args.size}px on {device}; codecs: {codecs}")
+
+        model = load_dropout_autoencoder(args.weights, args.dropout, map_location=device)
+        model.to(device)
+
+        rows = []
+        target_bpp = []
+        for start in range(0, len(kept), args.batch_size):
+            batch = targets[start:start + args.batch_size].to(device)
+            batch_runs = []
+            for offset, image_runs in enumerate(_cosmic_runs(model, batch, args.bits, args.mc_samples)):
+                for run in image_runs:
+                    run["index"] = start + offset
+                    run["matched"] = True
+                batch_runs.extend(image_runs)
+                target_bpp.append(image_runs[0]["bpp"])
+            rows.extend(_finalize(batch_runs, targets, names))
+
+        # Baselines in parallel across images, matched to each image's COSMIC bitrate
+        tasks = [(i, arr, codecs, target_bpp[i], ladder) for i, (_, arr) in enumerate(kept)]
+        codec_runs = []
+        for image_runs in pool.map(_codec_worker, tasks):
+            for run in image_runs:
+                run["output"] = _to_tensor(run.pop("decoded"))
+            codec_runs.extend(image_runs)
+        for start in range(0, len(codec_runs), args.batch_size * 4):
+            rows.extend(_finalize(codec_runs[start:start + args.batch_size * 4], targets, names))
+
+    summary = {}
+    for row in rows:
+        if not row["matched"]:
+            continue
+        entry = summary.setdefault(row["method"], {"n": 0})
+        entry["n"] += 1
+        for key in ("bpp", "psnr", "ssim", "grad_error", "encode_ms", "decode_ms"):
+            entry[key] = entry.get(key, 0.0) + row[key]
+    for entry in summary.values():
+        for key in entry:
+            if key != "n":
+                entry[key] /= entry["n"]
+
+    report = {
+        "config": {"images": len(kept), "size": args.size, "bits": args.bits, "mc_samples": args.mc_samples,
+                   "device": str(device), "codecs": codecs},
+        "summary_matched": summary,
+        "rows": rows,
+    }
+    _write_report(args.out, report)
+    logger.info(f"Matched-bitrate summary: {json.dumps(summary)}")
+    return report
+
+
+def _write_report(out_prefix: str, report: dict):
+    os.makedirs(os.path.dirname(out_prefix) or ".", exist_ok=True)
+    fields = ["image", "method", "matched", "quality", "bytes", "bpp", "psnr", "ssim", "grad_error", "encode_ms", "decode_ms"]
+    with open(f"{out_prefix}.csv", "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=fields, extrasaction="ignore")
+        writer.writeheader()
+        writer.writerows(report["rows"])
+    with open(f"{out_prefix}.json", "w") as f:
+        json.dump(report, f, indent=2)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rate-distortion/speed comparison of COSMIC against classic codecs.")
+    parser.add_argument("--images", required=True, help="Directory of evaluation images (recursive)")
+    parser.add_argument("--weights", default="models/ml_model", help="DropoutAutoencoder weights")
+    parser.add_argument("--out", default="reports/rd", help="Output prefix for .csv and .json")
+    parser.add_argument("--size", type=int, default=512, help="Square model input size")
+    parser.add_argument("--bits", type=int, default=8, help="Latent quantization bits (1-8)")
+    parser.add_argument("--mc-samples", type=int, default=30, help="Decoder MC passes for cosmic_mc")
+    parser.add_argument("--dropout", type=float, default=0.25)
+    parser.add_argument("--codecs", default=None, help="Comma-separated subset of jpeg,webp,jpeg2000 (default: all available)")
+    parser.add_argument("--ladder", action="store_true", help="Also run a fixed quality ladder per codec")
+    parser.add_argument("--batch-size", type=int, default=8)
+    parser.add_argument("--workers", type=int, default=None, help="Process pool size (default: CPU count)")
+    parser.add_argument("--limit", type=int, default=0, help="Evaluate at most this many images")
+    parser.add_argument("--device", default=None)
+    evaluate(parser.parse_args())
+
+
+if __name__ == "__main__":
+    main()
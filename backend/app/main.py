@@ -1,17 +1,26 @@
 # backend/app/main.py
+import asyncio
+from pathlib import Path
+import torch
 from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
+from app.utils.http_cache import ImmutableStaticFiles
 from fastapi.responses import JSONResponse
 from app.config.settings import get_settings # Corrected import path
-from app.api.v1.endpoints import files # Corrected import path
+from app.api.v1.endpoints import files, models # Corrected import path
 from app.database.base import engine, Base # Import Base
 from app.models import file as file_model # Import the models module
 from app.utils.logger import setup_logger # Import logger
+from app.services.model_registry import get_model_registry
+from app.services.storage_lifecycle import get_storage_lifecycle
+from app.services.inference_workers import get_inference_workers
+from app.api.v1.endpoints.files import get_file_service
 from app.utils.exceptions import ( # Import custom exceptions
-     FileProcessingError, ModelError, CustomFileNotFoundError,
-     InvalidFileTypeError, FileTooLargeError
+     FileProcessingError, ModelError,
+     InvalidFileTypeError, FileTooLargeError, ImageTooLargeError, ModelNotFoundError,
+     ServiceOverloadedError
 )
+from app.utils.exceptions import FileNotFoundError as CustomFileNotFoundError
 from fastapi import HTTPException # Import standard HTTPException
 
 # Initialize logger
@@ -68,6 +77,31 @@ async def file_too_large_exception_handler(request: Request, exc: FileTooLargeEr
         content={"detail": exc.detail},
     )
 
+@app.exception_handler(ImageTooLargeError)
+async def image_too_large_exception_handler(request: Request, exc: ImageTooLargeError):
+    logger.warning(f"Image too large: {exc.detail}")
+    return JSONResponse(
+        status_code=exc.status_code,
+        content={"detail": exc.detail},
+    )
+
+@app.exception_handler(ModelNotFoundError)
+async def model_not_found_exception_handler(request: Request, exc: ModelNotFoundError):
+    logger.warning(f"Model not found: {exc.detail}")
+    return JSONResponse(
+        status_code=exc.status_code,
+        content={"detail": exc.detail},
+    )
+
+@app.exception_handler(ServiceOverloadedError)
+async def service_overloaded_exception_handler(request: Request, exc: ServiceOverloadedError):
+    logger.warning(f"Request shed: {exc.detail}")
+    return JSONResponse(
+        status_code=exc.status_code,
+        content={"detail": exc.detail},
+        headers=exc.headers, # Carries Retry-After
+    )
+
 @app.exception_handler(FileProcessingError)
 async def file_processing_exception_handler(request: Request, exc: FileProcessingError):
     logger.error(f"File processing error: {exc.detail}", exc_info=True) # Log stack trace
@@ -122,13 +156,30 @@ else:
 upload_dir_path = Path(settings.UPLOAD_DIR)
 upload_dir_path.mkdir(parents=True, exist_ok=True)
 logger.info(f"Mounting static directory '{settings.UPLOAD_DIR}' at URL '{settings.STATIC_URL}'")
-app.mount(settings.STATIC_URL, StaticFiles(directory=settings.UPLOAD_DIR), name="static_uploads")
+# Saved uploads are never rewritten in place, so browsers may cache them indefinitely
+app.mount(
+    settings.STATIC_URL,
+    ImmutableStaticFiles(directory=settings.UPLOAD_DIR, max_age=settings.STATIC_CACHE_MAX_AGE),
+    name="static_uploads"
+)
+
+
+# Tile pyramids: URLs embed the result version, so tiles are immutable as well
+Path(settings.TILE_DIR).mkdir(parents=True, exist_ok=True)
+logger.info(f"Mounting tile directory '{settings.TILE_DIR}' at URL '{settings.TILES_URL}'")
+app.mount(
+    settings.TILES_URL,
+    ImmutableStaticFiles(directory=settings.TILE_DIR, max_age=settings.STATIC_CACHE_MAX_AGE),
+    name="tiles"
+)
 
 
 # --- API Routers ---
 # Include API router
 logger.info(f"Including API router at prefix '{settings.API_V1_STR}/files'")
 app.include_router(files.router, prefix=f"{settings.API_V1_STR}/files", tags=["Files & Processing"])
+logger.info(f"Including API router at prefix '{settings.API_V1_STR}/models'")
+app.include_router(models.router, prefix=f"{settings.API_V1_STR}/models", tags=["Models"])
 
 
 # --- Root Endpoint ---
@@ -142,14 +193,42 @@ def read_root():
         "redoc_url": app.redoc_url
     }
 
-# --- Optional: Add startup/shutdown events ---
+# --- Readiness ---
+@app.get("/ready")
+def readiness():
+    """200 once the default model is loaded and warmed up, 503 before that (or if loading failed)."""
+    registry = get_model_registry()
+    if registry.ready:
+        return {"status": "ready", "model_version": registry.default_version, "warmup_ms": registry.warmup_ms}
+    return JSONResponse(
+        status_code=503,
+        content={"status": "failed" if registry.ready_error else "starting", "detail": registry.ready_error},
+    )
+
+# --- Startup/shutdown events ---
 @app.on_event("startup")
 async def startup_event():
-     logger.info("Application startup complete.")
-     # You could initialize ML model here instead of in service __init__
-     # if you want it loaded only once globally. Requires careful state management.
+     if settings.TORCH_NUM_THREADS:
+         # Avoid oversubscribing cores when several workers share a host
+         torch.set_num_threads(settings.TORCH_NUM_THREADS)
+     # Process-lifetime services: the registry loads the default model once (memory-mapped weights)
+     registry = get_model_registry()
+     get_file_service()
+     # Load + warm up off the event loop; /ready reports 503 until this finishes
+     app.state.warmup_task = asyncio.get_running_loop().run_in_executor(None, registry.warm_up)
+     if settings.LIFECYCLE_ENABLED:
+         get_storage_lifecycle().start()
+     workers = get_inference_workers()
+     if workers is not None:
+         # Spawn workers (each loads its model) now rather than on the first job
+         workers.start()
+     logger.info("Application startup complete; model warm-up running in background.")
 
 @app.on_event("shutdown")
 async def shutdown_event():
      logger.info("Application shutting down.")
+     get_storage_lifecycle().stop()
+     workers = get_inference_workers()
+     if workers is not None:
+         workers.shutdown() # Also unlinks the shared-memory slabs
      # Add cleanup tasks here if needed
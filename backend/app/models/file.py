@@ -1,52 +1,18 @@
-# backend/app/schemas/file.py
-from pydantic import BaseModel, Field
-from typing import Optional, Dict, Any, List
-from datetime import datetime
+# backend/app/models/file.py
+from sqlalchemy import Column, DateTime, Integer, JSON, String, func
 
-# Base schema for file properties identifiable upon upload
-class FileBase(BaseModel):
-    filename: str
-    file_type: Optional[str] = None # Made optional, can be inferred
+from app.database.base import Base
 
-# Schema for creating a file record (used internally by service)
-class FileUploadCreate(FileBase):
-    file_path: str # Path where the file is saved
 
-# Schema representing the full file record in the database
-class FileRecord(FileBase):
-    id: int
-    file_path: str
-    status: str = Field(..., description="Processing status: pending, processing, completed, failed")
-    processing_result: Optional[Dict[str, Any]] = Field(None, description="Stores ML results (e.g., base64 images) or error message")
-    created_at: datetime
-    updated_at: Optional[datetime] = None
+class FileUpload(Base):
+    """An uploaded image and the outcome of its background processing."""
+    __tablename__ = "file_uploads"
 
-    class Config:
-        from_attributes = True # Pydantic V2 way to enable ORM mode
-
-# Schema for the response when listing files or getting a single file's details
-class FileDetailResponse(BaseModel):
-    id: int
-    filename: str
-    file_type: Optional[str] = None
-    status: str
-    created_at: datetime
-    updated_at: Optional[datetime] = None
-    # Optionally include a URL to the original file if needed
-    original_file_url: Optional[str] = None
-
-# Schema for the response containing processing results
-class FileProcessingResultResponse(BaseModel):
-    id: int
-    filename: str
-    status: str
-    mean_reconstruction_b64: Optional[str] = None
-    uncertainty_map_b64: Optional[str] = None
-    error: Optional[str] = None # Include error message if status is 'failed'
-
-# Schema for the basic response after uploading a file (gives ID for status checks)
-class FileUploadResponse(BaseModel):
-    message: str
-    file_id: int
-    filename: str
-    status: str # Initial status ('pending')
+    id = Column(Integer, primary_key=True, index=True)
+    filename = Column(String, nullable=False) # Stored (unique) name inside UPLOAD_DIR
+    file_path = Column(String, nullable=False) # Absolute path of the saved upload
+    file_type = Column(String, nullable=True) # Sniffed MIME type
+    status = Column(String, nullable=False, default="pending", index=True) # pending, processing, completed, failed
+    processing_result = Column(JSON, nullable=True) # Result images/metadata or the error message
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
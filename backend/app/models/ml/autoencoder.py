@@ -4,9 +4,13 @@ import torch.nn as nn
 
 class DropoutAutoencoder(nn.Module):
     # Using the architecture from your initial prompt
-    def __init__(self, dropout_p=0.25): # Default dropout, can be adjusted if needed
+    DOWNSAMPLE_FACTOR = 64  # Six stride-2 encoder blocks; inputs/crops should be multiples of this
+
+    def __init__(self, dropout_p=0.25, bottleneck_channels=512): # Default dropout, can be adjusted if needed
         super(DropoutAutoencoder, self).__init__()
         self.dropout_p = dropout_p
+        # 512 for the app's checkpoints; the training notebook's variant used 256
+        self.bottleneck_channels = bottleneck_channels
 
         # --- Encoder ---
         # Input: (B, 3, 512, 512)
@@ -37,17 +41,17 @@ class DropoutAutoencoder(nn.Module):
             nn.Dropout(self.dropout_p),
 
             # Block 6 - Bottleneck Layer
-            nn.Conv2d(512, 512, kernel_size=3, stride=2, padding=1), # (B, 512, 8, 8) <- Make sure this matches your trained model
+            nn.Conv2d(512, bottleneck_channels, kernel_size=3, stride=2, padding=1), # (B, bottleneck_channels, 8, 8) <- Must match the checkpoint
             nn.ReLU(inplace=True),
             # Optional: Dropout right at the bottleneck too
             # nn.Dropout(self.dropout_p),
         )
 
         # --- Decoder ---
-        # Input: (B, 512, 8, 8)
+        # Input: (B, bottleneck_channels, 8, 8)
         self.decoder = nn.Sequential(
             # Block 1
-            nn.ConvTranspose2d(512, 512, kernel_size=3, stride=2, padding=1, output_padding=1), # (B, 512, 16, 16)
+            nn.ConvTranspose2d(bottleneck_channels, 512, kernel_size=3, stride=2, padding=1, output_padding=1), # (B, 512, 16, 16)
             nn.ReLU(inplace=True),
             nn.Dropout(self.dropout_p),
 
@@ -81,6 +85,17 @@ class DropoutAutoencoder(nn.Module):
         decoded = self.decoder(encoded)
         return decoded
 
+def load_dropout_autoencoder(path, dropout_p=0.25, map_location="cpu"):
+    """
+    DropoutAutoencoder with weights from a weights-only checkpoint. The bottleneck width is read
+    from the checkpoint (decoder.0.weight is (bottleneck_channels, 512, 3, 3)), so the app's
+    512-channel and the notebook's 256-channel models both load.
+    """
+    state_dict = torch.load(path, map_location=map_location)
+    model = DropoutAutoencoder(dropout_p=dropout_p, bottleneck_channels=state_dict["decoder.0.weight"].shape[0])
+    model.load_state_dict(state_dict)
+    return model
+
 def enable_dropout(model):
     """Sets dropout layers to train mode (needed for Monte Carlo Dropout)."""
     logger.info("Enabling dropout layers for Monte Carlo inference.")
@@ -91,6 +106,41 @@ def enable_dropout(model):
         # else: # Debug print
             # print(f"Layer {m} is not dropout, keeping eval mode")
 
+def mc_dropout_moments(model, input_tensor, num_samples):
+    """
+    Runs num_samples stochastic forward passes (dropout must already be enabled) and
+    returns the running (mean, M2) over them, each shaped like one model output.
+    Uses Welford's update, so memory does not grow with num_samples.
+    """
+    mean = None
+    m2 = None
+    with torch.no_grad():
+        for i in range(num_samples):
+            pred = model(input_tensor)
+            if mean is None:
+                mean = torch.zeros_like(pred)
+                m2 = torch.zeros_like(pred)
+            delta = pred - mean
+            mean += delta / (i + 1)
+            m2 += delta * (pred - mean)
+    return mean, m2
+
+def merge_moments(n_a, mean_a, m2_a, n_b, mean_b, m2_b):
+    """
+    Combines two sets of (count, mean, M2) statistics (Chan et al. parallel update).
+    Counts may be ints or tensors broadcastable against the means.
+    """
+    n = n_a + n_b
+    delta = mean_b - mean_a
+    mean = mean_a + delta * (n_b / n)
+    m2 = m2_a + m2_b + delta ** 2 * (n_a * n_b / n)
+    return n, mean, m2
+
+def mc_dropout_predict(model, input_tensor, num_samples):
+    """Returns (mean, variance) over num_samples MC dropout passes."""
+    mean, m2 = mc_dropout_moments(model, input_tensor, num_samples)
+    return mean, m2 / num_samples  # Population variance (matches unbiased=False)
+
 # Add logger for the enable_dropout function if needed
 from app.utils.logger import setup_logger
 logger = setup_logger("autoencoder_model")
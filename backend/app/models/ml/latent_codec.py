@@ -0,0 +1,125 @@
+# backend/app/models/ml/latent_codec.py
+"""
+Compressed latent format for DropoutAutoencoder bottleneck tensors.
+
+Layout (little-endian):
+    magic     4s   b"CSLT"
+    version   B    1
+    bits      B    quantization bits per value (1-8)
+    channels  H    latent C
+    height    H    latent H
+    width     H    latent W
+    img_h     H    original model-input height
+    img_w     H    original model-input width
+    lo, hi    2f   dequantization range
+    payload   ...  zlib(bit-packed quantized values, C*H*W*bits bits)
+
+Delta frames (sequence mode) code the difference to the previous frame's reconstructed latent:
+    magic     4s   b"CSLD"
+    version   B    1
+    bits      B    bits per signed code (2-8); codes are clipped to +-(2**(bits-1) - 1)
+    channels, height, width, img_h, img_w   5H
+    step      f    quantization step (delta = code * step)
+    payload   ...  zlib(int8 codes); static regions quantize to runs of zeros
+
+Only depends on numpy/struct/zlib so it can be shared with lightweight decoders.
+"""
+import struct
+import zlib
+from typing import Tuple
+
+import numpy as np
+
+MAGIC = b"CSLT"
+DELTA_MAGIC = b"CSLD"
+VERSION = 1
+_HEADER = struct.Struct("<4sBBHHHHHff")
+_DELTA_HEADER = struct.Struct("<4sBBHHHHHf")
+
+
+def quantization_step(bits: int, lo: float, hi: float) -> float:
+    """Step size of quantize() for the given range; sequence deltas reuse the keyframe's step."""
+    return (hi - lo) / ((1 << bits) - 1) if hi > lo else 1.0
+
+
+def quantize(latent: np.ndarray, bits: int) -> Tuple[np.ndarray, float, float]:
+    """Uniformly quantizes a float array to [0, 2**bits - 1]; returns (uint8 codes, lo, hi)."""
+    if not 1 <= bits <= 8:
+        raise ValueError(f"bits must be in 1..8, got {bits}")
+    lo, hi = float(latent.min()), float(latent.max())
+    levels = (1 << bits) - 1
+    scale = quantization_step(bits, lo, hi)
+    codes = np.clip(np.rint((latent - lo) / scale), 0, levels).astype(np.uint8)
+    return codes, lo, hi
+
+
+def dequantize(codes: np.ndarray, bits: int, lo: float, hi: float) -> np.ndarray:
+    scale = quantization_step(bits, lo, hi)
+    return (codes.astype(np.float32) * scale + lo).astype(np.float32)
+
+
+def _pack(codes: np.ndarray, bits: int) -> bytes:
+    # Keep the low `bits` bits of each code, MSB first, then pack 8 per byte
+    bit_matrix = np.unpackbits(codes.reshape(-1, 1), axis=1)[:, 8 - bits:]
+    return np.packbits(bit_matrix.reshape(-1)).tobytes()
+
+
+def _unpack(payload: bytes, bits: int, count: int) -> np.ndarray:
+    bit_stream = np.unpackbits(np.frombuffer(payload, dtype=np.uint8))[:count * bits]
+    bit_matrix = np.zeros((count, 8), dtype=np.uint8)
+    bit_matrix[:, 8 - bits:] = bit_stream.reshape(count, bits)
+    return np.packbits(bit_matrix, axis=1).reshape(-1)
+
+
+def encode_latent(latent: np.ndarray, bits: int = 8, image_size: Tuple[int, int] = (0, 0), level: int = 9) -> bytes:
+    """Serializes a (C, H, W) float latent to the compressed format."""
+    channels, height, width = latent.shape
+    codes, lo, hi = quantize(latent, bits)
+    header = _HEADER.pack(MAGIC, VERSION, bits, channels, height, width, image_size[0], image_size[1], lo, hi)
+    return header + zlib.compress(_pack(codes, bits), level)
+
+
+def decode_latent(data: bytes) -> Tuple[np.ndarray, dict]:
+    """Parses the compressed format; returns ((C, H, W) float32 latent, header info dict)."""
+    magic, version, bits, channels, height, width, img_h, img_w, lo, hi = _HEADER.unpack_from(data)
+    if magic != MAGIC:
+        raise ValueError("Not a COSMIC latent stream (bad magic)")
+    if version != VERSION:
+        raise ValueError(f"Unsupported latent format version {version}")
+    count = channels * height * width
+    codes = _unpack(zlib.decompress(data[_HEADER.size:]), bits, count)
+    latent = dequantize(codes, bits, lo, hi).reshape(channels, height, width)
+    return latent, {"bits": bits, "image_size": (img_h, img_w), "range": (lo, hi)}
+
+
+def quantize_delta(delta: np.ndarray, step: float, bits: int) -> np.ndarray:
+    """Uniform signed quantization with a fixed step; returns int8 codes."""
+    if not 2 <= bits <= 8:
+        raise ValueError(f"delta bits must be in 2..8, got {bits}")
+    limit = (1 << (bits - 1)) - 1
+    return np.clip(np.rint(delta / step), -limit, limit).astype(np.int8)
+
+
+def encode_latent_delta(delta: np.ndarray, step: float, bits: int = 6, image_size: Tuple[int, int] = (0, 0),
+                        level: int = 9) -> bytes:
+    """Serializes a (C, H, W) latent difference as a delta frame."""
+    channels, height, width = delta.shape
+    codes = quantize_delta(delta, step, bits)
+    header = _DELTA_HEADER.pack(DELTA_MAGIC, VERSION, bits, channels, height, width, image_size[0], image_size[1], step)
+    return header + zlib.compress(codes.tobytes(), level)
+
+
+def decode_latent_delta(data: bytes) -> Tuple[np.ndarray, dict]:
+    """Parses a delta frame; returns ((C, H, W) float32 delta, header info dict)."""
+    magic, version, bits, channels, height, width, img_h, img_w, step = _DELTA_HEADER.unpack_from(data)
+    if magic != DELTA_MAGIC:
+        raise ValueError("Not a COSMIC latent delta frame (bad magic)")
+    if version != VERSION:
+        raise ValueError(f"Unsupported latent delta format version {version}")
+    codes = np.frombuffer(zlib.decompress(data[_DELTA_HEADER.size:]), dtype=np.int8)
+    delta = (codes.astype(np.float32) * step).reshape(channels, height, width)
+    return delta, {"bits": bits, "image_size": (img_h, img_w), "step": step}
+
+
+def is_delta_frame(data: bytes) -> bool:
+    return data[:4] == DELTA_MAGIC
@@ -0,0 +1,34 @@
+# backend/app/models/ml/losses.py
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+
+# Sobel kernels (shape (1, 1, 3, 3)), shared by the training loss and evaluation metrics
+SOBEL_X = torch.tensor([[-1., 0., 1.], [-2., 0., 2.], [-1., 0., 1.]]).view(1, 1, 3, 3)
+SOBEL_Y = torch.tensor([[-1., -2., -1.], [0., 0., 0.], [1., 2., 1.]]).view(1, 1, 3, 3)
+
+
+def sobel_gradient_magnitude(images: torch.Tensor, epsilon: float = 1e-6) -> torch.Tensor:
+    """
+    Per-channel Sobel gradient magnitude of a (B, C, H, W) batch, same shape as the input.
+    Uses a single depthwise convolution for both directions.
+    """
+    channels = images.shape[1]
+    kernels = torch.cat([SOBEL_X, SOBEL_Y], dim=0).to(device=images.device, dtype=images.dtype)  # (2, 1, 3, 3)
+    kernels = kernels.repeat(channels, 1, 1, 1)  # (2C, 1, 3, 3): x/y pair per channel
+    grads = F.conv2d(images, kernels, padding=1, groups=channels)  # (B, 2C, H, W)
+    grad_x, grad_y = grads[:, 0::2], grads[:, 1::2]
+    return torch.sqrt(grad_x ** 2 + grad_y ** 2 + epsilon)
+
+
+class GradientLoss(nn.Module):
+    """L1 loss between the Sobel gradient magnitudes of the output and target images."""
+
+    def __init__(self, epsilon: float = 1e-6):
+        super(GradientLoss, self).__init__()
+        self.epsilon = epsilon  # Numerical stability in sqrt
+
+    def forward(self, output: torch.Tensor, target: torch.Tensor) -> torch.Tensor:
+        grad_out = sobel_gradient_magnitude(output, self.epsilon)
+        grad_target = sobel_gradient_magnitude(target, self.epsilon)
+        return F.l1_loss(grad_out, grad_target)
@@ -0,0 +1,117 @@
+# backend/app/models/ml/mc_sampling.py
+import hashlib
+import math
+import os
+import struct
+import threading
+from contextlib import contextmanager
+
+import torch
+import torch.nn as nn
+
+# "native" leaves nn.Dropout alone (independent, unseeded masks); the others replace its masks
+STRATEGIES = ("native", "iid", "antithetic", "stratified", "quasi")
+_GOLDEN = (math.sqrt(5) - 1) / 2
+
+_local = threading.local()  # Active schedule per thread: models are shared between concurrent jobs
+_install_lock = threading.Lock()
+
+
+class MaskSchedule:
+    """
+    Dropout masks from per-element uniforms u, keeping an element when u >= p. Every pass's mask is
+    exactly Bernoulli(1 - p) per element, so MC estimates stay unbiased; the strategies differ only
+    in how masks are correlated across passes:
+
+    - iid: independent masks from a seeded bank indexed by (pass, layer), i.e. reproducible.
+    - antithetic: passes 2k and 2k + 1 use u and 1 - u, so the pair's masks are negatively correlated.
+    - stratified: within each block of `block` passes an element's uniforms are a randomly shifted
+      grid, one per 1/block stratum, so it is kept in (1 - p) * block passes up to rounding.
+    - quasi: randomly shifted golden-ratio (Weyl) sequence; every prefix is low-discrepancy, so it
+      stays stratified when the total number of passes is not known up front (top-up).
+
+    The pass index advances when a layer fires a second time, i.e. once per forward pass, whatever
+    the caller (full-image MC, tile crops, triage batches). offset starts the bank further along so a
+    top-up with the same seed never replays masks its stored samples already used.
+    """
+
+    def __init__(self, strategy: str, block: int, seed: int = None, offset: int = 0):
+        if strategy not in STRATEGIES or strategy == "native":
+            raise ValueError(f"Unknown mask strategy '{strategy}' (expected one of {', '.join(STRATEGIES[1:])})")
+        self.strategy = strategy
+        self.block = max(1, int(block))
+        self.seed = seed if seed is not None else int.from_bytes(os.urandom(8), "little") >> 1
+        self.pass_index = offset
+        self._fired = set()
+
+    def _base(self, key, layer, shape, device):
+        generator = torch.Generator(device=device)
+        # Derived with blake2b, not hash(): the seed must be identical across restarts and worker processes
+        block, index = key if isinstance(key, tuple) else (0, key)  # Stratified blocks are >= 1, so no overlap
+        packed = struct.pack("<QBQQQ", self.seed & 0xFFFFFFFFFFFFFFFF, STRATEGIES.index(self.strategy),
+                             block, index, layer)
+        generator.manual_seed(int.from_bytes(hashlib.blake2b(packed, digest_size=8).digest(), "little") >> 1)
+        return torch.rand(shape, generator=generator, device=device)
+
+    def uniforms(self, layer: int, shape, device) -> torch.Tensor:
+        if layer in self._fired:
+            self.pass_index += 1
+            self._fired.clear()
+        self._fired.add(layer)
+        i = self.pass_index
+        if self.strategy == "iid":
+            return self._base(i, layer, shape, device)
+        if self.strategy == "antithetic":
+            base = self._base(i // 2, layer, shape, device)
+            return base if i % 2 == 0 else 1.0 - base
+        if self.strategy == "stratified":
+            # Block size is part of the key, so blocks of different sizes never share a shift
+            base = self._base((self.block, i // self.block), layer, shape, device)
+            return torch.frac(base + (i % self.block) / self.block)
+        return torch.frac(self._base(0, layer, shape, device) + (i * _GOLDEN) % 1.0)
+
+
+def _dropout_hook(layer: int):
+    def hook(module, inputs, output):
+        schedule = getattr(_local, "schedule", None)
+        if schedule is None or not module.training or module.p <= 0:
+            return None  # Keep nn.Dropout's own output
+        x = inputs[0]  # Dropout is not in-place here, so its input is intact
+        keep = schedule.uniforms(layer, x.shape, x.device) >= module.p
+        return x * keep.to(x.dtype) * (1.0 / (1.0 - module.p))
+    return hook
+
+
+def install_mask_hooks(model: nn.Module):
+    """
+    Registers forward hooks on the model's nn.Dropout layers (once per model). The hooks are
+    no-ops unless a schedule is active on the calling thread, so other jobs sharing the model keep
+    native dropout. The discarded native mask costs one elementwise op per layer, negligible next
+    to the convolutions.
+    """
+    with _install_lock:
+        if getattr(model, "_mask_hooks_installed", False):
+            return
+        dropout_layers = [m for m in model.modules() if isinstance(m, nn.Dropout)]
+        for layer, module in enumerate(dropout_layers):
+            module.register_forward_hook(_dropout_hook(layer))
+        model._mask_hooks_installed = True
+
+
+@contextmanager
+def mask_schedule(model: nn.Module, strategy: str, num_samples: int, seed: int = None, offset: int = 0):
+    """
+    MC dropout passes through `model` on this thread inside the block use `strategy` masks
+    (see MaskSchedule); num_samples sets the stratification block. "native" is a no-op.
+    """
+    if strategy == "native":
+        yield None
+        return
+    schedule = MaskSchedule(strategy, num_samples, seed, offset)
+    install_mask_hooks(model)
+    previous = getattr(_local, "schedule", None)
+    _local.schedule = schedule
+    try:
+        yield schedule
+    finally:
+        _local.schedule = previous
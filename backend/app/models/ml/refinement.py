@@ -0,0 +1,244 @@
+# backend/app/models/ml/refinement.py
+import math
+from collections import defaultdict
+
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+
+from app.models.ml.autoencoder import mc_dropout_moments, merge_moments
+from app.utils.logger import setup_logger
+
+logger = setup_logger("mc_refinement")
+
+
+def receptive_radius(model):
+    """
+    Largest distance in input pixels between an output pixel and any input pixel it depends on,
+    from the model's Conv2d / ConvTranspose2d layers in registration (= forward) order. Computed
+    exactly by mapping output positions back through every layer, so asymmetric reach of strided
+    transposed convolutions is included. Cached on the model.
+    """
+    cached = getattr(model, "_receptive_radius", None)
+    if cached is not None:
+        return cached
+    layers = [m for m in model.modules() if isinstance(m, (nn.Conv2d, nn.ConvTranspose2d))]
+    period = math.prod(m.stride[0] for m in layers if not isinstance(m, nn.ConvTranspose2d))
+    radius = 0
+    for position in range(2 * period):  # Dependencies repeat with the total stride
+        lo, hi = position, position
+        for m in reversed(layers):
+            span, stride, padding = m.dilation[0] * (m.kernel_size[0] - 1), m.stride[0], m.padding[0]
+            if isinstance(m, nn.ConvTranspose2d):
+                lo, hi = -(-(lo + padding - span) // stride), (hi + padding) // stride
+            else:
+                lo, hi = lo * stride - padding, hi * stride - padding + span
+        radius = max(radius, position - lo, hi - position)
+    model._receptive_radius = radius
+    return radius
+
+
+def resolve_context(model, context, align):
+    """
+    Crop border for tile refinement: 0/None derives it from the model's receptive field (rounded up
+    to align); an explicit context smaller than the receptive field is rejected, because crop edges
+    would then reach the tile and its statistics would no longer match a full-frame pass (seams).
+    """
+    radius = receptive_radius(model)
+    required = math.ceil(radius / align) * align
+    if not context:
+        return required
+    if context < radius:
+        raise ValueError(f"Refinement context {context}px is smaller than the model's receptive field "
+                         f"radius ({radius}px); use at least {required} or 0 for automatic")
+    return context
+
+
+def select_uncertain_tiles(variance, tile_size, threshold):
+    """
+    Scores (tile_size x tile_size) tiles of a (1, C, H, W) variance map by mean uncertainty and
+    returns [(tile_y, tile_x), ...] for tiles above threshold * the image mean, highest first.
+    """
+    uncertainty = variance.mean(dim=1, keepdim=True)  # (1, 1, H, W)
+    tile_scores = F.avg_pool2d(uncertainty, tile_size, stride=tile_size, ceil_mode=True)[0, 0]
+    cutoff = threshold * uncertainty.mean()
+    candidates = (tile_scores > cutoff).nonzero(as_tuple=False)
+    if candidates.numel() == 0:
+        return []
+    scores = tile_scores[candidates[:, 0], candidates[:, 1]]
+    order = scores.argsort(descending=True)
+    return [tuple(candidates[i].tolist()) for i in order]
+
+
+def _crop_box(core, context, height, width):
+    y0, x0, y1, x1 = core
+    return max(y0 - context, 0), max(x0 - context, 0), min(y1 + context, height), min(x1 + context, width)
+
+
+def _area(box):
+    return (box[2] - box[0]) * (box[3] - box[1])
+
+
+def plan_windows(tiles, tile_size, context, height, width):
+    """
+    Groups (tile_y, tile_x) tiles into shared crop windows. Returns [(core, crop), ...] with boxes as
+    (y0, x0, y1, x1) pixels: core is the region whose statistics are kept (a bounding box of tiles),
+    crop is core + context clipped to the image, so crops at the border see the same zero padding as
+    a full-frame pass. Touching tiles share one window, and two windows are merged whenever one crop
+    around both costs no more than their two crops, so overlapping contexts are not recomputed.
+    """
+    tile_set = set(tiles)
+    parent = {tile: tile for tile in tile_set}
+
+    def find(tile):
+        while parent[tile] != tile:
+            parent[tile] = parent[parent[tile]]
+            tile = parent[tile]
+        return tile
+
+    for ty, tx in tile_set:
+        for dy in (-1, 0, 1):
+            for dx in (-1, 0, 1):
+                neighbour = (ty + dy, tx + dx)
+                if neighbour in tile_set:
+                    parent[find(neighbour)] = find((ty, tx))
+
+    components = defaultdict(list)
+    for tile in tile_set:
+        components[find(tile)].append(tile)
+    cores = []
+    for members in components.values():
+        ys, xs = [ty for ty, _ in members], [tx for _, tx in members]
+        cores.append((min(ys) * tile_size, min(xs) * tile_size,
+                      min((max(ys) + 1) * tile_size, height), min((max(xs) + 1) * tile_size, width)))
+
+    merged = True
+    while merged:
+        merged = False
+        for i in range(len(cores)):
+            for j in range(i + 1, len(cores)):
+                a, b = cores[i], cores[j]
+                union = (min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3]))
+                if _area(_crop_box(union, context, height, width)) <= (
+                        _area(_crop_box(a, context, height, width)) + _area(_crop_box(b, context, height, width))):
+                    cores[i] = union
+                    del cores[j]
+                    merged = True
+                    break
+            if merged:
+                break
+    return [(core, _crop_box(core, context, height, width)) for core in cores]
+
+
+def windows_cost(windows):
+    """Input pixels processed per MC pass over these windows (compare with H * W for a full pass)."""
+    return sum(_area(crop) for _, crop in windows)
+
+
+def mc_window_moments(model, input_tensor, windows, num_samples, crop_batch_size=16):
+    """
+    Runs num_samples MC passes on the crops of plan_windows() windows of a (1, C, H, W) input,
+    batching crops of equal shape. Yields (region, mean, M2) per window, where region indexes the
+    core in full-image tensors and mean/M2 are the matching slices of the crop statistics.
+    """
+    by_shape = defaultdict(list)
+    for core, crop in windows:
+        by_shape[(crop[2] - crop[0], crop[3] - crop[1])].append((core, crop))
+
+    for same_shape in by_shape.values():
+        for start in range(0, len(same_shape), crop_batch_size):
+            batch_windows = same_shape[start:start + crop_batch_size]
+            crops = torch.cat([input_tensor[:, :, cy0:cy1, cx0:cx1] for _, (cy0, cx0, cy1, cx1) in batch_windows], dim=0)
+            crop_mean, crop_m2 = mc_dropout_moments(model, crops, num_samples)
+
+            for i, ((y0, x0, y1, x1), (cy0, cx0, _, _)) in enumerate(batch_windows):
+                region = (slice(None), slice(None), slice(y0, y1), slice(x0, x1))
+                crop_region = (slice(i, i + 1), slice(None), slice(y0 - cy0, y1 - cy0), slice(x0 - cx0, x1 - cx0))
+                yield region, crop_mean[crop_region], crop_m2[crop_region]
+
+
+def _budget_windows(tiles, tile_size, context, height, width, budget):
+    """Windows for the longest highest-first prefix of tiles costing at most budget (at least one tile)."""
+    lo, hi = 1, len(tiles)
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if windows_cost(plan_windows(tiles[:mid], tile_size, context, height, width)) <= budget:
+            lo = mid
+        else:
+            hi = mid - 1
+    return plan_windows(tiles[:lo], tile_size, context, height, width), lo
+
+
+def refined_mc_moments(
+    model,
+    input_tensor,
+    total_samples,
+    pilot_samples,
+    tile_size=64,
+    context=None,
+    threshold=1.5,
+    max_fraction=0.25,
+    align=64,
+    crop_batch_size=16,
+):
+    """
+    Two-phase MC dropout for a (1, C, H, W) input. Returns (counts, mean, M2): per-pixel sample
+    counts shaped (1, 1, H, W) plus the running moments, ready for merge_moments.
+
+    1. Pilot: pilot_samples full-image passes locate high-variance tiles.
+    2. Refinement: the remaining (total_samples - pilot_samples) passes run only on shared crop
+       windows around those tiles (plan_windows); each window's statistics are merged into the
+       pilot ones.
+
+    Cost is measured in crop pixels, not tiles: the most uncertain tiles are refined while their
+    windows stay within max_fraction of a full pass. If windows for all candidate tiles would cost
+    a full pass or more, the remaining passes run on the full frame instead. Pixels outside refined
+    windows keep pilot_samples-sample estimates. context defaults to the model's receptive field
+    (resolve_context); tile_size and context must be multiples of align (the model's downsampling
+    factor) so crops see the same conv grid.
+    """
+    context = resolve_context(model, context, align)
+    if tile_size % align or context % align:
+        raise ValueError(f"tile_size ({tile_size}) and context ({context}) must be multiples of {align}")
+
+    _, _, height, width = input_tensor.shape
+    extra_samples = total_samples - pilot_samples
+    if extra_samples <= 0 or height % align or width % align:
+        logger.info("Refinement not applicable for this input/configuration; running plain MC.")
+        mean, m2 = mc_dropout_moments(model, input_tensor, total_samples)
+        return torch.full_like(mean[:, :1], float(total_samples)), mean, m2
+
+    mean, m2 = mc_dropout_moments(model, input_tensor, pilot_samples)
+    counts = torch.full_like(mean[:, :1], float(pilot_samples))  # (1, 1, H, W) per-pixel sample count
+    tiles = select_uncertain_tiles(m2 / pilot_samples, tile_size, threshold)
+    if not tiles:
+        logger.info("No tiles above the refinement threshold; keeping pilot estimates.")
+        return counts, mean, m2
+
+    frame = height * width
+    windows = plan_windows(tiles, tile_size, context, height, width)
+    if windows_cost(windows) >= frame:
+        logger.info(f"Uncertain area of {len(tiles)} tiles costs a full pass; running {extra_samples} "
+                    f"extra MC samples on the full frame.")
+        extra_mean, extra_m2 = mc_dropout_moments(model, input_tensor, extra_samples)
+        return merge_moments(counts, mean, m2, extra_samples, extra_mean, extra_m2)
+
+    refined = len(tiles)
+    if windows_cost(windows) > max_fraction * frame:
+        windows, refined = _budget_windows(tiles, tile_size, context, height, width, max_fraction * frame)
+    num_tiles = math.ceil(height / tile_size) * math.ceil(width / tile_size)
+    logger.info(f"Refining {refined}/{num_tiles} tiles ({len(tiles)} above threshold) in {len(windows)} windows "
+                f"with {extra_samples} extra MC samples; crop cost {windows_cost(windows) / frame:.2f} of a full pass.")
+    for region, window_mean, window_m2 in mc_window_moments(model, input_tensor, windows, extra_samples,
+                                                            crop_batch_size):
+        n, merged_mean, merged_m2 = merge_moments(counts[region], mean[region], m2[region],
+                                                  extra_samples, window_mean, window_m2)
+        counts[region], mean[region], m2[region] = n, merged_mean, merged_m2
+
+    return counts, mean, m2
+
+
+def refined_mc_predict(model, input_tensor, total_samples, pilot_samples, **kwargs):
+    """refined_mc_moments reduced to (mean, variance), like mc_dropout_predict."""
+    counts, mean, m2 = refined_mc_moments(model, input_tensor, total_samples, pilot_samples, **kwargs)
+    return mean, m2 / counts
@@ -0,0 +1,63 @@
+# backend/app/models/ml/sequence.py
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+
+from app.models.ml.autoencoder import mc_dropout_moments
+from app.models.ml.refinement import mc_window_moments, plan_windows, resolve_context, windows_cost
+from app.utils.logger import setup_logger
+
+logger = setup_logger("mc_sequence")
+
+
+def deterministic_latent(model, input_tensor):
+    """
+    Bottleneck latent of a DropoutAutoencoder with dropout skipped, so identical frames give
+    identical latents. Layers are applied one by one instead of toggling dropout to eval mode,
+    because the model instance is shared with concurrently running MC jobs.
+    """
+    hidden = input_tensor
+    with torch.no_grad():
+        for layer in model.encoder:
+            if not isinstance(layer, (nn.Dropout, nn.Dropout2d)):
+                hidden = layer(hidden)
+    return hidden
+
+
+def changed_latent_cells(delta, threshold):
+    """
+    (C, H, W) latent difference -> (H, W) bool map of cells where any channel moved more than
+    threshold, grown by one cell because the decoder spreads each latent over its neighbours.
+    """
+    changed = (delta.abs().amax(dim=0) > threshold).float()
+    return F.max_pool2d(changed[None, None], kernel_size=3, stride=1, padding=1)[0, 0] > 0
+
+
+def sequence_mc_predict(model, input_tensor, num_samples, changed_cells, prev_mean, prev_variance,
+                        cell_size=64, context=None, crop_batch_size=16):
+    """
+    MC dropout for one (1, C, H, W) frame of a sequence, reusing the previous frame's statistics.
+
+    changed_cells is the (h, w) latent-cell change map (one cell covers cell_size x cell_size input
+    pixels). Static cells copy the previous frame's statistics; changed cells get num_samples passes
+    on shared crop windows (refinement.plan_windows), with context defaulting to the model's
+    receptive field. When those crops would cost as much as a full pass, the whole frame is
+    resampled instead.
+    Returns (mean, variance, resampled cell count).
+    """
+    _, _, height, width = input_tensor.shape
+    context = resolve_context(model, context, cell_size)
+    cells = [tuple(cell) for cell in changed_cells.nonzero(as_tuple=False).tolist()]
+    windows = plan_windows(cells, cell_size, context, height, width)
+    if windows_cost(windows) >= height * width:
+        mean, m2 = mc_dropout_moments(model, input_tensor, num_samples)
+        return mean, m2 / num_samples, changed_cells.numel()
+
+    mean, variance = prev_mean.clone(), prev_variance.clone()
+    resampled = torch.zeros_like(changed_cells, dtype=torch.bool)
+    for region, window_mean, window_m2 in mc_window_moments(model, input_tensor, windows, num_samples,
+                                                            crop_batch_size):
+        mean[region], variance[region] = window_mean, window_m2 / num_samples
+        rows, cols = region[2], region[3]
+        resampled[rows.start // cell_size:-(-rows.stop // cell_size), cols.start // cell_size:-(-cols.stop // cell_size)] = True
+    return mean, variance, int(resampled.sum())
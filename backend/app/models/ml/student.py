@@ -0,0 +1,65 @@
+# backend/app/models/ml/student.py
+import torch
+import torch.nn as nn
+
+
+def _down(in_ch, out_ch):
+    return [nn.Conv2d(in_ch, out_ch, kernel_size=3, stride=2, padding=1), nn.ReLU(inplace=True)]
+
+
+def _up(in_ch, out_ch):
+    return [nn.ConvTranspose2d(in_ch, out_ch, kernel_size=3, stride=2, padding=1, output_padding=1), nn.ReLU(inplace=True)]
+
+
+class MeanVarianceStudent(nn.Module):
+    """
+    Deterministic student distilled from DropoutAutoencoder's MC statistics.
+    One forward pass returns (mean reconstruction, per-pixel variance), both (B, 3, H, W),
+    replacing T stochastic passes of the teacher.
+    """
+
+    # Log-variance clamp keeps exp() finite early in training
+    LOGVAR_MIN = -20.0
+    LOGVAR_MAX = 2.0
+
+    def __init__(self, width=64):
+        super(MeanVarianceStudent, self).__init__()
+        w = width
+
+        # --- Encoder --- same downsampling schedule as the teacher, no dropout
+        # Input: (B, 3, 512, 512)
+        self.encoder = nn.Sequential(
+            *_down(3, w),          # (B, 64, 256, 256)
+            *_down(w, w * 2),      # (B, 128, 128, 128)
+            *_down(w * 2, w * 4),  # (B, 256, 64, 64)
+            *_down(w * 4, w * 8),  # (B, 512, 32, 32)
+            *_down(w * 8, w * 8),  # (B, 512, 16, 16)
+            *_down(w * 8, w * 8),  # (B, 512, 8, 8) bottleneck
+        )
+
+        # --- Shared decoder trunk ---
+        self.decoder = nn.Sequential(
+            *_up(w * 8, w * 8),    # (B, 512, 16, 16)
+            *_up(w * 8, w * 8),    # (B, 512, 32, 32)
+            *_up(w * 8, w * 4),    # (B, 256, 64, 64)
+            *_up(w * 4, w * 2),    # (B, 128, 128, 128)
+            *_up(w * 2, w),        # (B, 64, 256, 256)
+        )
+
+        # --- Heads --- (B, 3, 512, 512) each
+        self.mean_head = nn.Sequential(
+            nn.ConvTranspose2d(w, 3, kernel_size=3, stride=2, padding=1, output_padding=1),
+            nn.Sigmoid()  # Pixels in [0, 1], like the teacher
+        )
+        self.logvar_head = nn.ConvTranspose2d(w, 3, kernel_size=3, stride=2, padding=1, output_padding=1)
+
+    def forward_logvar(self, x):
+        """Returns (mean, log-variance); used for training where log space is better conditioned."""
+        features = self.decoder(self.encoder(x))
+        mean = self.mean_head(features)
+        logvar = torch.clamp(self.logvar_head(features), self.LOGVAR_MIN, self.LOGVAR_MAX)
+        return mean, logvar
+
+    def forward(self, x):
+        mean, logvar = self.forward_logvar(x)
+        return mean, torch.exp(logvar)
@@ -0,0 +1,38 @@
+# backend/app/models/ml/triage.py
+import torch
+
+# Order of the statistics in the per-tile grids returned by tile_uncertainty_stats
+TILE_STATS = ("mean", "max", "percentile")
+
+
+def tile_uncertainty_stats(variance, tile_size, percentile):
+    """
+    Summarises a per-pixel uncertainty map over a grid of square tiles.
+
+    variance: (B, H, W) tensor with H and W multiples of tile_size.
+    Returns (B, 3, rows, cols) holding each tile's mean, max and percentile (0-100) value, in TILE_STATS order.
+    """
+    b, h, w = variance.shape
+    if h % tile_size or w % tile_size:
+        raise ValueError(f"Uncertainty map {h}x{w} is not a multiple of the {tile_size}px triage tile")
+    rows, cols = h // tile_size, w // tile_size
+    tiles = (
+        variance.reshape(b, rows, tile_size, cols, tile_size)
+        .permute(0, 1, 3, 2, 4)
+        .reshape(b, rows, cols, tile_size * tile_size)
+        .float()
+    )
+    return torch.stack([
+        tiles.mean(dim=-1),
+        tiles.amax(dim=-1),
+        torch.quantile(tiles, percentile / 100.0, dim=-1),
+    ], dim=1)
+
+
+def frame_scores(tile_stats):
+    """
+    Frame-level triage score: the highest per-tile percentile value, so a frame with one badly
+    reconstructed region ranks above a frame that is uniformly slightly uncertain.
+    tile_stats: (B, 3, rows, cols) from tile_uncertainty_stats. Returns (B,).
+    """
+    return tile_stats[:, TILE_STATS.index("percentile")].flatten(1).amax(dim=1)
@@ -1,5 +1,5 @@
-from pydantic import BaseModel
-from typing import Optional, Dict, Any
+from pydantic import BaseModel, ConfigDict
+from typing import Optional, Dict, Any, List
 from datetime import datetime
 
 class FileUploadBase(BaseModel):
@@ -28,4 +28,65 @@ class ProcessingResult(BaseModel):
 class FileResponse(BaseModel):
     """Schema for file response."""
     filename: str
-    url: str 
\ No newline at end of file
+    url: str
+
+# Schema for the basic response after uploading a file (gives ID for status checks)
+class FileUploadResponse(BaseModel):
+    message: str
+    file_id: int
+    filename: str
+    status: str # Initial status ('pending')
+
+# Schema for the response when listing files or getting a single file's details
+class FileDetailResponse(BaseModel):
+    id: int
+    filename: str
+    file_type: Optional[str] = None
+    status: str
+    created_at: datetime
+    updated_at: Optional[datetime] = None
+    # Optionally include a URL to the original file if needed
+    original_file_url: Optional[str] = None
+    # Level-0 tile of the original's deep-zoom pyramid (available once processed)
+    thumbnail_url: Optional[str] = None
+
+# Schema for the response containing processing results
+class FileProcessingResultResponse(BaseModel):
+    id: int
+    filename: str
+    status: str
+    mean_reconstruction_b64: Optional[str] = None
+    uncertainty_map_b64: Optional[str] = None
+    error: Optional[str] = None # Include error message if status is 'failed'
+    # Deep-zoom pyramid descriptor URLs by layer (original, mean, uncertainty)
+    tiles: Optional[Dict[str, str]] = None
+
+# Triage: rank many files by uncertainty without rendering result images
+class TriageRequest(BaseModel):
+    model_config = ConfigDict(protected_namespaces=()) # Allow the model_version field
+    file_ids: List[int]
+    model_version: Optional[str] = None
+    samples: Optional[int] = None # MC passes per image (defaults to TRIAGE_MC_SAMPLES)
+    format: str = "json" # "json" or "npz" (binary arrays)
+
+class TriageFrameResponse(BaseModel):
+    file_id: int
+    score: float # Highest per-tile percentile value; results are sorted by it, descending
+    mean: float # Mean uncertainty over the frame
+    rows: int
+    cols: int
+    # Row-major per-tile statistics, rows * cols values each
+    tile_mean: List[float]
+    tile_max: List[float]
+    tile_percentile: List[float]
+
+class TriageResponse(BaseModel):
+    model_config = ConfigDict(protected_namespaces=())
+    model_version: str
+    samples: int
+    input_size: int
+    tile_size: int
+    percentile: float
+    frames: List[TriageFrameResponse]
+    missing: List[int] = [] # IDs with no file record
+    errors: Dict[int, str] = {} # IDs whose image could not be loaded
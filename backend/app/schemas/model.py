@@ -0,0 +1,21 @@
+from pydantic import BaseModel, Field
+from typing import Optional, List
+
+class ModelSpec(BaseModel):
+    """Describes one registered checkpoint (an entry of the model registry manifest)."""
+    version: str
+    path: str
+    arch: str = Field("dropout_autoencoder", description="dropout_autoencoder or student")
+    bottleneck_channels: int = 512
+    dropout_p: float = 0.25
+    input_size: int = 512
+    sha256: Optional[str] = Field(None, description="Expected weight hash; verified on load when set")
+
+class ModelInfoResponse(ModelSpec):
+    resident: bool = False
+    is_default: bool = False
+
+class ModelRegistryResponse(BaseModel):
+    default_version: Optional[str] = None
+    max_resident: int
+    models: List[ModelInfoResponse]
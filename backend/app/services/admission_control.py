@@ -0,0 +1,318 @@
+# backend/app/services/admission_control.py
+import asyncio
+import functools
+import math
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+from app.config.settings import get_settings
+from app.utils.logger import setup_logger
+from app.utils.exceptions import ServiceOverloadedError
+
+settings = get_settings()
+logger = setup_logger("admission_control")
+
+
+def estimate_job_bytes(input_size: int) -> int:
+    """Rough peak memory of one inference job: activations scale with model-input pixels."""
+    return input_size * input_size * settings.JOB_MEMORY_PER_PIXEL_BYTES + settings.JOB_MEMORY_OVERHEAD_MB * 1024 * 1024
+
+
+def _percentile(values: List[float], q: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(math.ceil(q * len(ordered))) - 1)]
+
+
+def _round(value: Optional[float]) -> Optional[float]:
+    return None if value is None else round(value, 3)
+
+
+class JobTicket:
+    """Admission record for one processing job, from admit() until the job finishes."""
+
+    def __init__(self, client_id: str, est_bytes: int, lane: str, deadline_s: float):
+        self.client_id = client_id
+        self.est_bytes = est_bytes
+        self.lane = lane
+        self.admitted_at = time.monotonic()
+        self.deadline = self.admitted_at + deadline_s
+        self.started_at: Optional[float] = None
+        self.released = False
+
+
+class LaneStats:
+    """Counters and a sliding window of wait / end-to-end latencies for one priority lane."""
+
+    def __init__(self, name: str, weight: float, deadline_s: float, queue_share: float, window: int):
+        self.name = name
+        self.weight = max(float(weight), 1e-3)
+        self.deadline_s = float(deadline_s)
+        self.queue_share = queue_share
+        self.waiting: List[JobTicket] = []
+        self.admitted = 0  # Admitted and not yet started (includes jobs whose background task is pending)
+        self.running = 0
+        self.completed = 0
+        self.rejected = 0
+        self.deadline_misses = 0
+        self.pass_value = 0.0  # Stride-scheduling virtual time; advances 1/weight per dispatched job
+        self.wait_s = deque(maxlen=window)
+        self.latency_s = deque(maxlen=window)
+
+    def snapshot(self) -> dict:
+        latency = list(self.latency_s)
+        p95 = _percentile(latency, 0.95)
+        return {
+            "weight": self.weight,
+            "deadline_seconds": self.deadline_s,
+            "queued": self.admitted,
+            "running": self.running,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "deadline_misses": self.deadline_misses,
+            "wait_p50_seconds": _round(_percentile(list(self.wait_s), 0.5)),
+            "wait_p95_seconds": _round(_percentile(list(self.wait_s), 0.95)),
+            "latency_p50_seconds": _round(_percentile(latency, 0.5)),
+            "latency_p95_seconds": _round(p95),
+            "within_deadline_p95": None if p95 is None else p95 <= self.deadline_s,
+        }
+
+
+class AdmissionController:
+    """
+    Capacity model and scheduler for background inference work.
+
+    Tracks queued and in-flight jobs, their estimated memory and per-client counts. admit() rejects
+    work beyond MAX_QUEUED_JOBS (scaled by the lane's queue_share, so a backfill cannot fill the
+    queue ahead of interactive requests), MAX_JOBS_MEMORY_MB or MAX_JOBS_PER_CLIENT with a 429 whose
+    Retry-After comes from the observed service time.
+
+    Admitted jobs run through the coroutine run(), which caps concurrent inference at
+    MAX_CONCURRENT_JOBS and picks the next job whenever a slot frees:
+      1. any waiting job whose deadline is within one expected service time is urgent; the earliest
+         deadline wins (deadline-aware, and the aging mechanism: bulk deadlines come due eventually);
+      2. otherwise lanes share slots by weight (stride scheduling), earliest deadline first within a lane.
+    Queued jobs wait on the event loop; only dispatched jobs occupy a thread, from a pool of
+    MAX_CONCURRENT_JOBS threads, so a long queue never exhausts the server's threadpool.
+    """
+
+    def __init__(self):
+        self.max_queued = settings.MAX_QUEUED_JOBS
+        self.max_concurrent = max(1, settings.MAX_CONCURRENT_JOBS)
+        self.max_memory_bytes = settings.MAX_JOBS_MEMORY_MB * 1024 * 1024
+        self.max_per_client = settings.MAX_JOBS_PER_CLIENT
+        self.default_lane = settings.DEFAULT_PRIORITY
+        self._lock = threading.Lock()  # State is also read from threads (snapshot, release after errors)
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._slot_freed: Optional[asyncio.Event] = None  # Replaced by a fresh event on every wake-up
+        self._executor = ThreadPoolExecutor(max_workers=self.max_concurrent, thread_name_prefix="inference-job")
+        self._queued = 0
+        self._inflight = 0
+        self._reserved_bytes = 0
+        self._per_client: Dict[str, int] = {}
+        self._lanes: Dict[str, LaneStats] = {
+            name: LaneStats(name, cfg.get("weight", 1), cfg.get("deadline_s", 60.0), cfg.get("queue_share", 1.0),
+                            settings.LANE_LATENCY_WINDOW)
+            for name, cfg in settings.PRIORITY_LANES.items()
+        }
+        # Exponentially weighted moving average of job run time, seeded from settings
+        self._ewma_service_s = float(settings.JOB_SERVICE_TIME_ESTIMATE_S)
+        self._ewma_alpha = 0.2
+        self.rejected = 0
+        self.completed = 0
+
+    @property
+    def lanes(self) -> List[str]:
+        return list(self._lanes)
+
+    def _retry_after(self, excess_jobs: int) -> int:
+        """Seconds until roughly excess_jobs jobs have drained at the current concurrency."""
+        return max(1, math.ceil(self._ewma_service_s * max(1, excess_jobs) / self.max_concurrent))
+
+    def admit(self, client_id: str, est_bytes: int, priority: Optional[str] = None,
+              deadline_s: Optional[float] = None) -> JobTicket:
+        """
+        Reserves capacity for a job in a priority lane or raises ServiceOverloadedError (429 + Retry-After).
+        deadline_s overrides the lane's default completion target. Unknown lanes raise ValueError.
+        """
+        lane_name = priority or self.default_lane
+        lane = self._lanes.get(lane_name)
+        if lane is None:
+            raise ValueError(f"Unknown priority '{lane_name}'. Choose one of: {', '.join(self._lanes)}")
+
+        with self._lock:
+            backlog = self._queued + self._inflight
+            lane_limit = max(1, int(self.max_queued * lane.queue_share))
+            client_jobs = self._per_client.get(client_id, 0)
+            reason = None
+            if backlog >= lane_limit:
+                reason, retry_after = f"processing queue is full for {lane_name} jobs", self._retry_after(backlog - lane_limit + 1)
+            elif self._reserved_bytes + est_bytes > self.max_memory_bytes:
+                reason, retry_after = "processing memory budget exhausted", self._retry_after(1)
+            elif client_jobs >= self.max_per_client:
+                reason, retry_after = f"client has {client_jobs} jobs pending", self._retry_after(1)
+            if reason:
+                self.rejected += 1
+                lane.rejected += 1
+                logger.warning(f"Rejecting {lane_name} job from {client_id}: {reason} (Retry-After {retry_after}s)")
+                raise ServiceOverloadedError(reason, retry_after)
+
+            self._queued += 1
+            lane.admitted += 1
+            self._reserved_bytes += est_bytes
+            self._per_client[client_id] = client_jobs + 1
+            return JobTicket(client_id, est_bytes, lane_name, lane.deadline_s if deadline_s is None else deadline_s)
+
+    def release(self, ticket: JobTicket):
+        """Returns a ticket's reservation (idempotent). Call directly if the job is never scheduled."""
+        with self._lock:
+            if ticket.released:
+                return
+            ticket.released = True
+            lane = self._lanes[ticket.lane]
+            if ticket.started_at is None:
+                self._queued -= 1
+                lane.admitted -= 1
+                if ticket in lane.waiting:
+                    lane.waiting.remove(ticket)
+            else:
+                self._inflight -= 1
+                lane.running -= 1
+            self._reserved_bytes -= ticket.est_bytes
+            remaining = self._per_client.get(ticket.client_id, 1) - 1
+            if remaining > 0:
+                self._per_client[ticket.client_id] = remaining
+            else:
+                self._per_client.pop(ticket.client_id, None)
+        self._notify_waiters()
+
+    def _notify_waiters(self):
+        """Wakes every run() waiting for a slot; safe to call from any thread."""
+        loop = self._loop
+        if loop is not None and not loop.is_closed():
+            loop.call_soon_threadsafe(self._wake)
+
+    def _wake(self):
+        # Runs on the event loop. Waiters hold the old event; the swap means a later wait cannot miss this
+        event, self._slot_freed = self._slot_freed, asyncio.Event()
+        event.set()
+
+    # --- Scheduling (callers hold self._lock) ---
+
+    def _next_ticket(self, now: float) -> Optional[JobTicket]:
+        """The waiting job that should take the next free slot."""
+        urgent = [t for lane in self._lanes.values() for t in lane.waiting if t.deadline - now <= self._ewma_service_s]
+        if urgent:
+            return min(urgent, key=lambda t: t.deadline)
+        active = [lane for lane in self._lanes.values() if lane.waiting]
+        if not active:
+            return None
+        lane = min(active, key=lambda l: (l.pass_value, -l.weight))
+        return min(lane.waiting, key=lambda t: t.deadline)
+
+    def _enqueue(self, ticket: JobTicket):
+        lane = self._lanes[ticket.lane]
+        if not lane.waiting and lane.running == 0:
+            # A lane returning from idle must not cash in the slots it did not use while idle
+            busy = [l.pass_value for l in self._lanes.values() if l.waiting or l.running]
+            if busy:
+                lane.pass_value = max(lane.pass_value, min(busy))
+        lane.waiting.append(ticket)
+
+    def _dispatch(self, ticket: JobTicket, now: float):
+        lane = self._lanes[ticket.lane]
+        lane.waiting.remove(ticket)
+        lane.pass_value += 1.0 / lane.weight
+        lane.admitted -= 1
+        lane.running += 1
+        lane.wait_s.append(now - ticket.admitted_at)
+        self._queued -= 1
+        self._inflight += 1
+        ticket.started_at = now
+
+    async def _wait_for_slot(self, ticket: JobTicket) -> bool:
+        """Queues the ticket and waits on the event loop until it is dispatched (False if released first)."""
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop, self._slot_freed = loop, asyncio.Event()
+        with self._lock:
+            if ticket.released:
+                return False
+            self._enqueue(ticket)
+        try:
+            while True:
+                with self._lock:
+                    if ticket.released:
+                        return False
+                    now = time.monotonic()
+                    if self._inflight < self.max_concurrent and self._next_ticket(now) is ticket:
+                        self._dispatch(ticket, now)
+                        break
+                    slot_freed = self._slot_freed
+                try:
+                    # Deadlines turn jobs urgent as time passes, so re-evaluate periodically as well
+                    await asyncio.wait_for(slot_freed.wait(), timeout=1.0)
+                except asyncio.TimeoutError:
+                    pass
+        except BaseException:
+            self.release(ticket)  # Cancelled while queued (e.g. shutdown): give the reservation back
+            raise
+        # Another waiter may also be eligible if more than one slot is free
+        self._wake()
+        return True
+
+    async def run(self, ticket: JobTicket, func, *args, **kwargs):
+        """
+        Runs an admitted job once the scheduler gives it a slot, then releases its reservation.
+        Waiting happens on the event loop; func (blocking) runs in one of the controller's job threads.
+        """
+        if not await self._wait_for_slot(ticket):
+            return None
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, functools.partial(func, *args, **kwargs))
+        finally:
+            finished = time.monotonic()
+            with self._lock:
+                lane = self._lanes[ticket.lane]
+                self._ewma_service_s += self._ewma_alpha * (finished - ticket.started_at - self._ewma_service_s)
+                self.completed += 1
+                lane.completed += 1
+                lane.latency_s.append(finished - ticket.admitted_at)
+                if finished > ticket.deadline:
+                    lane.deadline_misses += 1
+            self.release(ticket)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "queued": self._queued,
+                "in_flight": self._inflight,
+                "reserved_memory_mb": round(self._reserved_bytes / (1024 * 1024), 1),
+                "max_queued": self.max_queued,
+                "max_concurrent": self.max_concurrent,
+                "max_memory_mb": self.max_memory_bytes // (1024 * 1024),
+                "clients": len(self._per_client),
+                "avg_service_seconds": round(self._ewma_service_s, 3),
+                "completed": self.completed,
+                "rejected": self.rejected,
+                "default_priority": self.default_lane,
+                "lanes": {name: lane.snapshot() for name, lane in self._lanes.items()},
+            }
+
+
+_controller: Optional[AdmissionController] = None
+_controller_lock = threading.Lock()
+
+
+def get_admission_controller() -> AdmissionController:
+    """Process-wide admission controller (created on first use)."""
+    global _controller
+    if _controller is None:
+        with _controller_lock:
+            if _controller is None:
+                _controller = AdmissionController()
+    return _controller
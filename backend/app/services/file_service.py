@@ -1,18 +1,25 @@
 # backend/app/services/file_service.py
-from sqlalchemy.orm import Session
-from typing import List, Optional, Dict, Any
+from sqlalchemy.orm import Session, defer
+from typing import List, Optional, Dict, Any, Tuple
+from datetime import datetime
 import os
+import threading
 from pathlib import Path
 from fastapi import UploadFile # Import UploadFile for type hinting
+from PIL import Image
 from app.models.file import FileUpload
 from app.schemas.file import FileUploadCreate, ProcessingResult # Import schemas
 from app.services.ml_service import MLService # Corrected import path
+from app.services.tile_service import TileService
 from app.utils.logger import setup_logger
+from app.utils.http_cache import compute_result_hash
+from app.utils.image_utils import sniff_image_type, read_image_dimensions, SNIFF_BYTES
 from app.utils.exceptions import (
     FileProcessingError,
     FileNotFoundError as CustomFileNotFoundError, # Alias to avoid name clash
     InvalidFileTypeError,
-    FileTooLargeError
+    FileTooLargeError,
+    ImageTooLargeError
 )
 from app.config.settings import get_settings # Import settings
 
@@ -23,19 +30,48 @@ class FileService:
     def __init__(self):
         # Initialize MLService here or pass it if managed elsewhere (e.g., dependency injection)
         self.ml_service = MLService()
+        self.tile_service = TileService()
         self.max_file_size = 50 * 1024 * 1024  # Increased to 50MB for potentially large space images
         self.allowed_types = ["image/jpeg", "image/png", "image/tiff", "image/bmp"] # Added common types
+        self.max_image_pixels = settings.MAX_IMAGE_PIXELS
+        # File IDs with an MC top-up in progress (the status stays 'completed' meanwhile)
+        self._top_ups = set()
+        self._top_up_lock = threading.Lock()
         logger.info(f"File Service initialized. Max size: {self.max_file_size / (1024*1024)}MB, Allowed types: {self.allowed_types}")
 
-    def _validate_file(self, file: UploadFile):
-        """Validates file type and size directly from UploadFile."""
-        if file.content_type not in self.allowed_types:
-            logger.warning(f"Invalid file type uploaded: {file.content_type}. Filename: {file.filename}")
+    def _validate_file(self, file: UploadFile) -> str:
+        """
+        Validates the upload from its content rather than the client-supplied content_type:
+        sniffs magic bytes and reads header-only dimensions against the pixel cap.
+        Returns the detected MIME type.
+        """
+        header = file.file.read(SNIFF_BYTES)
+        file.file.seek(0)
+        detected_type = sniff_image_type(header)
+        if detected_type not in self.allowed_types:
+            logger.warning(f"Invalid file content uploaded (claimed {file.content_type}). Filename: {file.filename}")
             raise InvalidFileTypeError(file.content_type)
+        if file.content_type != detected_type:
+            logger.info(f"Client content type {file.content_type} differs from detected {detected_type} for {file.filename}")
+
+        try:
+            width, height = read_image_dimensions(file.file)
+        except Image.DecompressionBombError as e:
+            # Pillow's own hard limit tripped while parsing the header
+            logger.warning(f"Decompression bomb rejected for {file.filename}: {e}")
+            raise ImageTooLargeError(self.max_image_pixels)
+        except Exception as e:
+            logger.warning(f"Unreadable image header for {file.filename}: {e}")
+            raise InvalidFileTypeError(detected_type)
+
+        if width * height > self.max_image_pixels:
+            logger.warning(f"Image {file.filename} exceeds pixel cap: {width}x{height} > {self.max_image_pixels}")
+            raise ImageTooLargeError(self.max_image_pixels, width, height)
 
         # Check size - This requires reading the file, might be better done after saving
         # For now, we'll rely on potential web server limits or check after saving.
         # A more robust way involves streaming and checking size incrementally.
+        return detected_type
 
     def _validate_saved_file(self, file_path: str, file_type: str):
         """Validates saved file size."""
@@ -100,9 +136,45 @@ class FileService:
         logger.debug(f"Found file record ID: {file_id}, Status: {file.status}")
         return file
 
+    def get_file_version(self, db: Session, file_id: int) -> Tuple[str, Optional[datetime], Optional[str]]:
+        """Returns (status, updated_at, result_hash) without loading the processing_result payload."""
+        row = (
+            db.query(
+                FileUpload.status,
+                FileUpload.updated_at,
+                # Extracted in the DB so the (large) base64 result column is never transferred
+                FileUpload.processing_result["result_hash"].as_string(),
+            )
+            .filter(FileUpload.id == file_id)
+            .first()
+        )
+        if not row:
+            logger.warning(f"File with ID {file_id} not found in database.")
+            raise CustomFileNotFoundError(file_id=file_id)
+        return row[0], row[1], row[2]
+
+    def get_file_paths(self, db: Session, file_ids: List[int]) -> Dict[int, str]:
+        """Maps the given IDs to their stored file paths in one query; unknown IDs are absent."""
+        paths = {}
+        # Chunked to stay under SQLite's bound-parameter limit
+        for start in range(0, len(file_ids), 500):
+            rows = (
+                db.query(FileUpload.id, FileUpload.file_path)
+                .filter(FileUpload.id.in_(file_ids[start:start + 500]))
+                .all()
+            )
+            paths.update({row[0]: row[1] for row in rows})
+        return paths
+
     def list_files(self, db: Session, skip: int = 0, limit: int = 100) -> List[FileUpload]:
         try:
-            files = db.query(FileUpload).order_by(FileUpload.created_at.desc()).offset(skip).limit(limit).all()
+            # Listing never needs the (large) result payload
+            files = (
+                db.query(FileUpload)
+                .options(defer(FileUpload.processing_result))
+                .order_by(FileUpload.created_at.desc())
+                .offset(skip).limit(limit).all()
+            )
             logger.info(f"Retrieved {len(files)} file records (skip={skip}, limit={limit}).")
             return files
         except Exception as e:
@@ -131,8 +203,37 @@ class FileService:
             raise FileProcessingError(f"Database error updating file status: {str(e)}")
 
 
-    def process_file(self, db: Session, file_id: int) -> FileUpload:
-        """Processes the file using the ML service and updates the DB record."""
+    def _build_processing_data(self, file: FileUpload, ml_result: Dict[str, Any]) -> Dict[str, Any]:
+        """Maps a successful ML result to the stored processing_result (and builds its tile pyramids)."""
+        # Store the base64 strings directly, plus a hash used to version the result (ETag)
+        processing_data = {
+            "mean_reconstruction_b64": ml_result["mean_reconstruction_b64"],
+            "uncertainty_map_b64": ml_result["uncertainty_map_b64"],
+            "result_hash": compute_result_hash(
+                ml_result["mean_reconstruction_b64"], ml_result["uncertainty_map_b64"]
+            ),
+            "model_version": ml_result.get("model_version"),
+        }
+        for key in ("sequence", "mc_state"):
+            if ml_result.get(key):
+                processing_data[key] = ml_result[key]
+        # Post-processing: deep-zoom pyramids (tiles are optional, a failure here keeps the result)
+        try:
+            processing_data["tiles"] = self.tile_service.build_for_file(
+                file.id, file.filename, file.file_path,
+                ml_result["mean_reconstruction_image"], ml_result["uncertainty_map_image"],
+                result_version=processing_data["result_hash"][:16],
+            )
+        except FileProcessingError as e:
+            logger.warning(f"Tile pyramids unavailable for file ID {file.id}: {e.detail}")
+        return processing_data
+
+    def process_file(self, db: Session, file_id: int, model_version: Optional[str] = None,
+                     sequence_id: Optional[str] = None) -> FileUpload:
+        """
+        Processes the file using the ML service (default model unless model_version is given) and updates the DB record.
+        With sequence_id the frame is coded against the previous frame of that sequence.
+        """
         file = self.get_file(db, file_id) # Raises CustomFileNotFoundError if not found
 
         if file.status not in ["pending", "failed"]: # Allow reprocessing failed files
@@ -146,15 +247,13 @@ class FileService:
 
         try:
             # Call the ML service
-            ml_result = self.ml_service.process_image(file.file_path)
+            ml_result = self.ml_service.process_image(
+                file.file_path, model_version=model_version, sequence_id=sequence_id, file_id=file_id
+            )
 
             if ml_result["status"] == "success":
                 logger.info(f"ML processing successful for file ID: {file_id}")
-                # Store the base64 strings directly
-                processing_data = {
-                    "mean_reconstruction_b64": ml_result["mean_reconstruction_b64"],
-                    "uncertainty_map_b64": ml_result["uncertainty_map_b64"]
-                }
+                processing_data = self._build_processing_data(file, ml_result)
                 final_status = "completed"
             else:
                 error_msg = ml_result.get("error_message", "Unknown ML error")
@@ -178,6 +277,34 @@ class FileService:
             # Re-raise a generic processing error
             raise FileProcessingError(error_msg)
 
+    def top_up_file(self, db: Session, file_id: int, extra_samples: int) -> FileUpload:
+        """
+        Adds extra_samples MC passes to a completed file, merging them into its stored statistics.
+        The previous result stays visible (status remains 'completed') until the merged one replaces it;
+        if the top-up fails, the previous result is kept.
+        """
+        file = self.get_file(db, file_id) # Raises CustomFileNotFoundError if not found
+        mc_state = (file.processing_result or {}).get("mc_state")
+        if file.status != "completed" or not mc_state:
+            logger.warning(f"File ID {file_id} has no stored MC statistics (status '{file.status}'). Skipping top-up.")
+            return file
+
+        with self._top_up_lock:
+            if file_id in self._top_ups:
+                logger.warning(f"Top-up already running for file ID {file_id}. Skipping.")
+                return file
+            self._top_ups.add(file_id)
+        try:
+            ml_result = self.ml_service.top_up_image(file.file_path, file_id, mc_state, extra_samples)
+            if ml_result["status"] != "success":
+                logger.error(f"MC top-up failed for file ID {file_id}, keeping previous result: {ml_result.get('error_message')}")
+                return file
+            processing_data = self._build_processing_data(file, ml_result)
+            return self.update_file_status(db, file_id, "completed", processing_data)
+        finally:
+            with self._top_up_lock:
+                self._top_ups.discard(file_id)
+
     def delete_file_record(self, db: Session, file_id: int) -> bool:
         """Deletes the file record and the associated file from disk."""
         file = self.get_file(db, file_id) # Raises if not found
@@ -196,6 +323,8 @@ class FileService:
                 except OSError as e:
                     logger.error(f"Error deleting file {file_path} from disk after DB record deletion: {e}")
                     # Decide if this should be considered a failure overall
+            self.tile_service.delete_for_file(file_id)
+            self.ml_service.delete_mc_state(file_id)
             return True
         except Exception as e:
             logger.error(f"Error deleting file record ID {file_id}: {str(e)}", exc_info=True)
@@ -0,0 +1,180 @@
+# backend/app/services/inference_workers.py
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager
+from multiprocessing import get_context
+from typing import Optional
+
+import numpy as np
+import torch
+
+from app.config.settings import get_settings
+from app.utils.exceptions import ModelError, ModelNotFoundError
+from app.utils.logger import setup_logger
+from app.utils.shm_pool import ArrayRef, SlabPool, attach_array, required_bytes
+
+settings = get_settings()
+logger = setup_logger("inference_workers")
+
+# --- Worker process side ---
+
+_worker_service = None
+_in_worker = False
+
+
+def _worker_init(num_threads: int):
+    """Runs once per worker: loads and warms the default model, so jobs never pay for it."""
+    global _worker_service, _in_worker
+    _in_worker = True  # Workers run inference themselves; they never start a pool of their own
+    if num_threads:
+        torch.set_num_threads(num_threads)
+    from app.services.ml_service import MLService
+    from app.services.model_registry import get_model_registry
+
+    registry = get_model_registry()
+    registry.warm_up()
+    _worker_service = MLService(registry)
+
+
+def _worker_ping() -> int:
+    return os.getpid()
+
+
+def _worker_model(spec):
+    """
+    The worker's model for the spec the API process resolved. Workers build their registry once, so
+    a spec they do not know (manifest reloaded in the API since) makes them re-read the manifest.
+    """
+    registry = _worker_service.registry
+    try:
+        current = registry.resolve(spec.version)
+    except ModelNotFoundError:
+        current = None
+    if current != spec:
+        logger.info(f"Worker {os.getpid()}: spec for '{spec.version}' changed; reloading the registry")
+        registry.reload()
+    loaded = registry.get(spec.version)
+    if loaded.spec != spec:
+        raise ModelError(f"Worker registry disagrees with the API about model '{spec.version}'; "
+                         f"reload the registry once the manifest is final")
+    return loaded
+
+
+def _worker_moments(spec, input_ref: ArrayRef, counts_ref: ArrayRef, mean_ref: ArrayRef, m2_ref: ArrayRef) -> dict:
+    """
+    MC sufficient statistics for the input in shared memory, written into the output refs.
+    Students report (counts=1, mean, m2=variance), so the caller handles both the same way.
+    """
+    loaded = _worker_model(spec)
+    img_tensor = torch.from_numpy(attach_array(input_ref)).to(_worker_service.device)
+    if loaded.is_student:
+        with torch.no_grad():
+            mean, m2 = loaded.model(img_tensor)
+        counts = torch.ones_like(mean[:, :1])
+    else:
+        counts, mean, m2 = _worker_service._predict_moments(loaded, img_tensor)
+    for ref, tensor in ((counts_ref, counts), (mean_ref, mean), (m2_ref, m2)):
+        torch.from_numpy(attach_array(ref)).copy_(tensor)
+    return {"model_version": loaded.spec.version, "sha256": loaded.sha256, "pid": os.getpid()}
+
+
+# --- API process side ---
+
+class InferenceWorkerPool:
+    """
+    Runs MLService inference in separate processes (INFERENCE_WORKERS) so the API process's GIL and
+    event loop stay free. Inputs and outputs travel through a SlabPool of INFERENCE_SLABS shared-memory
+    slabs: the caller writes the input tensor into a free slab, the worker reads it and writes
+    counts/mean/M2 next to it in place, and only ArrayRef descriptors are pickled. Slabs go back on
+    the free list after each job, so steady-state jobs allocate no shared memory.
+    Each job carries the API registry's ModelSpec, so workers follow POST /models/reload lazily.
+    """
+
+    def __init__(self, num_workers: int = None, num_slabs: int = None, slab_mb: int = None):
+        self.num_workers = num_workers or settings.INFERENCE_WORKERS
+        self.slabs = SlabPool(num_slabs or settings.INFERENCE_SLABS or 2 * self.num_workers,
+                              (slab_mb or settings.INFERENCE_SLAB_MB) * 1024 * 1024)
+        # Split the cores between workers unless TORCH_NUM_THREADS says otherwise
+        self.num_threads = settings.TORCH_NUM_THREADS or max(1, (os.cpu_count() or 1) // self.num_workers)
+        self._executor_lock = threading.Lock()
+        self._executor = self._new_executor()
+        logger.info(f"Inference workers: {self.num_workers} processes x {self.num_threads} threads, "
+                    f"{self.slabs.num_slabs} slabs of {self.slabs.slab_bytes // (1024 * 1024)}MB")
+
+    def _new_executor(self) -> ProcessPoolExecutor:
+        # spawn: forking a process that already holds torch thread pools is unsafe
+        return ProcessPoolExecutor(max_workers=self.num_workers, mp_context=get_context("spawn"),
+                                   initializer=_worker_init, initargs=(self.num_threads,))
+
+    def start(self):
+        """Starts every worker now (each loads its model) instead of on the first job."""
+        for _ in range(self.num_workers):
+            self._executor.submit(_worker_ping)
+
+    def fits(self, shape) -> bool:
+        counts_shape = (shape[0], 1) + tuple(shape[2:])
+        return required_bytes((shape, np.float32), (counts_shape, np.float32),
+                              (shape, np.float32), (shape, np.float32)) <= self.slabs.slab_bytes
+
+    @contextmanager
+    def moments(self, spec, img_tensor: torch.Tensor):
+        """
+        Runs the model for spec (the API registry's ModelSpec; the worker reloads its manifest if it
+        differs) on a (1, C, H, W) CPU input in a worker. Yields ((counts, mean, M2), info) as tensors
+        viewing the slab; they are only valid inside the block (the slab is recycled after).
+        The output is assumed to have the input's shape, as for every registered architecture.
+        """
+        index = self.slabs.acquire()
+        try:
+            layout = self.slabs.layout(index)
+            shape = tuple(img_tensor.shape)
+            input_ref, input_view = layout.alloc(shape)
+            torch.from_numpy(input_view).copy_(img_tensor)
+            counts_ref, counts = layout.alloc((shape[0], 1) + shape[2:])
+            mean_ref, mean = layout.alloc(shape)
+            m2_ref, m2 = layout.alloc(shape)
+
+            executor = self._executor
+            try:
+                info = executor.submit(_worker_moments, spec, input_ref, counts_ref, mean_ref, m2_ref).result()
+            except BrokenProcessPool:
+                self._replace_executor(executor)
+                raise
+            yield (torch.from_numpy(counts), torch.from_numpy(mean), torch.from_numpy(m2)), info
+        finally:
+            self.slabs.release(index)
+
+    def _replace_executor(self, broken: ProcessPoolExecutor):
+        """A worker died (e.g. OOM-killed): start a fresh pool for later jobs."""
+        with self._executor_lock:
+            if self._executor is broken:
+                logger.error("An inference worker died; restarting the worker pool.")
+                broken.shutdown(wait=False)
+                self._executor = self._new_executor()
+
+    def snapshot(self) -> dict:
+        return {"workers": self.num_workers, "threads_per_worker": self.num_threads,
+                "slabs": self.slabs.num_slabs, "free_slabs": self.slabs.free_slabs,
+                "slab_mb": self.slabs.slab_bytes // (1024 * 1024)}
+
+    def shutdown(self):
+        self._executor.shutdown(wait=True)
+        self.slabs.close()
+
+
+_pool: Optional[InferenceWorkerPool] = None
+_pool_lock = threading.Lock()
+
+
+def get_inference_workers() -> Optional[InferenceWorkerPool]:
+    """Process-wide worker pool, or None when INFERENCE_WORKERS is 0 (inference runs in-process)."""
+    global _pool
+    if not settings.INFERENCE_WORKERS or _in_worker:
+        return None
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = InferenceWorkerPool()
+    return _pool
@@ -8,61 +8,44 @@ import matplotlib.cm
 import io
 import base64
 import os # For checking file existence
+from concurrent.futures import ThreadPoolExecutor
 
-# Import model and enable_dropout function
-from app.models.ml.autoencoder import DropoutAutoencoder, enable_dropout
+from app.models.ml.autoencoder import DropoutAutoencoder, mc_dropout_moments, merge_moments
+from app.models.ml.refinement import refined_mc_moments
+from app.models.ml.mc_sampling import mask_schedule
+from app.models.ml.triage import tile_uncertainty_stats, frame_scores
+from app.models.ml.sequence import deterministic_latent, changed_latent_cells, sequence_mc_predict
+from app.models.ml.latent_codec import encode_latent, decode_latent, encode_latent_delta, decode_latent_delta, quantization_step
+from app.services.sequence_service import SequenceService
+from app.services.model_registry import ModelRegistry, LoadedModel, get_model_registry
+from app.services.inference_workers import get_inference_workers
 from app.config.settings import get_settings
 from app.utils.logger import setup_logger
-from app.utils.exceptions import ModelError, FileProcessingError
+from app.utils.exceptions import FileProcessingError
+from app.utils.image_utils import load_image_for_model
 
 settings = get_settings()
 logger = setup_logger("ml_service")
 
 class MLService:
-    def __init__(self):
-        self.device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+    def __init__(self, registry: ModelRegistry = None):
+        # Models are owned by the (process-wide) registry; this service only runs them
+        self.registry = registry or get_model_registry()
+        self.device = self.registry.device
         logger.info(f"Using device: {self.device}")
-        self.model = self._load_model()
-        # Define the transformations based on settings
-        self.transform = transforms.Compose([
-            transforms.Resize(settings.MODEL_INPUT_SIZE),
-            transforms.ToTensor(),
-            # Add normalization if your model was trained with it
-            # transforms.Normalize(mean=[0.485, 0.456, 0.406], std=[0.229, 0.224, 0.225])
-        ])
         self.to_pil = transforms.ToPILImage()
         self.num_mc_samples = settings.NUM_MC_SAMPLES
+        self.sequences = SequenceService()
         logger.info(f"ML Service initialized with {self.num_mc_samples} MC samples.")
 
-    def _load_model(self):
-        model_path = settings.MODEL_PATH
-        logger.info(f"Attempting to load model from {model_path}")
-        if not os.path.exists(model_path):
-             logger.error(f"Model file not found at {model_path}")
-             raise ModelError(f"Model file not found at {model_path}")
-        try:
-            # Instantiate the model architecture
-            # Pass dropout_p if your saved state_dict doesn't include it implicitly
-            # or if you want to ensure it matches the class definition
-            model = DropoutAutoencoder(dropout_p=0.25) # Ensure dropout_p matches training if needed
-
-            # Load the state dictionary
-            model.load_state_dict(torch.load(model_path, map_location=self.device))
-            model.to(self.device)
-
-            # Set to evaluation mode initially (important for batchnorm, etc.)
-            model.eval()
-            # Explicitly enable dropout layers for MC inference AFTER setting eval mode
-            enable_dropout(model)
-
-            logger.info("Model loaded successfully and dropout enabled for inference.")
-            return model
-        except FileNotFoundError:
-            logger.error(f"Model file not found at {model_path}")
-            raise ModelError(f"Model file not found at {model_path}")
-        except Exception as e:
-            logger.error(f"Error loading model: {str(e)}", exc_info=True)
-            raise ModelError(f"Failed to load model: {str(e)}")
+    def _build_transform(self, input_size):
+        # Define the transformations based on the model's input size
+        return transforms.Compose([
+            transforms.Resize(input_size),
+            transforms.ToTensor(),
+            # Add normalization if your model was trained with it
+            # transforms.Normalize(mean=[0.485, 0.456, 0.406], std=[0.229, 0.224, 0.225])
+        ])
 
     def _encode_image_to_base64(self, pil_image):
         logger.debug("Encoding PIL image to base64 PNG string.")
@@ -104,55 +87,229 @@ class MLService:
             # Don't raise ModelError here, let process_image handle it
             raise FileProcessingError(f"Failed to create uncertainty map: {str(e)}")
 
-    def process_image(self, image_path: str):
-        logger.info(f"Starting ML processing for image: {image_path}")
+    def _predict(self, loaded: LoadedModel, img_tensor):
+        """Returns (mean, variance) reconstructions for a (1, C, H, W) input, shaped (1, C, H, W)."""
+        if loaded.is_student:
+            # Distilled student predicts both statistics in a single deterministic pass
+            with torch.no_grad():
+                return loaded.model(img_tensor)
+        counts, mean, m2 = self._predict_moments(loaded, img_tensor)
+        return mean, m2 / counts
+
+    def _mask_schedule(self, loaded: LoadedModel, num_samples: int, offset: int = 0):
+        """Configured dropout mask strategy for the MC passes run inside the returned context."""
+        return mask_schedule(loaded.model, settings.MC_SAMPLING_STRATEGY, num_samples,
+                             seed=settings.MC_SAMPLING_SEED, offset=offset)
+
+    def _predict_moments(self, loaded: LoadedModel, img_tensor):
+        """MC dropout sufficient statistics for a (1, C, H, W) input: (counts (1, 1, H, W), mean, M2)."""
+        # Perform Monte Carlo Dropout inference
+        # Ensure model is in eval mode BUT dropout layers are active (done in _load_model)
+        with self._mask_schedule(loaded, self.num_mc_samples):
+            if settings.MC_REFINEMENT_ENABLED:
+                return refined_mc_moments(
+                    loaded.model, img_tensor,
+                    total_samples=self.num_mc_samples,
+                    pilot_samples=settings.MC_PILOT_SAMPLES,
+                    tile_size=settings.MC_REFINE_TILE_SIZE,
+                    context=settings.MC_REFINE_CONTEXT,
+                    threshold=settings.MC_REFINE_THRESHOLD,
+                    max_fraction=settings.MC_REFINE_MAX_FRACTION,
+                    align=DropoutAutoencoder.DOWNSAMPLE_FACTOR,
+                )
+            mean, m2 = mc_dropout_moments(loaded.model, img_tensor, self.num_mc_samples)
+        logger.info(f"Processed {self.num_mc_samples} MC samples ({settings.MC_SAMPLING_STRATEGY} masks)")
+        return torch.full_like(mean[:, :1], float(self.num_mc_samples)), mean, m2
+
+    # --- Persisted MC statistics (for incremental top-up) ---
+
+    def _mc_state_path(self, file_id: int) -> str:
+        return os.path.join(settings.MC_STATE_DIR, f"{file_id}.npz")
+
+    def _save_mc_state(self, file_id: int, loaded: LoadedModel, counts, mean, m2) -> dict:
+        """Writes per-pixel counts, mean and M2 for a file; returns the reference stored with its result."""
+        os.makedirs(settings.MC_STATE_DIR, exist_ok=True)
+        path = self._mc_state_path(file_id)
+        tmp_path = os.path.join(settings.MC_STATE_DIR, f"{file_id}.tmp.npz")
+        np.savez(
+            tmp_path,
+            counts=counts[0, 0].cpu().numpy().astype(np.uint32),
+            mean=mean[0].cpu().numpy().astype(np.float32),
+            m2=m2[0].cpu().numpy().astype(np.float32),
+        )
+        os.replace(tmp_path, path)
+        return {
+            "path": path,
+            "model_version": loaded.spec.version,
+            # Samples are only mergeable if they came from the same weights
+            "sha256": loaded.sha256,
+            "min_samples": int(counts.min().item()),
+            "max_samples": int(counts.max().item()),
+        }
+
+    def _load_mc_state(self, path: str):
+        with np.load(path) as state:
+            counts = torch.from_numpy(state["counts"].astype(np.float32))[None, None].to(self.device)
+            mean = torch.from_numpy(state["mean"])[None].to(self.device)
+            m2 = torch.from_numpy(state["m2"])[None].to(self.device)
+        return counts, mean, m2
+
+    def delete_mc_state(self, file_id: int):
+        path = self._mc_state_path(file_id)
+        if os.path.exists(path):
+            os.remove(path)
+
+    def _predict_sequence(self, loaded: LoadedModel, img_tensor, sequence_id: str, file_id: int = None):
+        """
+        Sequence-mode prediction: codes the frame's latent as a keyframe or as a quantized delta
+        against the previous frame, and resamples MC only where the latent changed.
+        Returns (mean, variance, frame record).
+        """
+        model = loaded.model
+        image_size = tuple(img_tensor.shape[-2:])
+        with self.sequences.lock(sequence_id):
+            latent = deterministic_latent(model, img_tensor)[0].cpu().numpy()
+            state = self.sequences.load(sequence_id)
+            use_delta = (
+                state is not None
+                and state.matches(loaded.spec.version, latent.shape)
+                and state.since_keyframe + 1 < settings.SEQUENCE_KEYFRAME_INTERVAL
+            )
+            if use_delta:
+                delta = latent - state.reference
+                changed = changed_latent_cells(torch.from_numpy(delta), settings.SEQUENCE_STATIC_STEPS * state.step)
+                # A scene change is cheaper and cleaner to code as a new keyframe
+                use_delta = changed.float().mean().item() <= settings.SEQUENCE_SCENE_CHANGE_FRACTION
+
+            total_cells = latent.shape[1] * latent.shape[2]
+            if use_delta:
+                data = encode_latent_delta(delta, state.step, settings.SEQUENCE_DELTA_BITS, image_size)
+                coded_delta, _ = decode_latent_delta(data)
+                # Track what a decoder reconstructs, not the true latent, so quantization error cannot drift
+                reference = state.reference + coded_delta
+                step = state.step
+                with self._mask_schedule(loaded, self.num_mc_samples):
+                    mean, variance, resampled = sequence_mc_predict(
+                        model, img_tensor, self.num_mc_samples, changed.to(self.device),
+                        torch.from_numpy(state.mean)[None].to(self.device),
+                        torch.from_numpy(state.variance)[None].to(self.device),
+                        cell_size=DropoutAutoencoder.DOWNSAMPLE_FACTOR,
+                        context=settings.MC_REFINE_CONTEXT,
+                    )
+                frame_type = "delta"
+            else:
+                data = encode_latent(latent, settings.SEQUENCE_KEY_BITS, image_size)
+                reference, info = decode_latent(data)
+                step = quantization_step(settings.SEQUENCE_KEY_BITS, *info["range"])
+                mean, variance = self._predict(loaded, img_tensor)
+                resampled, frame_type = total_cells, "key"
+
+            record = self.sequences.append_frame(
+                sequence_id, state, loaded.spec.version, frame_type, data, reference, step,
+                mean[0].cpu().numpy(), variance[0].cpu().numpy(), file_id, resampled, total_cells,
+            )
+        logger.info(f"Sequence '{sequence_id}' frame {record['index']}: {frame_type}, {len(data)} bytes, "
+                    f"MC on {resampled}/{total_cells} cells")
+        return mean, variance, record
+
+    def _load_input(self, image_path: str, loaded: LoadedModel):
+        input_size = (loaded.spec.input_size, loaded.spec.input_size)
+        # Load (with decoder-level downscaling towards the model input size) and transform
+        img = load_image_for_model(image_path, input_size)
+        img_tensor = self._build_transform(input_size)(img).unsqueeze(0).to(self.device)
+        logger.info(f"Image loaded and transformed to tensor shape: {img_tensor.shape}")
+        return img_tensor
+
+    def _process_in_worker(self, workers, image_path: str, model_version: str = None, file_id: int = None):
+        """
+        process_image's plain MC / student path on an inference worker, exchanging tensors through
+        shared memory. Returns None if the input does not fit a slab (the caller runs it in-process).
+        """
+        spec = self.registry.resolve(model_version)
+        input_size = (spec.input_size, spec.input_size)
+        img_tensor = self._build_transform(input_size)(load_image_for_model(image_path, input_size)).unsqueeze(0)
+        if not workers.fits(img_tensor.shape):
+            logger.warning(f"Input {tuple(img_tensor.shape)} exceeds the {settings.INFERENCE_SLAB_MB}MB slab; running in-process")
+            return None
+        with workers.moments(spec, img_tensor) as ((counts, mean, m2), info):
+            # Describes the worker's model (version, weight hash); this process holds no weights for it
+            loaded = LoadedModel(spec, None, info["sha256"])
+            logger.info(f"Inference for {image_path} ran in worker {info['pid']}")
+            mc_state = None
+            if file_id is not None and not loaded.is_student:
+                mc_state = self._save_mc_state(file_id, loaded, counts, mean, m2)
+            # Everything that reads the slab views happens inside this block
+            return self._render_result(loaded, mean, m2 / counts, mc_state=mc_state)
+
+    def _render_result(self, loaded: LoadedModel, mean_reconstruction, variance_reconstruction, **extra):
+        """Encodes mean/variance outputs into the success result returned to FileService."""
+        # --- Post-processing ---
+        # Convert mean reconstruction to PIL and then base64
+        mean_rec_tensor_cpu = mean_reconstruction.squeeze(0).cpu() # Remove batch dim if present, move to CPU
+        mean_rec_pil = self.to_pil(mean_rec_tensor_cpu)
+        mean_rec_b64 = self._encode_image_to_base64(mean_rec_pil)
+        logger.info("Mean reconstruction converted to base64.")
+
+        # Calculate uncertainty map (e.g., mean variance across channels) and convert
+        uncertainty_map_tensor = torch.mean(variance_reconstruction.squeeze(0), dim=0) # Mean variance across channels -> (H, W)
+        uncertainty_heatmap_pil = self._create_uncertainty_heatmap(uncertainty_map_tensor)
+        uncertainty_map_b64 = self._encode_image_to_base64(uncertainty_heatmap_pil)
+        logger.info("Uncertainty map created and converted to base64.")
+
+        return {
+            "mean_reconstruction_b64": mean_rec_b64,
+            "uncertainty_map_b64": uncertainty_map_b64,
+            "model_version": loaded.spec.version,
+            **extra,
+            # PIL images for post-processing stages (tile pyramids); not persisted
+            "mean_reconstruction_image": mean_rec_pil,
+            "uncertainty_map_image": uncertainty_heatmap_pil,
+            "status": "success"
+        }
+
+    def process_image(self, image_path: str, model_version: str = None, sequence_id: str = None, file_id: int = None):
+        """
+        Full inference for one image. With file_id, MC sufficient statistics are persisted
+        so the result can later be refined with top_up_image().
+        """
+        logger.info(f"Starting ML processing for image: {image_path} (model: {model_version or 'default'})")
         if not os.path.exists(image_path):
             logger.error(f"Image file not found for processing: {image_path}")
             return {"status": "error", "error_message": f"Image file not found: {image_path}"}
 
         try:
-            # Load and transform the image
-            img = Image.open(image_path).convert('RGB')
-            img_tensor = self.transform(img).unsqueeze(0).to(self.device)
-            logger.info(f"Image loaded and transformed to tensor shape: {img_tensor.shape}")
-
-            reconstructions_list = []
-            # Perform Monte Carlo Dropout inference
-            # Ensure model is in eval mode BUT dropout layers are active (done in _load_model)
-            with torch.no_grad(): # Disable gradient calculations for inference
-                for i in range(self.num_mc_samples):
-                    reconstruction = self.model(img_tensor)
-                    reconstructions_list.append(reconstruction)
-                    if (i + 1) % 5 == 0 or i == self.num_mc_samples - 1:
-                         logger.info(f"Processed MC sample {i + 1}/{self.num_mc_samples}")
-
-            # Stack results and calculate mean and variance
-            reconstructions_tensor = torch.cat(reconstructions_list, dim=0) # Shape: (num_samples, C, H, W)
-            logger.info(f"Stacked reconstructions tensor shape: {reconstructions_tensor.shape}")
-
-            mean_reconstruction = torch.mean(reconstructions_tensor, dim=0) # Shape: (C, H, W)
-            variance_reconstruction = torch.var(reconstructions_tensor, dim=0, unbiased=False) # Shape: (C, H, W)
-            logger.info("Calculated mean and variance of reconstructions.")
+            workers = get_inference_workers()
+            if workers is not None and not sequence_id:
+                # Sequence frames keep their per-sequence state in this process, so they stay here
+                result = self._process_in_worker(workers, image_path, model_version, file_id)
+                if result is not None:
+                    logger.info(f"Successfully processed image: {image_path}")
+                    return result
 
-            # --- Post-processing ---
-            # Convert mean reconstruction to PIL and then base64
-            mean_rec_tensor_cpu = mean_reconstruction.squeeze(0).cpu() # Remove batch dim if present, move to CPU
-            mean_rec_pil = self.to_pil(mean_rec_tensor_cpu)
-            mean_rec_b64 = self._encode_image_to_base64(mean_rec_pil)
-            logger.info("Mean reconstruction converted to base64.")
+            # Hold this reference for the whole job so a hot swap or eviction can't pull the model away
+            loaded = self.registry.get(model_version)
+            img_tensor = self._load_input(image_path, loaded)
 
-            # Calculate uncertainty map (e.g., mean variance across channels) and convert
-            uncertainty_map_tensor = torch.mean(variance_reconstruction.squeeze(0), dim=0) # Mean variance across channels -> (H, W)
-            uncertainty_heatmap_pil = self._create_uncertainty_heatmap(uncertainty_map_tensor)
-            uncertainty_map_b64 = self._encode_image_to_base64(uncertainty_heatmap_pil)
-            logger.info("Uncertainty map created and converted to base64.")
+            sequence_record, mc_state = None, None
+            if loaded.is_student:
+                if sequence_id:
+                    logger.warning(f"Model '{loaded.spec.version}' has no latent to code; ignoring sequence '{sequence_id}'")
+                mean_reconstruction, variance_reconstruction = self._predict(loaded, img_tensor)
+            elif sequence_id:
+                mean_reconstruction, variance_reconstruction, sequence_record = self._predict_sequence(
+                    loaded, img_tensor, sequence_id, file_id
+                )
+            else:
+                counts, mean_reconstruction, m2 = self._predict_moments(loaded, img_tensor)
+                variance_reconstruction = m2 / counts
+                if file_id is not None:
+                    mc_state = self._save_mc_state(file_id, loaded, counts, mean_reconstruction, m2)
+            logger.info("Calculated mean and variance of reconstructions.")
 
+            result = self._render_result(loaded, mean_reconstruction, variance_reconstruction,
+                                         sequence=sequence_record, mc_state=mc_state)
             logger.info(f"Successfully processed image: {image_path}")
-            return {
-                "mean_reconstruction_b64": mean_rec_b64,
-                "uncertainty_map_b64": uncertainty_map_b64,
-                "status": "success"
-            }
+            return result
 
         except FileNotFoundError:
              logger.error(f"Image file disappeared during processing: {image_path}")
@@ -164,3 +321,98 @@ class MLService:
                 "status": "error",
                 "error_message": f"ML processing failed: {str(e)}"
             }
+
+    def top_up_image(self, image_path: str, file_id: int, mc_state: dict, extra_samples: int):
+        """
+        Runs extra_samples more MC passes and merges them into the file's stored statistics
+        (Chan et al. parallel update), so a better estimate costs only the additional samples.
+        Requires the same weights the stored samples came from.
+        """
+        logger.info(f"Topping up file ID {file_id} with {extra_samples} MC samples (stored: {mc_state.get('min_samples')})")
+        try:
+            loaded = self.registry.get(mc_state["model_version"])
+            if loaded.sha256 != mc_state["sha256"]:
+                return {"status": "error", "error_message": f"Weights of model '{loaded.spec.version}' changed since "
+                                                           "the stored statistics were computed; reprocess instead"}
+            counts, mean, m2 = self._load_mc_state(mc_state["path"])
+            img_tensor = self._load_input(image_path, loaded)
+            if mean.shape != img_tensor.shape:
+                return {"status": "error", "error_message": "Stored statistics do not match the model input size; reprocess instead"}
+
+            # Continue the mask bank past the stored passes so a fixed seed never replays their masks
+            with self._mask_schedule(loaded, extra_samples, offset=mc_state.get("max_samples") or 0):
+                extra_mean, extra_m2 = mc_dropout_moments(loaded.model, img_tensor, extra_samples)
+            counts, mean, m2 = merge_moments(counts, mean, m2, extra_samples, extra_mean, extra_m2)
+            mc_state = self._save_mc_state(file_id, loaded, counts, mean, m2)
+            logger.info(f"File ID {file_id} now has {mc_state['min_samples']}-{mc_state['max_samples']} MC samples per pixel")
+            return self._render_result(loaded, mean, m2 / counts, mc_state=mc_state)
+
+        except FileNotFoundError as e:
+            logger.error(f"Missing image or statistics for top-up of file ID {file_id}: {e}")
+            return {"status": "error", "error_message": f"Image or stored statistics not found: {str(e)}"}
+        except Exception as e:
+            logger.error(f"Error during MC top-up for file ID {file_id}: {str(e)}", exc_info=True)
+            return {"status": "error", "error_message": f"MC top-up failed: {str(e)}"}
+
+    def _load_triage_tensor(self, image_path: str, transform, input_size):
+        return transform(load_image_for_model(image_path, input_size))
+
+    def triage(self, items, model_version: str = None, num_samples: int = None, input_size: int = None,
+               tile_size: int = None, percentile: float = None, batch_size: int = None):
+        """
+        Cheap uncertainty ranking for many images: a low-sample MC pass at reduced resolution,
+        batched across images, summarised into per-tile statistics. No images are rendered or encoded.
+
+        items: iterable of (file_id, image_path).
+        Returns (results, errors): results is a list of {"file_id", "score", "mean", "tile_stats"}
+        with tile_stats a (3, rows, cols) float32 array (see TILE_STATS); errors maps file_id -> message.
+        """
+        num_samples = num_samples or settings.TRIAGE_MC_SAMPLES
+        size = input_size or settings.TRIAGE_INPUT_SIZE
+        tile_size = tile_size or settings.TRIAGE_TILE_SIZE
+        percentile = settings.TRIAGE_PERCENTILE if percentile is None else percentile
+        batch_size = batch_size or settings.TRIAGE_BATCH_SIZE
+        input_size = (size, size)
+
+        loaded = self.registry.get(model_version)
+        transform = self._build_transform(input_size)
+        items = list(items)
+        batches = [items[i:i + batch_size] for i in range(0, len(items), batch_size)]
+        results, errors = [], {}
+
+        # Decode the next batch on worker threads (PIL releases the GIL) while the current one runs
+        with ThreadPoolExecutor(max_workers=settings.TRIAGE_DECODE_WORKERS) as executor:
+            submit = lambda batch: [(fid, executor.submit(self._load_triage_tensor, path, transform, input_size)) for fid, path in batch]
+            pending = submit(batches[0]) if batches else []
+            for index in range(len(batches)):
+                current, pending = pending, (submit(batches[index + 1]) if index + 1 < len(batches) else [])
+                file_ids, tensors = [], []
+                for file_id, future in current:
+                    try:
+                        tensors.append(future.result())
+                        file_ids.append(file_id)
+                    except Exception as e:
+                        logger.warning(f"Triage could not load file ID {file_id}: {str(e)}")
+                        errors[file_id] = f"Failed to load image: {str(e)}"
+                if not tensors:
+                    continue
+
+                batch = torch.stack(tensors).to(self.device)
+                with torch.no_grad():
+                    if loaded.is_student:
+                        _, variance = loaded.model(batch)
+                    else:
+                        with self._mask_schedule(loaded, num_samples):
+                            _, m2 = mc_dropout_moments(loaded.model, batch, num_samples)
+                        variance = m2 / num_samples
+                    uncertainty = variance.mean(dim=1)  # Mean over channels -> (B, H, W), as for the heatmap
+                    stats = tile_uncertainty_stats(uncertainty, tile_size, percentile)
+                    scores = frame_scores(stats)
+                    means = uncertainty.flatten(1).mean(dim=1)
+
+                stats, scores, means = stats.cpu().numpy(), scores.cpu().numpy(), means.cpu().numpy()
+                for i, file_id in enumerate(file_ids):
+                    results.append({"file_id": file_id, "score": float(scores[i]), "mean": float(means[i]), "tile_stats": stats[i]})
+
+        logger.info(f"Triaged {len(results)} images ({len(errors)} failed) with {num_samples} MC samples at {size}px")
+        return results, errors
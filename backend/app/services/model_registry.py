@@ -0,0 +1,242 @@
+# backend/app/services/model_registry.py
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+import torch
+
+from app.models.ml.autoencoder import DropoutAutoencoder, enable_dropout
+from app.models.ml.student import MeanVarianceStudent
+from app.schemas.model import ModelSpec, ModelInfoResponse, ModelRegistryResponse
+from app.config.settings import get_settings
+from app.utils.logger import setup_logger
+from app.utils.exceptions import ModelError, ModelNotFoundError
+
+settings = get_settings()
+logger = setup_logger("model_registry")
+
+# Supported ModelSpec.arch values
+ARCH_DROPOUT_AUTOENCODER = "dropout_autoencoder"  # MC dropout, T stochastic passes
+ARCH_STUDENT = "student"                          # MeanVarianceStudent, one deterministic pass
+
+
+def file_sha256(path: str, chunk_size: int = 1 << 20) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class LoadedModel:
+    """A resident model plus the spec it was built from. Jobs keep a reference for their whole run."""
+
+    def __init__(self, spec: ModelSpec, model: torch.nn.Module, sha256: str):
+        self.spec = spec
+        self.model = model
+        self.sha256 = sha256
+
+    @property
+    def is_student(self) -> bool:
+        return self.spec.arch == ARCH_STUDENT
+
+
+class ModelRegistry:
+    """
+    Catalogue of model checkpoints with lazy loading and a bounded LRU of resident models.
+
+    Specs come from the JSON manifest at settings.MODEL_REGISTRY_PATH
+    ({"default": "<version>", "models": [ModelSpec, ...]}); without a manifest a single
+    "default" spec is derived from MODEL_PATH / MODEL_TYPE. reload() re-reads the manifest
+    so new checkpoints can be hot-swapped: evicted or replaced models stay alive for the
+    jobs already holding them and are freed once those jobs finish.
+    """
+
+    def __init__(self, manifest_path: str = None, max_resident: int = None, device: torch.device = None):
+        self.manifest_path = manifest_path or settings.MODEL_REGISTRY_PATH
+        self.max_resident = max(1, max_resident or settings.MODEL_CACHE_SIZE)
+        self.device = device or torch.device("cuda" if torch.cuda.is_available() else "cpu")
+        self._lock = threading.Lock()
+        self._load_locks: Dict[str, threading.Lock] = {}
+        self._specs: Dict[str, ModelSpec] = {}
+        self._default: Optional[str] = None
+        self._resident: "OrderedDict[str, LoadedModel]" = OrderedDict()
+        # Readiness: set once the default model is loaded and warmed up
+        self.ready = False
+        self.ready_error: Optional[str] = None
+        self.warmup_ms: Optional[float] = None
+        self.reload()
+
+    # --- Catalogue ---
+
+    def _read_manifest(self):
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path) as f:
+                manifest = json.load(f)
+            specs = [ModelSpec(**entry) for entry in manifest.get("models", [])]
+            default = manifest.get("default") or (specs[0].version if specs else None)
+            return specs, default
+
+        # Backwards compatible single-model setup from settings
+        if settings.MODEL_TYPE == ARCH_STUDENT:
+            spec = ModelSpec(version="default", path=settings.STUDENT_MODEL_PATH, arch=ARCH_STUDENT)
+        else:
+            spec = ModelSpec(version="default", path=settings.MODEL_PATH, arch=ARCH_DROPOUT_AUTOENCODER)
+        return [spec], "default"
+
+    def reload(self):
+        """Re-reads the manifest. Resident models whose spec changed or disappeared are dropped."""
+        specs, default = self._read_manifest()
+        with self._lock:
+            self._specs = {spec.version: spec for spec in specs}
+            if default not in self._specs:
+                raise ModelError(f"Default model version '{default}' is not in the registry")
+            self._default = default
+            for version in list(self._resident):
+                if self._specs.get(version) != self._resident[version].spec:
+                    logger.info(f"Dropping resident model '{version}' (spec changed or removed)")
+                    del self._resident[version]
+        logger.info(f"Model registry loaded: {list(self._specs)} (default '{self._default}')")
+
+    def set_default(self, version: str):
+        with self._lock:
+            if version not in self._specs:
+                raise ModelNotFoundError(version)
+            self._default = version
+        logger.info(f"Default model version set to '{version}'")
+
+    def resolve(self, version: Optional[str] = None) -> ModelSpec:
+        """Returns the spec for version (default if None) without loading it."""
+        with self._lock:
+            spec = self._specs.get(version or self._default)
+        if spec is None:
+            raise ModelNotFoundError(version)
+        return spec
+
+    @property
+    def default_version(self) -> Optional[str]:
+        return self._default
+
+    def describe(self) -> ModelRegistryResponse:
+        with self._lock:
+            models = [
+                ModelInfoResponse(**spec.model_dump(), resident=version in self._resident, is_default=version == self._default)
+                for version, spec in self._specs.items()
+            ]
+            return ModelRegistryResponse(default_version=self._default, max_resident=self.max_resident, models=models)
+
+    # --- Loading ---
+
+    def _build(self, spec: ModelSpec) -> torch.nn.Module:
+        if spec.arch == ARCH_STUDENT:
+            return MeanVarianceStudent()
+        if spec.arch == ARCH_DROPOUT_AUTOENCODER:
+            return DropoutAutoencoder(dropout_p=spec.dropout_p, bottleneck_channels=spec.bottleneck_channels)
+        raise ModelError(f"Unknown model architecture '{spec.arch}' for version '{spec.version}'")
+
+    def _load(self, spec: ModelSpec) -> LoadedModel:
+        logger.info(f"Loading model '{spec.version}' ({spec.arch}) from {spec.path}")
+        if not os.path.exists(spec.path):
+            raise ModelError(f"Model file not found at {spec.path}")
+        sha256 = file_sha256(spec.path)
+        if spec.sha256 and spec.sha256 != sha256:
+            raise ModelError(f"Weight hash mismatch for '{spec.version}': expected {spec.sha256}, got {sha256}")
+        try:
+            model = self._build(spec)
+            if self.device.type == "cpu":
+                # Memory-map the checkpoint and adopt its tensors as parameters (assign=True): weights stay
+                # backed by the file's page cache, so every worker process on the host shares one copy.
+                state_dict = torch.load(spec.path, map_location="cpu", mmap=True, weights_only=True)
+                model.load_state_dict(state_dict, assign=True)
+            else:
+                # mmap still avoids a private host copy before the upload to the GPU
+                state_dict = torch.load(spec.path, map_location="cpu", mmap=True, weights_only=True)
+                model.load_state_dict(state_dict)
+                model.to(self.device)
+            # Set to evaluation mode, then re-enable dropout for MC inference (no-op for the student)
+            model.eval()
+            enable_dropout(model)
+        except ModelError:
+            raise
+        except Exception as e:
+            logger.error(f"Error loading model '{spec.version}': {str(e)}", exc_info=True)
+            raise ModelError(f"Failed to load model '{spec.version}': {str(e)}")
+        logger.info(f"Model '{spec.version}' loaded (sha256 {sha256[:12]})")
+        return LoadedModel(spec, model, sha256)
+
+    def get(self, version: Optional[str] = None) -> LoadedModel:
+        """Returns the resident model for version (default if None), loading it on first use."""
+        with self._lock:
+            version = version or self._default
+            spec = self._specs.get(version)
+            if spec is None:
+                raise ModelNotFoundError(version)
+            entry = self._resident.get(version)
+            if entry is not None:
+                self._resident.move_to_end(version)
+                return entry
+            load_lock = self._load_locks.setdefault(version, threading.Lock())
+
+        # Load outside the registry lock so other versions stay servable; one loader per version
+        with load_lock:
+            with self._lock:
+                entry = self._resident.get(version)
+                if entry is not None and entry.spec == spec:
+                    self._resident.move_to_end(version)
+                    return entry
+            entry = self._load(spec)
+            with self._lock:
+                if self._specs.get(version) == spec:  # Skip caching if a reload raced us
+                    self._resident[version] = entry
+                    self._resident.move_to_end(version)
+                    while len(self._resident) > self.max_resident:
+                        evicted, _ = self._resident.popitem(last=False)
+                        logger.info(f"Evicted model '{evicted}' (LRU, max_resident={self.max_resident})")
+            return entry
+
+    def warm_up(self, version: Optional[str] = None, passes: int = None):
+        """
+        Loads the model and runs a few forward passes on a blank input so kernels, allocator
+        pools and lazily initialised backends are primed before traffic; then marks ready.
+        """
+        passes = settings.MODEL_WARMUP_PASSES if passes is None else passes
+        try:
+            loaded = self.get(version)
+            size = loaded.spec.input_size
+            dummy = torch.zeros(1, 3, size, size, device=self.device)
+            start = time.perf_counter()
+            with torch.no_grad():
+                for _ in range(passes):
+                    loaded.model(dummy)
+            if self.device.type == "cuda":
+                torch.cuda.synchronize()
+            self.warmup_ms = (time.perf_counter() - start) * 1000
+            self.ready = True
+            self.ready_error = None
+            logger.info(f"Model '{loaded.spec.version}' warmed up with {passes} passes in {self.warmup_ms:.0f}ms; ready.")
+        except Exception as e:
+            self.ready = False
+            self.ready_error = getattr(e, "detail", None) or str(e)
+            logger.error(f"Model warm-up failed: {self.ready_error}", exc_info=True)
+
+    def resident_versions(self) -> List[str]:
+        with self._lock:
+            return list(self._resident)
+
+
+_registry: Optional[ModelRegistry] = None
+_registry_lock = threading.Lock()
+
+
+def get_model_registry() -> ModelRegistry:
+    """Process-wide registry instance (created on first use)."""
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                _registry = ModelRegistry()
+    return _registry
@@ -0,0 +1,159 @@
+# backend/app/services/sequence_service.py
+import json
+import os
+import re
+import shutil
+import threading
+from typing import Dict, Optional
+
+import numpy as np
+
+from app.config.settings import get_settings
+from app.utils.logger import setup_logger
+
+settings = get_settings()
+logger = setup_logger("sequence_service")
+
+MANIFEST_NAME = "manifest.json"
+_SEQUENCE_ID = re.compile(r"^[A-Za-z0-9][A-Za-z0-9_-]{0,63}$")
+
+
+def is_valid_sequence_id(sequence_id: str) -> bool:
+    """Sequence IDs become directory names, so only plain identifiers are accepted."""
+    return bool(_SEQUENCE_ID.match(sequence_id or ""))
+
+
+class SequenceState:
+    """Coding state carried from one frame of a sequence to the next."""
+
+    def __init__(self, manifest: dict, reference: np.ndarray, mean: np.ndarray, variance: np.ndarray):
+        self.manifest = manifest
+        self.reference = reference  # Decoder-side reconstruction of the previous latent, (C, h, w)
+        self.mean = mean            # Previous frame's MC statistics, (C, H, W)
+        self.variance = variance
+
+    @property
+    def step(self) -> float:
+        return self.manifest["step"]
+
+    @property
+    def since_keyframe(self) -> int:
+        return self.manifest["since_keyframe"]
+
+    def matches(self, model_version: str, latent_shape) -> bool:
+        """Deltas are only meaningful against a reference from the same model and input size."""
+        return (
+            self.reference is not None
+            and self.manifest["model_version"] == model_version
+            and tuple(self.manifest["latent_shape"]) == tuple(latent_shape)
+        )
+
+
+class SequenceService:
+    """
+    Stores image-sequence coding state under settings.SEQUENCE_DIR:
+
+        {sequence_id}/manifest.json             frame log, model version, keyframe step
+        {sequence_id}/frames/{index}.cslt|csld  keyframe latents / latent deltas (latent_codec)
+        {sequence_id}/reference.npy, mean.npy, variance.npy   state for the next frame
+
+    Frames of one sequence must be coded one at a time; callers hold lock(sequence_id) around
+    load() ... append_frame().
+    """
+
+    def __init__(self, root: str = None):
+        self.root = root or settings.SEQUENCE_DIR
+        self._locks: Dict[str, threading.Lock] = {}
+        self._locks_lock = threading.Lock()
+
+    def _dir(self, sequence_id: str) -> str:
+        if not is_valid_sequence_id(sequence_id):
+            raise ValueError(f"Invalid sequence ID '{sequence_id}'")
+        return os.path.join(self.root, sequence_id)
+
+    def lock(self, sequence_id: str) -> threading.Lock:
+        with self._locks_lock:
+            return self._locks.setdefault(sequence_id, threading.Lock())
+
+    def get_manifest(self, sequence_id: str) -> Optional[dict]:
+        path = os.path.join(self._dir(sequence_id), MANIFEST_NAME)
+        if not os.path.exists(path):
+            return None
+        with open(path) as f:
+            return json.load(f)
+
+    def load(self, sequence_id: str) -> Optional[SequenceState]:
+        manifest = self.get_manifest(sequence_id)
+        if manifest is None:
+            return None
+        seq_dir = self._dir(sequence_id)
+        try:
+            arrays = [np.load(os.path.join(seq_dir, f"{name}.npy")) for name in ("reference", "mean", "variance")]
+        except (OSError, ValueError) as e:
+            logger.warning(f"Sequence '{sequence_id}' state unreadable ({e}); next frame becomes a keyframe")
+            return SequenceState(manifest, None, None, None)
+        return SequenceState(manifest, *arrays)
+
+    def _save_array(self, seq_dir: str, name: str, array: np.ndarray):
+        tmp_path = os.path.join(seq_dir, f"{name}.tmp.npy")
+        np.save(tmp_path, array)
+        os.replace(tmp_path, os.path.join(seq_dir, f"{name}.npy"))
+
+    def append_frame(self, sequence_id: str, state: Optional[SequenceState], model_version: str, frame_type: str,
+                     frame_bytes: bytes, reference: np.ndarray, step: float, mean: np.ndarray, variance: np.ndarray,
+                     file_id: Optional[int], resampled_cells: int, total_cells: int) -> dict:
+        """Persists a coded frame and the state for the next one; returns the frame's manifest record."""
+        seq_dir = self._dir(sequence_id)
+        os.makedirs(os.path.join(seq_dir, "frames"), exist_ok=True)
+        manifest = state.manifest if state is not None else {"sequence_id": sequence_id, "frames": []}
+        index = len(manifest["frames"])
+        extension = "cslt" if frame_type == "key" else "csld"
+        with open(os.path.join(seq_dir, "frames", f"{index:05d}.{extension}"), "wb") as f:
+            f.write(frame_bytes)
+
+        for name, array in (("reference", reference), ("mean", mean), ("variance", variance)):
+            self._save_array(seq_dir, name, array.astype(np.float32))
+
+        record = {
+            "index": index,
+            "file_id": file_id,
+            "type": frame_type,
+            "bytes": len(frame_bytes),
+            "resampled_cells": resampled_cells,
+            "total_cells": total_cells,
+        }
+        manifest.update({
+            "model_version": model_version,
+            "latent_shape": list(reference.shape),
+            "step": step,
+            "since_keyframe": 0 if frame_type == "key" else manifest.get("since_keyframe", 0) + 1,
+        })
+        manifest["frames"].append(record)
+        tmp_path = os.path.join(seq_dir, f"{MANIFEST_NAME}.tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(manifest, f)
+        os.replace(tmp_path, os.path.join(seq_dir, MANIFEST_NAME))
+        return {"sequence_id": sequence_id, **record}
+
+    def summarize(self, sequence_id: str) -> Optional[dict]:
+        """Manifest plus per-type byte and compute totals, or None for unknown sequences."""
+        manifest = self.get_manifest(sequence_id)
+        if manifest is None:
+            return None
+        summary = {}
+        for frame_type in ("key", "delta"):
+            frames = [f for f in manifest["frames"] if f["type"] == frame_type]
+            summary[frame_type] = {
+                "frames": len(frames),
+                "avg_bytes": round(sum(f["bytes"] for f in frames) / len(frames), 1) if frames else None,
+                "resampled_fraction": round(
+                    sum(f["resampled_cells"] for f in frames) / max(1, sum(f["total_cells"] for f in frames)), 3
+                ) if frames else None,
+            }
+        return {**manifest, "summary": summary}
+
+    def delete(self, sequence_id: str):
+        seq_dir = self._dir(sequence_id)
+        if os.path.exists(seq_dir):
+            shutil.rmtree(seq_dir, ignore_errors=True)
+            logger.info(f"Deleted sequence '{sequence_id}'")
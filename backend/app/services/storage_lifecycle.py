@@ -0,0 +1,505 @@
+# backend/app/services/storage_lifecycle.py
+import heapq
+import json
+import os
+import re
+import shutil
+import threading
+import time
+from collections import deque
+from datetime import datetime, timedelta
+from typing import Dict, Optional, Tuple
+
+from PIL import Image
+from sqlalchemy.orm import Session
+
+from app.config.settings import get_settings
+from app.database.base import SessionLocal
+from app.models.file import FileUpload
+from app.utils.logger import setup_logger
+
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process lock, fine for single-process dev servers
+    fcntl = None
+
+settings = get_settings()
+logger = setup_logger("storage_lifecycle")
+
+# Artifact kinds (per file_id) counted against the quota, and how their directory entries are named
+ARTIFACT_TILES = "tiles"
+ARTIFACT_MC_STATE = "mc_state"
+_ARTIFACT_NAME = {ARTIFACT_TILES: re.compile(r"^(\d+)$"), ARTIFACT_MC_STATE: re.compile(r"^(\d+)\.npz$")}
+_RESULT_KEY = {ARTIFACT_TILES: "tiles", ARTIFACT_MC_STATE: "mc_state"}  # processing_result entry that points at it
+
+# TIFF tags Pillow rewrites itself when changing compression; everything else must survive compaction
+_TIFF_LAYOUT_TAGS = {259, 273, 278, 279, 284, 317, 322, 323, 324, 325}
+
+
+def _dir_bytes(path: str) -> int:
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+
+def _png_params(img: Image.Image) -> dict:
+    from PIL import PngImagePlugin
+
+    info = PngImagePlugin.PngInfo()
+    for key, value in getattr(img, "text", {}).items():
+        info.add_text(key, value)
+    params = {"optimize": True, "pnginfo": info}
+    for key in ("icc_profile", "dpi", "transparency", "gamma"):
+        if key in img.info:
+            params[key] = img.info[key]
+    return params
+
+
+class StorageLifecycleManager:
+    """
+    Background upkeep of UPLOAD_DIR and the derived artifacts, in bounded batches per cycle so
+    cycle time does not grow with the number of files on the node:
+
+    1. Compaction: originals of completed files older than LIFECYCLE_COMPACT_AFTER_S are
+       recompressed losslessly (PNG -> optimized PNG, BMP -> PNG, uncompressed TIFF -> deflate TIFF).
+       A rewrite is kept only if decoded pixels (and TIFF tags) are identical and it saves at least
+       LIFECYCLE_MIN_SAVINGS. JPEGs are left alone; Pillow cannot re-encode them losslessly.
+       A BMP replaced by a PNG stays on disk for LIFECYCLE_GRACE_S after the row is repointed, so
+       jobs and static URLs that already resolved the old path keep working; a later cycle removes it.
+    2. Quota: tile pyramids and persisted MC statistics are indexed incrementally (new entries plus
+       a round-robin recheck, one LIFECYCLE_BATCH_SIZE each per cycle). Beyond LIFECYCLE_ARTIFACT_QUOTA_MB
+       the least recently written are evicted down to the low-water mark, and their
+       processing_result entry is dropped (thumbnails/tiles disappear, top-up answers 409).
+    3. Reconciliation: uploads and artifacts without a FileUpload row are deleted once older than
+       LIFECYCLE_GRACE_S (covers uploads saved just before their row is committed). Rows whose
+       original is gone are counted, and pending ones are marked failed.
+
+    Cursors persist in LIFECYCLE_STATE_PATH. One process per host owns the manager (flock), so
+    several workers can share the directories; the artifact index lives in the owner's memory.
+    """
+
+    def __init__(self):
+        self.upload_dir = settings.UPLOAD_DIR
+        self.artifact_dirs = {ARTIFACT_TILES: settings.TILE_DIR, ARTIFACT_MC_STATE: settings.MC_STATE_DIR}
+        self.interval_s = settings.LIFECYCLE_INTERVAL_S
+        self.batch_size = settings.LIFECYCLE_BATCH_SIZE
+        self.compact_batch_size = settings.LIFECYCLE_COMPACT_BATCH_SIZE
+        self.compact_after_s = settings.LIFECYCLE_COMPACT_AFTER_S
+        self.min_savings = settings.LIFECYCLE_MIN_SAVINGS
+        self.quota_bytes = settings.LIFECYCLE_ARTIFACT_QUOTA_MB * 1024 * 1024
+        self.low_water = settings.LIFECYCLE_QUOTA_LOW_WATER
+        self.grace_s = settings.LIFECYCLE_GRACE_S
+        self.state_path = settings.LIFECYCLE_STATE_PATH
+
+        # (kind, file_id) -> (bytes, mtime); built incrementally, never by a full stat sweep
+        self._index: Dict[Tuple[str, int], Tuple[int, float]] = {}
+        self._index_bytes = 0
+        self._recheck = deque()  # Round-robin order for re-stat and orphan checks
+        self._lock_file = None
+        self._cycle_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.cycles = 0
+        self.last_cycle: Optional[dict] = None
+        self.totals = {"compacted": 0, "bytes_saved": 0, "evicted": 0, "bytes_evicted": 0,
+                       "orphans_removed": 0, "missing_originals": 0}
+
+    # --- Lifecycle ---
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name="storage-lifecycle", daemon=True)
+        self._thread.start()
+        logger.info(f"Storage lifecycle started (every {self.interval_s}s, batches of {self.batch_size}).")
+
+    def stop(self, timeout: float = 10.0):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        if self._lock_file is not None:
+            self._lock_file.close()  # Releases the flock
+            self._lock_file = None
+
+    def _loop(self):
+        while not self._stop.wait(self.interval_s):
+            try:
+                self.run_cycle()
+            except Exception as e:
+                logger.error(f"Storage lifecycle cycle failed: {str(e)}", exc_info=True)
+
+    def _acquire_ownership(self) -> bool:
+        """Host-wide single owner: the first process to take the flock keeps it until it exits."""
+        if self._lock_file is not None or fcntl is None:
+            return True
+        os.makedirs(os.path.dirname(os.path.abspath(self.state_path)), exist_ok=True)
+        lock_file = open(f"{self.state_path}.lock", "a")
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+        self._lock_file = lock_file
+        logger.info("This process owns the storage lifecycle for this host.")
+        return True
+
+    def _load_state(self) -> dict:
+        state = {"compact_cursor": 0, "rows_cursor": 0, "uploads_cursor": "", "retired": []}
+        try:
+            with open(self.state_path) as f:
+                state.update(json.load(f))
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError) as e:
+            logger.warning(f"Unreadable lifecycle state {self.state_path}, starting over: {e}")
+        return state
+
+    def _save_state(self, state: dict):
+        tmp_path = f"{self.state_path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(state, f)
+        os.replace(tmp_path, self.state_path)
+
+    def run_cycle(self) -> Optional[dict]:
+        """One bounded pass of every step; returns its counters (None if another process owns the lifecycle)."""
+        with self._cycle_lock:
+            if not self._acquire_ownership():
+                return None
+            start = time.monotonic()
+            state = self._load_state()
+            db = SessionLocal()
+            try:
+                stats = {
+                    "compaction": self._compact_originals(db, state),
+                    "artifacts": self._refresh_artifacts(db),
+                    "uploads": self._reconcile_uploads(db, state),
+                    "rows": self._reconcile_rows(db, state),
+                    "quota": self._enforce_quota(db),
+                }
+            finally:
+                db.close()
+            self._save_state(state)
+            stats["duration_s"] = round(time.monotonic() - start, 3)
+            self.cycles += 1
+            self.last_cycle = stats
+            logger.info(f"Storage lifecycle cycle {self.cycles}: {json.dumps(stats)}")
+            return stats
+
+    def snapshot(self) -> dict:
+        return {
+            "enabled": self._thread is not None,
+            "owner": self._lock_file is not None,
+            "cycles": self.cycles,
+            "artifact_entries": len(self._index),
+            "artifact_mb": round(self._index_bytes / (1024 * 1024), 1),
+            "artifact_quota_mb": self.quota_bytes // (1024 * 1024),
+            "totals": dict(self.totals),
+            "last_cycle": self.last_cycle,
+        }
+
+    # --- 1. Lossless compaction of originals ---
+
+    def _compact_originals(self, db: Session, state: dict) -> dict:
+        cutoff = datetime.utcnow() - timedelta(seconds=self.compact_after_s)
+        rows = (
+            db.query(FileUpload.id, FileUpload.file_path, FileUpload.file_type, FileUpload.status)
+            .filter(FileUpload.id > state["compact_cursor"], FileUpload.created_at < cutoff)
+            .order_by(FileUpload.id)
+            .limit(self.compact_batch_size)
+            .all()
+        )
+        stats = {"checked": len(rows), "compacted": 0, "bytes_saved": 0, "retired_removed": self._purge_retired(state)}
+        for file_id, file_path, file_type, status in rows:
+            # Rows still unfinished this long after upload are passed over for good
+            state["compact_cursor"] = file_id
+            if status != "completed" or not file_path or not os.path.exists(file_path):
+                continue
+            try:
+                outcome = self._compact_file(file_path, file_type)
+            except Exception as e:
+                logger.warning(f"Compaction of file ID {file_id} ({file_path}) skipped: {e}")
+                continue
+            if outcome is None:
+                continue
+            new_path, new_type, saved = outcome
+            if new_path != file_path:
+                # Format changed (BMP -> PNG): repoint the row before the old file goes away
+                try:
+                    db.query(FileUpload).filter(FileUpload.id == file_id).update(
+                        {FileUpload.file_path: new_path, FileUpload.file_type: new_type}
+                    )
+                    db.commit()
+                except Exception as e:
+                    db.rollback()
+                    os.remove(new_path)
+                    logger.error(f"Could not repoint file ID {file_id} to {new_path}, keeping original: {e}")
+                    continue
+                # Readers may still hold the old path (running jobs, static URLs): delete it in a later cycle
+                state["retired"].append([file_path, time.time()])
+            stats["compacted"] += 1
+            stats["bytes_saved"] += saved
+            logger.info(f"Compacted file ID {file_id}: {file_path} -> {new_path}, saved {saved} bytes")
+        self.totals["compacted"] += stats["compacted"]
+        self.totals["bytes_saved"] += stats["bytes_saved"]
+        return stats
+
+    def _purge_retired(self, state: dict) -> int:
+        """Deletes originals replaced by compaction more than grace_s ago; returns how many."""
+        now, kept, removed = time.time(), [], 0
+        for path, retired_at in state["retired"]:
+            if now - retired_at < self.grace_s:
+                kept.append([path, retired_at])
+                continue
+            try:
+                os.remove(path)
+                removed += 1
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                kept.append([path, retired_at])
+                logger.error(f"Could not remove replaced original {path}: {e}")
+        state["retired"] = kept
+        return removed
+
+    def _compact_file(self, path: str, file_type: str) -> Optional[Tuple[str, str, int]]:
+        """Lossless rewrite of one original; returns (path, MIME type, bytes saved) or None if not worth it."""
+        with Image.open(path) as img:
+            if getattr(img, "n_frames", 1) > 1:
+                return None  # Multi-page TIFF / animated PNG: not worth the risk
+            if file_type == "image/png":
+                target_path, target_type, fmt, params = path, file_type, "PNG", _png_params(img)
+            elif file_type == "image/bmp":
+                target_path, target_type, fmt, params = os.path.splitext(path)[0] + ".png", "image/png", "PNG", _png_params(img)
+                if os.path.exists(target_path):
+                    return None
+            elif file_type == "image/tiff" and img.info.get("compression") == "raw":
+                target_path, target_type, fmt = path, file_type, "TIFF"
+                params = {"compression": "tiff_adobe_deflate", "tiffinfo": img.tag_v2}
+            else:
+                return None
+            img.load()
+            mode, size, pixels = img.mode, img.size, img.tobytes()
+            tags = {k: v for k, v in img.tag_v2.items() if k not in _TIFF_LAYOUT_TAGS} if fmt == "TIFF" else None
+            tmp_path = f"{target_path}.compact.tmp"
+            img.save(tmp_path, format=fmt, **params)
+
+        try:
+            with Image.open(tmp_path) as check:
+                identical = check.mode == mode and check.size == size and check.tobytes() == pixels
+                if identical and tags is not None:
+                    identical = all(check.tag_v2.get(k) == v for k, v in tags.items())
+            saved = os.path.getsize(path) - os.path.getsize(tmp_path)
+            if not identical or saved < self.min_savings * os.path.getsize(path):
+                os.remove(tmp_path)
+                return None
+            os.replace(tmp_path, target_path)
+            return target_path, target_type, saved
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    # --- 2. Artifact index and quota ---
+
+    def _stat_artifact(self, kind: str, file_id: int) -> Optional[Tuple[int, float]]:
+        base = self.artifact_dirs[kind]
+        path = os.path.join(base, str(file_id)) if kind == ARTIFACT_TILES else os.path.join(base, f"{file_id}.npz")
+        try:
+            mtime = os.stat(path).st_mtime
+        except FileNotFoundError:
+            return None
+        previous = self._index.get((kind, file_id))
+        if previous is not None and previous[1] == mtime:
+            return previous
+        size = _dir_bytes(path) if kind == ARTIFACT_TILES else os.path.getsize(path)
+        return size, mtime
+
+    def _set_index(self, key, entry):
+        previous = self._index.pop(key, None)
+        if previous is not None:
+            self._index_bytes -= previous[0]
+        if entry is not None:
+            self._index[key] = entry
+            self._index_bytes += entry[0]
+
+    def _refresh_artifacts(self, db: Session) -> dict:
+        """Indexes up to batch_size new artifacts, rechecks batch_size known ones, and removes orphans among them."""
+        listed = set()
+        for kind, base in self.artifact_dirs.items():
+            try:
+                with os.scandir(base) as entries:
+                    for entry in entries:  # Names only: no per-entry stat here
+                        match = _ARTIFACT_NAME[kind].match(entry.name)
+                        if match:
+                            listed.add((kind, int(match.group(1))))
+            except FileNotFoundError:
+                continue
+        for key in [key for key in self._index if key not in listed]:
+            self._set_index(key, None)
+
+        new_keys = [key for key in listed if key not in self._index][: self.batch_size]
+        recheck = []
+        while self._recheck and len(recheck) < self.batch_size:
+            key = self._recheck.popleft()
+            if key in self._index:
+                recheck.append(key)
+        batch = new_keys + recheck
+        for key in batch:
+            self._set_index(key, self._stat_artifact(*key))
+
+        # Orphans: artifacts whose FileUpload row is gone (e.g. a delete that failed halfway)
+        ids = sorted({file_id for _, file_id in batch})
+        existing = set()
+        for start in range(0, len(ids), 500):
+            existing.update(row[0] for row in db.query(FileUpload.id).filter(FileUpload.id.in_(ids[start:start + 500])).all())
+        removed = 0
+        for key in batch:
+            entry = self._index.get(key)
+            if entry is None:
+                continue
+            if key[1] not in existing and time.time() - entry[1] > self.grace_s:
+                self._delete_artifact(*key)
+                removed += 1
+            else:
+                self._recheck.append(key)
+        self.totals["orphans_removed"] += removed
+        return {"listed": len(listed), "indexed": len(new_keys), "rechecked": len(recheck), "orphans_removed": removed,
+                "total_mb": round(self._index_bytes / (1024 * 1024), 1)}
+
+    def _delete_artifact(self, kind: str, file_id: int):
+        base = self.artifact_dirs[kind]
+        if kind == ARTIFACT_TILES:
+            shutil.rmtree(os.path.join(base, str(file_id)), ignore_errors=True)
+        else:
+            try:
+                os.remove(os.path.join(base, f"{file_id}.npz"))
+            except FileNotFoundError:
+                pass
+        self._set_index((kind, file_id), None)
+
+    def _enforce_quota(self, db: Session) -> dict:
+        if not self.quota_bytes or self._index_bytes <= self.quota_bytes:
+            return {"evicted": 0, "bytes_evicted": 0}
+        target = self.low_water * self.quota_bytes
+        now = time.time()
+        evicted, freed = 0, 0
+        # Oldest write first; anything written within the grace period may still be in use
+        for (kind, file_id), (size, mtime) in sorted(self._index.items(), key=lambda item: item[1][1]):
+            if self._index_bytes <= target or now - mtime < self.grace_s:
+                break
+            self._delete_artifact(kind, file_id)
+            self._forget_artifact(db, kind, file_id)
+            evicted += 1
+            freed += size
+        if self._index_bytes > self.quota_bytes:
+            logger.warning(f"Artifacts still use {self._index_bytes // (1024 * 1024)}MB after eviction "
+                           f"(quota {self.quota_bytes // (1024 * 1024)}MB); the rest is newer than the grace period")
+        self.totals["evicted"] += evicted
+        self.totals["bytes_evicted"] += freed
+        return {"evicted": evicted, "bytes_evicted": freed}
+
+    def _forget_artifact(self, db: Session, kind: str, file_id: int):
+        """Drops the evicted artifact's entry from the file's processing_result."""
+        try:
+            row = db.query(FileUpload).filter(FileUpload.id == file_id).first()
+            if row is None or not row.processing_result or _RESULT_KEY[kind] not in row.processing_result:
+                return
+            result = dict(row.processing_result)  # New object, so the JSON column change is detected
+            result.pop(_RESULT_KEY[kind])
+            row.processing_result = result
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            logger.error(f"Evicted {kind} of file ID {file_id} but could not update its result: {e}")
+
+    # --- 3. Reconciliation ---
+
+    def _reconcile_uploads(self, db: Session, state: dict) -> dict:
+        """Next batch_size upload names (by name, wrapping around): files no row points at are removed."""
+        try:
+            with os.scandir(self.upload_dir) as entries:
+                names = heapq.nsmallest(self.batch_size, (e.name for e in entries if e.name > state["uploads_cursor"]))
+        except FileNotFoundError:
+            return {"checked": 0, "orphans_removed": 0}
+        state["uploads_cursor"] = names[-1] if len(names) == self.batch_size else ""
+
+        candidates = {}
+        now = time.time()
+        retired = {os.path.abspath(path) for path, _ in state["retired"]}  # Removed by _purge_retired instead
+        for name in names:
+            path = os.path.join(self.upload_dir, name)
+            if os.path.abspath(path) in retired:
+                continue
+            try:
+                info = os.stat(path)
+            except FileNotFoundError:
+                continue
+            if os.path.isfile(path) and now - info.st_mtime > self.grace_s:
+                candidates[path] = {path, os.path.abspath(path)}  # Rows may store either form
+        lookup = [variant for variants in candidates.values() for variant in variants]
+        referenced = set()
+        for start in range(0, len(lookup), 500):
+            rows = db.query(FileUpload.file_path).filter(FileUpload.file_path.in_(lookup[start:start + 500])).all()
+            referenced.update(row[0] for row in rows)
+
+        removed = 0
+        for path, variants in candidates.items():
+            if variants & referenced:
+                continue
+            try:
+                os.remove(path)
+                removed += 1
+                logger.info(f"Removed orphaned upload {path}")
+            except OSError as e:
+                logger.error(f"Could not remove orphaned upload {path}: {e}")
+        self.totals["orphans_removed"] += removed
+        return {"checked": len(names), "orphans_removed": removed}
+
+    def _reconcile_rows(self, db: Session, state: dict) -> dict:
+        """Next batch_size rows by ID (wrapping around): rows whose original is missing from disk."""
+        rows = (
+            db.query(FileUpload.id, FileUpload.file_path, FileUpload.status)
+            .filter(FileUpload.id > state["rows_cursor"])
+            .order_by(FileUpload.id)
+            .limit(self.batch_size)
+            .all()
+        )
+        state["rows_cursor"] = rows[-1][0] if len(rows) == self.batch_size else 0
+        missing, marked = 0, 0
+        for file_id, file_path, status in rows:
+            if file_path and os.path.exists(file_path):
+                continue
+            missing += 1
+            if status == "pending":
+                # Cannot ever be (re)processed; say so instead of leaving it queued
+                db.query(FileUpload).filter(FileUpload.id == file_id).update(
+                    {FileUpload.status: "failed", FileUpload.processing_result: {"error": "Original file missing from storage"}}
+                )
+                marked += 1
+            else:
+                logger.warning(f"Original of file ID {file_id} ({status}) is missing: {file_path}")
+        if marked:
+            db.commit()
+        self.totals["missing_originals"] += missing
+        return {"checked": len(rows), "missing_originals": missing, "marked_failed": marked}
+
+
+_manager: Optional[StorageLifecycleManager] = None
+_manager_lock = threading.Lock()
+
+
+def get_storage_lifecycle() -> StorageLifecycleManager:
+    """Process-wide lifecycle manager (created on first use)."""
+    global _manager
+    if _manager is None:
+        with _manager_lock:
+            if _manager is None:
+                _manager = StorageLifecycleManager()
+    return _manager
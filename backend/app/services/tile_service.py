@@ -0,0 +1,146 @@
+# backend/app/services/tile_service.py
+import hashlib
+import json
+import math
+import os
+import shutil
+from typing import Dict, Optional
+
+from PIL import Image
+
+from app.config.settings import get_settings
+from app.utils.logger import setup_logger
+from app.utils.exceptions import FileProcessingError
+
+settings = get_settings()
+logger = setup_logger("tile_service")
+
+DESCRIPTOR_NAME = "pyramid.json"
+
+# Layers generated per processed file
+LAYER_ORIGINAL = "original"
+LAYER_MEAN = "mean"
+LAYER_UNCERTAINTY = "uncertainty"
+
+
+def build_pyramid(image: Image.Image, out_dir: str, tile_size: int, fmt: str, quality: int) -> dict:
+    """
+    Writes an XYZ-style tile pyramid: {out_dir}/{z}/{x}_{y}.{fmt} plus pyramid.json.
+    Level 0 fits in one tile (it doubles as the thumbnail); the top level is full resolution.
+    Each level is built from the one above with Image.reduce(2), never from the original.
+    """
+    image = image.convert("RGB")
+    width, height = image.size
+    max_level = max(0, math.ceil(math.log2(max(width, height) / tile_size)))
+    save_kwargs = {"quality": quality} if fmt in ("webp", "jpeg") else {}
+    pil_format = {"jpg": "JPEG", "jpeg": "JPEG"}.get(fmt, fmt.upper())
+
+    # Write into a temp dir and rename, so viewers never see a half-written pyramid
+    tmp_dir = f"{out_dir}.tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    levels = []
+    level_img = image
+    for level in range(max_level, -1, -1):
+        level_dir = os.path.join(tmp_dir, str(level))
+        os.makedirs(level_dir, exist_ok=True)
+        level_w, level_h = level_img.size
+        cols, rows = math.ceil(level_w / tile_size), math.ceil(level_h / tile_size)
+        for ty in range(rows):
+            for tx in range(cols):
+                box = (tx * tile_size, ty * tile_size, min((tx + 1) * tile_size, level_w), min((ty + 1) * tile_size, level_h))
+                level_img.crop(box).save(os.path.join(level_dir, f"{tx}_{ty}.{fmt}"), format=pil_format, **save_kwargs)
+        levels.append({"level": level, "width": level_w, "height": level_h, "cols": cols, "rows": rows})
+        if level > 0:
+            level_img = level_img.reduce(2)
+
+    descriptor = {
+        "width": width,
+        "height": height,
+        "tile_size": tile_size,
+        "format": fmt,
+        "max_level": max_level,
+        "levels": sorted(levels, key=lambda entry: entry["level"]),
+    }
+    with open(os.path.join(tmp_dir, DESCRIPTOR_NAME), "w") as f:
+        json.dump(descriptor, f)
+
+    shutil.rmtree(out_dir, ignore_errors=True)
+    os.replace(tmp_dir, out_dir)
+    return descriptor
+
+
+class TileService:
+    """
+    Generates and locates deep-zoom tile pyramids under settings.TILE_DIR (served at settings.TILES_URL).
+
+    Layout: {file_id}/{original_version}/original/...
+            {file_id}/{result_version}/mean/... and .../uncertainty/...
+    Result layers are keyed by result version and the original by a hash of the stored upload name
+    (original_version), so every tile URL is immutable and can be cached forever, even when a
+    database reuses the ID of a deleted file.
+    """
+
+    def __init__(self):
+        self.tile_dir = settings.TILE_DIR
+        self.tile_size = settings.TILE_SIZE
+        self.format = settings.TILE_FORMAT
+        self.quality = settings.TILE_QUALITY
+
+    def _url(self, *parts) -> str:
+        return "/".join([settings.TILES_URL.rstrip("/")] + [str(p) for p in parts])
+
+    @staticmethod
+    def original_version(filename: str) -> str:
+        """Version key of a file's original layer, from its stored (unique) upload name."""
+        return hashlib.blake2b(filename.encode("utf-8"), digest_size=8).hexdigest()
+
+    def descriptor_url(self, file_id: int, layer: str, version: str) -> str:
+        """version: original_version() for the original layer, the result version for the others."""
+        return self._url(file_id, version, layer, DESCRIPTOR_NAME)
+
+    def thumbnail_url(self, file_id: int, filename: str) -> Optional[str]:
+        """Level-0 tile of the original pyramid (whole image in one tile), or None if not built yet."""
+        version = self.original_version(filename)
+        thumbnail_name = f"0_0.{self.format}"
+        if not os.path.exists(os.path.join(self.tile_dir, str(file_id), version, LAYER_ORIGINAL, "0", thumbnail_name)):
+            return None
+        return self._url(file_id, version, LAYER_ORIGINAL, 0, thumbnail_name)
+
+    def build_for_file(self, file_id: int, filename: str, original_path: str, mean_image: Image.Image,
+                       uncertainty_image: Image.Image, result_version: str) -> Dict[str, str]:
+        """
+        Builds all three pyramids; returns {layer: descriptor URL}. filename is the stored upload name
+        (keys the original layer). Pyramids of earlier result versions or uploads are removed.
+        """
+        file_dir = os.path.join(self.tile_dir, str(file_id))
+        original_version = self.original_version(filename)
+        try:
+            original_dir = os.path.join(file_dir, original_version, LAYER_ORIGINAL)
+            if not os.path.exists(os.path.join(original_dir, DESCRIPTOR_NAME)):
+                with Image.open(original_path) as original:
+                    build_pyramid(original, original_dir, self.tile_size, self.format, self.quality)
+
+            version_dir = os.path.join(file_dir, result_version)
+            build_pyramid(mean_image, os.path.join(version_dir, LAYER_MEAN), self.tile_size, self.format, self.quality)
+            build_pyramid(uncertainty_image, os.path.join(version_dir, LAYER_UNCERTAINTY), self.tile_size, self.format, self.quality)
+
+            # Drop pyramids from earlier processing runs of this file
+            for entry in os.listdir(file_dir):
+                if entry not in (original_version, result_version):
+                    shutil.rmtree(os.path.join(file_dir, entry), ignore_errors=True)
+        except Exception as e:
+            logger.error(f"Error building tile pyramids for file ID {file_id}: {str(e)}", exc_info=True)
+            raise FileProcessingError(f"Failed to build tile pyramids: {str(e)}")
+
+        logger.info(f"Built tile pyramids for file ID {file_id} (version {result_version})")
+        return {
+            LAYER_ORIGINAL: self.descriptor_url(file_id, LAYER_ORIGINAL, original_version),
+            LAYER_MEAN: self.descriptor_url(file_id, LAYER_MEAN, result_version),
+            LAYER_UNCERTAINTY: self.descriptor_url(file_id, LAYER_UNCERTAINTY, result_version),
+        }
+
+    def delete_for_file(self, file_id: int):
+        file_dir = os.path.join(self.tile_dir, str(file_id))
+        if os.path.exists(file_dir):
+            shutil.rmtree(file_dir, ignore_errors=True)
+            logger.info(f"Deleted tile pyramids for file ID {file_id}")
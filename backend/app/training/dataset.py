@@ -0,0 +1,142 @@
+# backend/app/training/dataset.py
+"""
+Pre-decoded training data: images are decoded and resized once into uint8
+memory-mapped shards, so epochs read raw pixels instead of re-decoding JPEGs.
+
+    python -m app.training.dataset --src /path/to/images --out data/shards --size 512
+"""
+import argparse
+import bisect
+import glob
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional
+
+import numpy as np
+import torch
+from PIL import Image
+from torch.utils.data import Dataset
+
+from app.utils.image_utils import load_image_for_model
+from app.utils.logger import setup_logger
+
+logger = setup_logger("training_dataset")
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".tif", ".tiff", ".bmp")
+MANIFEST_NAME = "manifest.json"
+
+
+def find_images(image_dir: str) -> List[str]:
+    """Lists supported image files under image_dir (recursive, case-insensitive extensions)."""
+    paths = [
+        p for p in glob.glob(os.path.join(image_dir, "**", "*"), recursive=True)
+        if p.lower().endswith(IMAGE_EXTENSIONS)
+    ]
+    return sorted(paths)
+
+
+def _decode_resized(args) -> Optional[np.ndarray]:
+    """Worker: decodes one image to a (size, size, 3) uint8 array, or None if it is unreadable."""
+    path, size = args
+    try:
+        img = load_image_for_model(path, (size, size))
+        img = img.resize((size, size), Image.BILINEAR)
+        return np.asarray(img, dtype=np.uint8)
+    except Exception as e:
+        logger.warning(f"Skipping unreadable image {path}: {e}")
+        return None
+
+
+def build_shards(src_dir: str, out_dir: str, image_size: int = 512, shard_size: int = 1024, workers: int = None) -> dict:
+    """
+    Decodes every image in src_dir once and writes (N, H, W, 3) uint8 .npy shards plus a manifest.
+    Decoding runs in a process pool; broken images are skipped instead of replaced with placeholders.
+    """
+    paths = find_images(src_dir)
+    if not paths:
+        raise ValueError(f"No images found in {src_dir}")
+    os.makedirs(out_dir, exist_ok=True)
+    logger.info(f"Building shards for {len(paths)} images from {src_dir} into {out_dir} (size={image_size})")
+
+    shards = []
+    sources = []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for shard_idx, start in enumerate(range(0, len(paths), shard_size)):
+            chunk = paths[start:start + shard_size]
+            decoded = list(pool.map(_decode_resized, [(p, image_size) for p in chunk], chunksize=16))
+            valid = [(p, arr) for p, arr in zip(chunk, decoded) if arr is not None]
+            if not valid:
+                continue
+
+            shard_name = f"shard_{shard_idx:05d}.npy"
+            shard = np.lib.format.open_memmap(
+                os.path.join(out_dir, shard_name), mode="w+", dtype=np.uint8,
+                shape=(len(valid), image_size, image_size, 3)
+            )
+            for i, (_, arr) in enumerate(valid):
+                shard[i] = arr
+            shard.flush()
+            del shard
+
+            shards.append({"file": shard_name, "count": len(valid)})
+            sources.extend(p for p, _ in valid)
+            logger.info(f"Wrote {shard_name} with {len(valid)} images")
+
+    manifest = {"image_size": image_size, "shards": shards, "sources": sources}
+    with open(os.path.join(out_dir, MANIFEST_NAME), "w") as f:
+        json.dump(manifest, f, indent=2)
+    logger.info(f"Shard build complete: {len(sources)} images in {len(shards)} shards")
+    return manifest
+
+
+class ShardDataset(Dataset):
+    """
+    Reads pre-decoded images from memory-mapped shards as (3, H, W) uint8 tensors.
+    Shards are opened lazily per process, so DataLoader workers share the OS page cache
+    instead of pickling arrays. Convert to float on the training device (x.float() / 255).
+    """
+
+    def __init__(self, shard_dir: str):
+        with open(os.path.join(shard_dir, MANIFEST_NAME)) as f:
+            manifest = json.load(f)
+        self.shard_dir = shard_dir
+        self.image_size = manifest["image_size"]
+        self.shard_files = [s["file"] for s in manifest["shards"]]
+        self.offsets = np.cumsum([0] + [s["count"] for s in manifest["shards"]]).tolist()
+        self._shards = None  # Opened on first access in each worker process
+
+    def __len__(self):
+        return self.offsets[-1]
+
+    def _open_shards(self):
+        self._shards = [np.load(os.path.join(self.shard_dir, f), mmap_mode="r") for f in self.shard_files]
+
+    def __getitem__(self, idx):
+        if self._shards is None:
+            self._open_shards()
+        shard_idx = bisect.bisect_right(self.offsets, idx) - 1
+        arr = self._shards[shard_idx][idx - self.offsets[shard_idx]]
+        # Copy out of the read-only mmap, HWC -> CHW
+        return torch.from_numpy(np.ascontiguousarray(arr)).permute(2, 0, 1)
+
+    def __getstate__(self):
+        # Never ship open memmaps to workers; each re-opens its own view
+        state = self.__dict__.copy()
+        state["_shards"] = None
+        return state
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Decode an image corpus once into memory-mapped training shards.")
+    parser.add_argument("--src", required=True, help="Directory containing source images (searched recursively)")
+    parser.add_argument("--out", required=True, help="Output directory for shards and manifest.json")
+    parser.add_argument("--size", type=int, default=512, help="Square image size to resize to")
+    parser.add_argument("--shard-size", type=int, default=1024, help="Images per shard")
+    parser.add_argument("--workers", type=int, default=None, help="Decode processes (default: CPU count)")
+    args = parser.parse_args()
+    build_shards(args.src, args.out, image_size=args.size, shard_size=args.shard_size, workers=args.workers)
+
+
+if __name__ == "__main__":
+    main()
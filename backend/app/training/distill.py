@@ -0,0 +1,200 @@
+# backend/app/training/distill.py
+"""
+Distills a single-pass MeanVarianceStudent from the DropoutAutoencoder teacher's MC statistics.
+
+    python -m app.training.distill --shards data/shards --teacher models/ml_model --output models/student_model
+    python -m app.training.distill --shards data/shards --teacher models/ml_model --output models/student_model --eval-only
+
+The student is served by setting MODEL_TYPE = "student" (weights at STUDENT_MODEL_PATH).
+"""
+import argparse
+import json
+import os
+import time
+
+import torch
+import torch.nn.functional as F
+import torch.optim as optim
+from torch.utils.data import DataLoader, Subset
+
+from app.models.ml.autoencoder import DropoutAutoencoder, enable_dropout, load_dropout_autoencoder, mc_dropout_predict
+from app.models.ml.student import MeanVarianceStudent
+from app.training.dataset import ShardDataset
+from app.training.train import export_weights, save_checkpoint
+from app.utils.logger import setup_logger
+
+logger = setup_logger("distillation")
+
+VARIANCE_EPS = 1e-8  # Floor before log() of teacher variances
+CHECKPOINT_NAME = "student_last.pt"
+
+
+def load_teacher(path: str, dropout_p: float, device: torch.device) -> DropoutAutoencoder:
+    """Loads the teacher exactly as MLService does: eval mode with dropout re-enabled."""
+    teacher = load_dropout_autoencoder(path, dropout_p, map_location=device)
+    teacher.to(device)
+    teacher.eval()
+    enable_dropout(teacher)
+    return teacher
+
+
+def distillation_loss(student, imgs, teacher_mean, teacher_var, variance_weight: float):
+    """MSE on the mean plus MSE on log-variance (variances span orders of magnitude)."""
+    mean, logvar = student.forward_logvar(imgs)
+    loss_mean = F.mse_loss(mean, teacher_mean)
+    loss_var = F.mse_loss(logvar, torch.log(teacher_var + VARIANCE_EPS))
+    return loss_mean + variance_weight * loss_var, loss_mean, loss_var
+
+
+def _uncertainty_map(variance: torch.Tensor) -> torch.Tensor:
+    """Channel-mean variance, (B, H, W), as MLService renders it."""
+    return variance.mean(dim=1)
+
+
+def _pearson(a: torch.Tensor, b: torch.Tensor) -> torch.Tensor:
+    """Per-sample Pearson correlation of flattened maps, (B,)."""
+    a = a.flatten(1) - a.flatten(1).mean(dim=1, keepdim=True)
+    b = b.flatten(1) - b.flatten(1).mean(dim=1, keepdim=True)
+    return (a * b).sum(dim=1) / (a.norm(dim=1) * b.norm(dim=1) + 1e-12)
+
+
+def evaluate(teacher, student, loader, num_samples: int, device: torch.device) -> dict:
+    """
+    Compares student outputs against MC ground truth from the teacher.
+    Reports mean-reconstruction MSE, log-variance MSE, uncertainty-map Pearson correlation,
+    top-10% uncertain-pixel overlap (IoU), and wall-clock time per image for each side.
+    """
+    student.eval()
+    totals = {"mean_mse": 0.0, "logvar_mse": 0.0, "uncertainty_pearson": 0.0, "top10_iou": 0.0}
+    teacher_time = student_time = 0.0
+    count = 0
+
+    with torch.no_grad():
+        for imgs in loader:
+            imgs = imgs.to(device).float().div_(255.0)
+
+            start = time.perf_counter()
+            teacher_mean, teacher_var = mc_dropout_predict(teacher, imgs, num_samples)
+            teacher_time += time.perf_counter() - start
+
+            start = time.perf_counter()
+            student_mean, student_var = student(imgs)
+            student_time += time.perf_counter() - start
+
+            batch = imgs.size(0)
+            totals["mean_mse"] += F.mse_loss(student_mean, teacher_mean, reduction="none").flatten(1).mean(1).sum().item()
+            totals["logvar_mse"] += F.mse_loss(
+                torch.log(student_var + VARIANCE_EPS), torch.log(teacher_var + VARIANCE_EPS), reduction="none"
+            ).flatten(1).mean(1).sum().item()
+
+            t_map, s_map = _uncertainty_map(teacher_var), _uncertainty_map(student_var)
+            totals["uncertainty_pearson"] += _pearson(t_map, s_map).sum().item()
+
+            # Do both maps flag the same most-uncertain regions?
+            t_flat, s_flat = t_map.flatten(1), s_map.flatten(1)
+            k = max(1, t_flat.shape[1] // 10)
+            t_top = torch.zeros_like(t_flat, dtype=torch.bool).scatter_(1, t_flat.topk(k, dim=1).indices, True)
+            s_top = torch.zeros_like(s_flat, dtype=torch.bool).scatter_(1, s_flat.topk(k, dim=1).indices, True)
+            iou = (t_top & s_top).sum(1).float() / (t_top | s_top).sum(1).float()
+            totals["top10_iou"] += iou.sum().item()
+
+            count += batch
+
+    report = {name: value / count for name, value in totals.items()}
+    report.update({
+        "images": count,
+        "mc_samples": num_samples,
+        "teacher_seconds_per_image": teacher_time / count,
+        "student_seconds_per_image": student_time / count,
+        "speedup": teacher_time / student_time if student_time > 0 else None,
+    })
+    return report
+
+
+def distill(args) -> dict:
+    device = torch.device(args.device or ("cuda" if torch.cuda.is_available() else "cpu"))
+    dataset = ShardDataset(args.shards)
+    if len(dataset) == 0:
+        raise ValueError(f"No training images in {args.shards}")
+
+    # Deterministic hold-out split for evaluation
+    generator = torch.Generator().manual_seed(args.seed)
+    order = torch.randperm(len(dataset), generator=generator).tolist()
+    eval_count = max(1, int(len(dataset) * args.eval_fraction))
+    eval_set, train_set = Subset(dataset, order[:eval_count]), Subset(dataset, order[eval_count:])
+
+    loader_kwargs = dict(num_workers=args.workers, pin_memory=device.type == "cuda", persistent_workers=args.workers > 0)
+    eval_loader = DataLoader(eval_set, batch_size=args.batch_size, shuffle=False, **loader_kwargs)
+
+    teacher = load_teacher(args.teacher, args.dropout, device)
+    student = MeanVarianceStudent().to(device)
+
+    if args.eval_only:
+        student.load_state_dict(torch.load(args.output, map_location=device))
+    else:
+        train_loader = DataLoader(train_set, batch_size=args.batch_size, shuffle=True, **loader_kwargs)
+        optimizer = optim.AdamW(student.parameters(), lr=args.lr, weight_decay=args.weight_decay)
+        os.makedirs(args.checkpoint_dir, exist_ok=True)
+        checkpoint_path = os.path.join(args.checkpoint_dir, CHECKPOINT_NAME)
+        logger.info(f"Distilling on {device}: {len(train_set)} train / {len(eval_set)} eval images, T={args.mc_samples}")
+
+        for epoch in range(args.epochs):
+            student.train()
+            running_mean = running_var = 0.0
+            seen = 0
+            epoch_start = time.perf_counter()
+
+            for imgs in train_loader:
+                imgs = imgs.to(device, non_blocking=True).float().div_(255.0)
+                # Targets: teacher MC statistics (no grad through the teacher)
+                teacher_mean, teacher_var = mc_dropout_predict(teacher, imgs, args.mc_samples)
+
+                total, loss_mean, loss_var = distillation_loss(student, imgs, teacher_mean, teacher_var, args.variance_weight)
+                optimizer.zero_grad(set_to_none=True)
+                total.backward()
+                optimizer.step()
+
+                seen += imgs.size(0)
+                running_mean += loss_mean.item() * imgs.size(0)
+                running_var += loss_var.item() * imgs.size(0)
+
+            elapsed = time.perf_counter() - epoch_start
+            logger.info(
+                f"Epoch [{epoch + 1}/{args.epochs}] Mean MSE: {running_mean / seen:.6f}, "
+                f"LogVar MSE: {running_var / seen:.4f} | {seen / elapsed:.1f} img/s"
+            )
+            save_checkpoint(checkpoint_path, student, optimizer, epoch)
+            export_weights(args.output, student)
+
+    report = evaluate(teacher, student, eval_loader, args.mc_samples, device)
+    logger.info(f"Student vs MC teacher: {json.dumps(report)}")
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump(report, f, indent=2)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Distill a single-pass mean/variance student from the MC dropout teacher.")
+    parser.add_argument("--shards", required=True, help="Shard directory produced by app.training.dataset")
+    parser.add_argument("--teacher", default="models/ml_model", help="DropoutAutoencoder weights")
+    parser.add_argument("--output", default="models/student_model", help="Student weights (STUDENT_MODEL_PATH)")
+    parser.add_argument("--checkpoint-dir", default="checkpoints")
+    parser.add_argument("--report", default=None, help="Optional JSON path for the evaluation report")
+    parser.add_argument("--eval-only", action="store_true", help="Skip training; evaluate --output against the teacher")
+    parser.add_argument("--mc-samples", type=int, default=30, help="Teacher MC passes per target")
+    parser.add_argument("--epochs", type=int, default=20)
+    parser.add_argument("--batch-size", type=int, default=8)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--lr", type=float, default=1e-3)
+    parser.add_argument("--weight-decay", type=float, default=5e-5)
+    parser.add_argument("--variance-weight", type=float, default=0.1, help="Weight of the log-variance loss")
+    parser.add_argument("--dropout", type=float, default=0.25, help="Teacher dropout_p")
+    parser.add_argument("--eval-fraction", type=float, default=0.1)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--device", default=None)
+    distill(parser.parse_args())
+
+
+if __name__ == "__main__":
+    main()
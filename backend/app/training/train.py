@@ -0,0 +1,146 @@
+# backend/app/training/train.py
+"""
+Trains DropoutAutoencoder on pre-decoded shards (see app.training.dataset).
+
+    python -m app.training.train --shards data/shards --output models/ml_model --epochs 50
+
+--output receives a plain state_dict that MLService._load_model can load directly;
+--checkpoint-dir keeps resumable checkpoints (model + optimizer + epoch).
+"""
+import argparse
+import os
+import time
+
+import torch
+import torch.nn as nn
+import torch.optim as optim
+from torch.utils.data import DataLoader
+
+from app.models.ml.autoencoder import DropoutAutoencoder
+from app.models.ml.losses import GradientLoss
+from app.training.dataset import ShardDataset
+from app.utils.logger import setup_logger
+
+logger = setup_logger("training")
+
+CHECKPOINT_NAME = "last.pt"
+
+
+def build_loader(shard_dir: str, batch_size: int, workers: int, device: torch.device) -> DataLoader:
+    dataset = ShardDataset(shard_dir)
+    if len(dataset) == 0:
+        raise ValueError(f"No training images in {shard_dir}")
+    return DataLoader(
+        dataset,
+        batch_size=batch_size,
+        shuffle=True,
+        num_workers=workers,
+        pin_memory=device.type == "cuda",
+        persistent_workers=workers > 0,
+        prefetch_factor=4 if workers > 0 else None,
+        drop_last=len(dataset) > batch_size,
+    )
+
+
+def save_checkpoint(path: str, model: nn.Module, optimizer: optim.Optimizer, epoch: int):
+    """Writes a resumable checkpoint atomically (tmp file + rename)."""
+    tmp_path = f"{path}.tmp"
+    torch.save({"epoch": epoch, "model_state": model.state_dict(), "optimizer_state": optimizer.state_dict()}, tmp_path)
+    os.replace(tmp_path, path)
+
+
+def export_weights(path: str, model: nn.Module):
+    """Writes a weights-only state_dict in the format MLService._load_model expects."""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    torch.save({k: v.detach().cpu() for k, v in model.state_dict().items()}, tmp_path)
+    os.replace(tmp_path, path)
+
+
+def train(args) -> nn.Module:
+    device = torch.device(args.device or ("cuda" if torch.cuda.is_available() else "cpu"))
+    if args.threads:
+        torch.set_num_threads(args.threads)
+    logger.info(f"Training on {device} (bf16={args.bf16}, workers={args.workers}, batch={args.batch_size})")
+
+    loader = build_loader(args.shards, args.batch_size, args.workers, device)
+    model = DropoutAutoencoder(dropout_p=args.dropout, bottleneck_channels=args.bottleneck_channels).to(device)
+    optimizer = optim.AdamW(model.parameters(), lr=args.lr, weight_decay=args.weight_decay)
+    recon_loss_fn = nn.MSELoss()
+    gradient_loss_fn = GradientLoss()
+
+    start_epoch = 0
+    checkpoint_path = os.path.join(args.checkpoint_dir, CHECKPOINT_NAME)
+    os.makedirs(args.checkpoint_dir, exist_ok=True)
+    if args.resume and os.path.exists(checkpoint_path):
+        checkpoint = torch.load(checkpoint_path, map_location=device)
+        model.load_state_dict(checkpoint["model_state"])
+        optimizer.load_state_dict(checkpoint["optimizer_state"])
+        start_epoch = checkpoint["epoch"] + 1
+        logger.info(f"Resumed from {checkpoint_path} at epoch {start_epoch}")
+
+    for epoch in range(start_epoch, args.epochs):
+        model.train()
+        running = {"total": 0.0, "recon": 0.0, "grad": 0.0}
+        seen = 0
+        epoch_start = time.perf_counter()
+
+        for imgs in loader:
+            # Shards hold uint8; scale on the device so workers only move bytes
+            imgs = imgs.to(device, non_blocking=True).float().div_(255.0)
+
+            with torch.autocast(device_type=device.type, dtype=torch.bfloat16, enabled=args.bf16):
+                outputs = model(imgs)
+            # Losses in fp32 for stable reductions
+            outputs = outputs.float()
+            loss_recon = recon_loss_fn(outputs, imgs)
+            loss_grad = gradient_loss_fn(outputs, imgs)
+            total_loss = loss_recon + args.lambda_gradient * loss_grad
+
+            optimizer.zero_grad(set_to_none=True)
+            total_loss.backward()
+            optimizer.step()
+
+            batch = imgs.size(0)
+            seen += batch
+            running["total"] += total_loss.item() * batch
+            running["recon"] += loss_recon.item() * batch
+            running["grad"] += loss_grad.item() * batch
+
+        elapsed = time.perf_counter() - epoch_start
+        logger.info(
+            f"Epoch [{epoch + 1}/{args.epochs}] "
+            f"Total: {running['total'] / seen:.4f} (Recon: {running['recon'] / seen:.4f}, Grad: {running['grad'] / seen:.4f}) "
+            f"| {seen} images in {elapsed:.1f}s ({seen / elapsed:.1f} img/s)"
+        )
+
+        save_checkpoint(checkpoint_path, model, optimizer, epoch)
+        export_weights(args.output, model)
+
+    logger.info(f"Training finished. Weights exported to {args.output}")
+    return model
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Train DropoutAutoencoder from memory-mapped shards.")
+    parser.add_argument("--shards", required=True, help="Shard directory produced by app.training.dataset")
+    parser.add_argument("--output", default="models/ml_model", help="Weights-only state_dict for MLService")
+    parser.add_argument("--checkpoint-dir", default="checkpoints", help="Directory for resumable checkpoints")
+    parser.add_argument("--resume", action="store_true", help="Resume from the last checkpoint if present")
+    parser.add_argument("--epochs", type=int, default=50)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--workers", type=int, default=4, help="DataLoader worker processes")
+    parser.add_argument("--threads", type=int, default=0, help="torch intra-op threads (0 = default)")
+    parser.add_argument("--lr", type=float, default=1e-3)
+    parser.add_argument("--weight-decay", type=float, default=5e-5)
+    parser.add_argument("--lambda-gradient", type=float, default=0.1, help="Weight of the Sobel gradient loss")
+    parser.add_argument("--dropout", type=float, default=0.25, help="Must match the dropout_p used for serving")
+    parser.add_argument("--bottleneck-channels", type=int, default=512,
+                        help="Latent width (the training notebook used 256); set bottleneck_channels in the registry to match")
+    parser.add_argument("--bf16", action="store_true", help="bf16 autocast for the forward pass (CPU or CUDA)")
+    parser.add_argument("--device", default=None, help="Force a device (e.g. cpu, cuda)")
+    train(parser.parse_args())
+
+
+if __name__ == "__main__":
+    main()
@@ -33,4 +33,27 @@ class FileTooLargeError(HTTPException):
         super().__init__(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail=f"File too large. Maximum size: {max_size}MB"
-        ) 
\ No newline at end of file
+        )
+
+class ImageTooLargeError(HTTPException):
+    def __init__(self, max_pixels: int, width: int = None, height: int = None):
+        dimensions = f": {width}x{height}" if width and height else ""
+        super().__init__(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Image dimensions too large{dimensions}. Maximum pixels: {max_pixels}"
+        )
+
+class ModelNotFoundError(HTTPException):
+    def __init__(self, version: str):
+        super().__init__(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Model version '{version}' is not registered"
+        )
+
+class ServiceOverloadedError(HTTPException):
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail=f"Server is busy: {reason}. Retry after {retry_after}s",
+            headers={"Retry-After": str(retry_after)}
+        )
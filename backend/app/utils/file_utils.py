@@ -1,8 +1,10 @@
 import os
+import shutil
+import uuid
 from pathlib import Path
-from typing import Optional
+from typing import Optional, Tuple
 from fastapi import UploadFile
-from config.settings import get_settings
+from app.config.settings import get_settings
 
 settings = get_settings()
 
@@ -23,6 +25,22 @@ def save_upload_file(upload_file: UploadFile) -> str:
     
     return filename
 
+def save_upload_file_to_dir(upload_file: UploadFile, destination_dir: str) -> Tuple[str, str]:
+    """
+    Save an uploaded file under a unique name and return (saved filename, absolute path).
+    Names are never reused, so URLs and tile versions derived from them stay valid.
+    """
+    os.makedirs(destination_dir, exist_ok=True)
+    suffix = Path(upload_file.filename or "").suffix.lower()
+    filename = f"{uuid.uuid4().hex}{suffix}"
+    file_path = os.path.abspath(os.path.join(destination_dir, filename))
+
+    upload_file.file.seek(0) # Validation may have read the header already
+    with open(file_path, "wb") as buffer:
+        shutil.copyfileobj(upload_file.file, buffer)
+
+    return filename, file_path
+
 def delete_file(filename: str) -> bool:
     """Delete a file by its filename."""
     file_path = get_upload_path(filename)
@@ -0,0 +1,54 @@
+# backend/app/utils/http_cache.py
+import hashlib
+from datetime import datetime
+from typing import Optional
+
+from fastapi.staticfiles import StaticFiles
+
+# Completed results only change when a file is reprocessed, so clients may keep
+# them but must revalidate (cheap 304) before reuse.
+RESULT_CACHE_CONTROL = "private, no-cache"
+
+
+def compute_result_hash(*artifacts: Optional[str]) -> str:
+    """Returns a sha256 hex digest over the given result artifacts (e.g. base64 images)."""
+    digest = hashlib.sha256()
+    for artifact in artifacts:
+        digest.update((artifact or "").encode("utf-8"))
+        digest.update(b"\0")  # Separator so ("ab", "c") and ("a", "bc") differ
+    return digest.hexdigest()
+
+
+def build_etag(file_id: int, status: str, updated_at: Optional[datetime], result_hash: Optional[str]) -> str:
+    """Builds a strong ETag from the result version (id, status, updated_at, artifact hash)."""
+    version = f"{file_id}:{status}:{updated_at.isoformat() if updated_at else ''}:{result_hash or ''}"
+    return '"' + hashlib.sha256(version.encode("utf-8")).hexdigest()[:32] + '"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Checks an If-None-Match header against an ETag (weak comparison, as RFC 9110 requires)."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == etag:
+            return True
+    return False
+
+
+class ImmutableStaticFiles(StaticFiles):
+    """StaticFiles that marks served files as immutable with a long-lived Cache-Control."""
+
+    def __init__(self, *args, max_age: int = 31536000, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.cache_control = f"public, max-age={max_age}, immutable"
+
+    def file_response(self, *args, **kwargs):
+        response = super().file_response(*args, **kwargs)
+        if response.status_code in (200, 206, 304):
+            response.headers["Cache-Control"] = self.cache_control
+        return response
@@ -0,0 +1,68 @@
+# backend/app/utils/image_utils.py
+from typing import BinaryIO, Optional, Tuple, Union
+from PIL import Image
+
+# Magic byte signatures for the upload types we accept
+_MAGIC_SIGNATURES = [
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"II*\x00", "image/tiff"),  # Little-endian TIFF
+    (b"MM\x00*", "image/tiff"),  # Big-endian TIFF
+    (b"BM", "image/bmp"),
+]
+
+# Enough bytes to cover the longest signature above
+SNIFF_BYTES = 16
+
+
+def sniff_image_type(header: bytes) -> Optional[str]:
+    """Returns the MIME type implied by the file's leading magic bytes, or None if unknown."""
+    for signature, mime_type in _MAGIC_SIGNATURES:
+        if header.startswith(signature):
+            return mime_type
+    return None
+
+
+def read_image_dimensions(fp: BinaryIO) -> Tuple[int, int]:
+    """
+    Reads (width, height) from the image header only; pixel data is not decoded.
+    Raises an exception if the header cannot be parsed.
+    """
+    position = fp.tell()
+    try:
+        with Image.open(fp) as img:  # Image.open is lazy: only the header is parsed here
+            return img.size
+    finally:
+        fp.seek(position)
+
+
+def _target_min_dims(target_size: Union[int, Tuple[int, int]], width: int, height: int) -> Tuple[int, int]:
+    """Smallest (width, height) the decoded image may have before the final model Resize."""
+    if isinstance(target_size, int):
+        # torchvision Resize(int) matches the shorter edge to target_size, keeping aspect ratio
+        scale = target_size / min(width, height)
+        return max(1, round(width * scale)), max(1, round(height * scale))
+    target_h, target_w = target_size  # torchvision order is (h, w)
+    return target_w, target_h
+
+
+def load_image_for_model(image_path: str, target_size: Union[int, Tuple[int, int]]) -> Image.Image:
+    """
+    Opens an image as RGB, downscaling as early as possible while staying at or above target_size.
+    JPEGs use DCT-domain draft decoding (1/2, 1/4, 1/8 scale); other formats use Image.reduce
+    (integer box reduction), which is much cheaper than resizing the full-resolution image.
+    """
+    with Image.open(image_path) as img:
+        width, height = img.size
+        min_w, min_h = _target_min_dims(target_size, width, height)
+
+        if img.format == "JPEG":
+            # draft() picks the largest DCT scale whose result is still >= the requested size
+            img.draft("RGB", (min_w, min_h))
+            img = img.convert("RGB")
+        else:
+            img = img.convert("RGB")
+            factor = min(width // min_w, height // min_h)
+            if factor >= 2:
+                img = img.reduce(factor)
+        return img
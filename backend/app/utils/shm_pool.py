@@ -0,0 +1,132 @@
+# backend/app/utils/shm_pool.py
+"""
+Shared-memory slabs for handing arrays between processes without pickling them.
+
+The owner (API process) creates a fixed pool of equally sized slabs once and recycles them through
+a free list. A job takes one slab, lays out its arrays in it (SlabLayout) and sends only the ArrayRef
+descriptors, a few dozen bytes each, to the other process. There attach_array() maps them back to
+numpy views of the same memory; segments are attached once per process and cached.
+"""
+import threading
+from collections import deque
+from dataclasses import dataclass
+from multiprocessing import shared_memory
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+_ALIGN = 64  # Cache-line aligned arrays
+
+
+@dataclass(frozen=True)
+class ArrayRef:
+    """Location of one array in a shared-memory slab; this (not the data) crosses the process boundary."""
+    slab: str  # SharedMemory name
+    offset: int
+    shape: Tuple[int, ...]
+    dtype: str
+
+
+class SlabPool:
+    """Fixed set of shared-memory slabs, created up front and recycled through a free list."""
+
+    def __init__(self, num_slabs: int, slab_bytes: int):
+        self.slab_bytes = slab_bytes
+        self._slabs: List[shared_memory.SharedMemory] = []
+        try:
+            for _ in range(num_slabs):
+                self._slabs.append(shared_memory.SharedMemory(create=True, size=slab_bytes))
+        except Exception:
+            self.close()
+            raise
+        self._free = deque(range(num_slabs))
+        self._available = threading.Condition()
+
+    def acquire(self, timeout: Optional[float] = None) -> int:
+        """Index of a free slab; blocks while all are in use (raises TimeoutError after timeout)."""
+        with self._available:
+            if not self._available.wait_for(lambda: self._free, timeout):
+                raise TimeoutError(f"No free shared-memory slab within {timeout}s")
+            return self._free.popleft()
+
+    def release(self, index: int):
+        with self._available:
+            self._free.append(index)
+            self._available.notify()
+
+    def layout(self, index: int) -> "SlabLayout":
+        return SlabLayout(self._slabs[index])
+
+    @property
+    def num_slabs(self) -> int:
+        return len(self._slabs)
+
+    @property
+    def free_slabs(self) -> int:
+        return len(self._free)
+
+    def close(self):
+        """Unmaps and removes every slab (owner only, once no views remain)."""
+        for slab in self._slabs:
+            # Unlink first: a view still alive makes close() raise BufferError, but the name must go regardless
+            try:
+                slab.unlink()
+            except FileNotFoundError:
+                pass
+            try:
+                slab.close()
+            except BufferError:
+                pass
+        self._slabs = []
+
+
+class SlabLayout:
+    """Bump allocator over one slab: alloc() returns (ArrayRef, writable numpy view)."""
+
+    def __init__(self, slab: shared_memory.SharedMemory):
+        self.slab = slab
+        self.offset = 0
+
+    def alloc(self, shape, dtype=np.float32) -> Tuple[ArrayRef, np.ndarray]:
+        dtype = np.dtype(dtype)
+        shape = tuple(int(d) for d in shape)
+        nbytes = int(np.prod(shape)) * dtype.itemsize
+        offset = -(-self.offset // _ALIGN) * _ALIGN
+        if offset + nbytes > self.slab.size:
+            raise ValueError(f"{nbytes} bytes at offset {offset} do not fit a {self.slab.size}-byte slab")
+        self.offset = offset + nbytes
+        ref = ArrayRef(self.slab.name, offset, shape, dtype.str)
+        return ref, np.ndarray(shape, dtype=dtype, buffer=self.slab.buf, offset=offset)
+
+
+def required_bytes(*arrays: Tuple[Tuple[int, ...], object]) -> int:
+    """Slab bytes needed for (shape, dtype) pairs laid out by SlabLayout."""
+    total = 0
+    for shape, dtype in arrays:
+        total = -(-total // _ALIGN) * _ALIGN + int(np.prod(shape)) * np.dtype(dtype).itemsize
+    return total
+
+
+_attached: Dict[str, shared_memory.SharedMemory] = {}
+_attach_lock = threading.Lock()
+
+
+def _attach(name: str) -> shared_memory.SharedMemory:
+    with _attach_lock:
+        segment = _attached.get(name)
+        if segment is None:
+            try:
+                segment = shared_memory.SharedMemory(name=name, track=False)  # Python 3.13+
+            except TypeError:
+                segment = shared_memory.SharedMemory(name=name)
+                # Before 3.13 attaching registers the segment with this process's resource tracker,
+                # which would unlink the owner's slab when this process exits
+                from multiprocessing import resource_tracker
+                resource_tracker.unregister(segment._name, "shared_memory")
+            _attached[name] = segment
+        return segment
+
+
+def attach_array(ref: ArrayRef) -> np.ndarray:
+    """Numpy view of a referenced array (no copy); the segment stays mapped for the process lifetime."""
+    return np.ndarray(ref.shape, dtype=np.dtype(ref.dtype), buffer=_attach(ref.slab).buf, offset=ref.offset)